@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+常驻评测服务 - 训练过程中持续评测checkpoint
+服务端只初始化一次离线环境并保持引擎常驻，客户端提交任务并实时查看进度
+
+启动服务:
+    python scripts/qwen3-8b-test/eval_server.py serve --port 8765
+    python scripts/qwen3-8b-test/eval_server.py serve --unix-socket /tmp/lightsft_eval.sock
+
+提交任务:
+    python scripts/qwen3-8b-test/eval_server.py submit --model saves/llamafactory/full/sft/checkpoint-1000 --follow
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from evaluate_model import load_config, setup_offline_env
+from src.evaluation.execution import LocalExecutor
+from src.evaluation.server import JOB_DEFAULTS, EvalService, make_server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """通过Unix socket发送HTTP请求"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="常驻HumanEval+评测服务")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="启动评测服务")
+    serve.add_argument("--host", type=str, default="127.0.0.1", help="监听地址（仅本地）")
+    serve.add_argument("--port", type=int, default=8765, help="监听端口")
+    serve.add_argument("--unix-socket", type=str, default=None, help="使用Unix socket代替TCP")
+    serve.add_argument("--results-root", type=str, default=None, help="样本与结果目录")
+    serve.add_argument("--dataset-path", type=str, default=None, help="HumanEvalPlus.jsonl 路径")
+
+    submit = sub.add_parser("submit", help="提交评测任务")
+    submit.add_argument("--host", type=str, default="127.0.0.1")
+    submit.add_argument("--port", type=int, default=8765)
+    submit.add_argument("--unix-socket", type=str, default=None)
+    submit.add_argument("--model", type=str, required=True, help="模型或checkpoint路径")
+    submit.add_argument("--mode", type=str, default=None, choices=["base", "chat"], help="评测模式")
+    submit.add_argument("--backend", type=str, default=None, help="生成后端 vllm/hf/fake")
+    submit.add_argument("--temperature", type=float, default=None)
+    submit.add_argument("--n-samples", type=int, default=None)
+    submit.add_argument("--max-new-tokens", type=int, default=None)
+    submit.add_argument("--no-execute", action="store_true", help="只生成，不执行测试")
+    submit.add_argument("--follow", action="store_true", help="实时输出任务进度直到完成")
+    return parser.parse_args()
+
+
+def serve(args) -> int:
+    setup_offline_env()
+    config = load_config()
+    eval_config = config['evaluation']
+
+    cuda_visible = eval_config.get('cuda_visible_devices')
+    if cuda_visible is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = str(cuda_visible)
+
+    # 使用 eval.yaml 中的配置作为任务默认值
+    defaults = {
+        "backend": eval_config.get('backend', JOB_DEFAULTS['backend']),
+        "tp": eval_config.get('tp') or eval_config.get('tensor_parallel_size') or 1,
+        "data_parallel": eval_config.get('data_parallel', 1),
+        "dtype": eval_config.get('dtype', JOB_DEFAULTS['dtype']),
+        "force_base_prompt": eval_config.get('force_base_prompt', True),
+        "max_new_tokens": eval_config.get('max_new_tokens', JOB_DEFAULTS['max_new_tokens']),
+    }
+    dataset_path = args.dataset_path or project_root / "data" / "HumanEvalPlus.jsonl"
+    results_root = args.results_root or f"{eval_config.get('evalplus_root', 'evalplus_results')}_server"
+    exec_cache = eval_config.get('exec_cache')
+    executor = LocalExecutor(
+        dataset_path,
+        fast_check=eval_config.get('fast_check', True),
+        cache_path=project_root / exec_cache if exec_cache else None,
+        cache_max_bytes=int(eval_config.get('exec_cache_max_gb', 2) * 1024 ** 3),
+        harness_cache_dir=project_root / eval_config.get('harness_cache_dir', 'data/cache'),
+    )
+    service = EvalService(
+        dataset_path=dataset_path,
+        results_root=results_root,
+        dataset=eval_config.get('benchmark', 'humaneval'),
+        defaults=defaults,
+        executor=executor,
+    )
+    server = make_server(service, args.host, args.port, args.unix_socket)
+    address = args.unix_socket or f"http://{args.host}:{args.port}"
+    print(f"🚀 评测服务已启动: {address}")
+    print(f"📁 结果目录: {results_root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 停止评测服务")
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+def _connect(args):
+    if args.unix_socket:
+        return UnixHTTPConnection(args.unix_socket)
+    return http.client.HTTPConnection(args.host, args.port)
+
+
+def submit(args) -> int:
+    request = {"model_path": str(Path(args.model).expanduser().resolve())}
+    optional = {
+        "eval_mode": args.mode,
+        "backend": args.backend,
+        "temperature": args.temperature,
+        "n_samples": args.n_samples,
+        "max_new_tokens": args.max_new_tokens,
+    }
+    request.update({k: v for k, v in optional.items() if v is not None})
+    if args.no_execute:
+        request["execute"] = False
+
+    conn = _connect(args)
+    conn.request("POST", "/jobs", body=json.dumps(request), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    if response.status >= 400:
+        print(f"✗ 提交失败: {payload.get('error')}")
+        return 1
+
+    job_id = payload['job_id']
+    if payload.get('deduplicated'):
+        print(f"♻️ 相同任务已存在，复用任务 {job_id} (状态: {payload['status']})")
+    else:
+        print(f"✓ 任务已提交: {job_id}")
+    if not args.follow:
+        return 0
+
+    conn = _connect(args)
+    conn.request("GET", f"/jobs/{job_id}/events")
+    response = conn.getresponse()
+    status = "unknown"
+    for line in response:
+        event = json.loads(line)
+        name = event.pop('event')
+        event.pop('time', None)
+        print(f"  [{name}] {json.dumps(event, ensure_ascii=False)}")
+        if name in ("done", "failed"):
+            status = name
+    conn.close()
+    return 0 if status == "done" else 1
+
+
+def main():
+    args = parse_args()
+    if args.command == "serve":
+        return serve(args)
+    return submit(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
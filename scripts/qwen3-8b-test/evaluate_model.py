@@ -11,6 +11,16 @@ import json
 import os
 from pathlib import Path
 from datetime import datetime
+from typing import Optional
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.evaluation import get_backend, load_problems, run_codegen
+from src.evaluation.execution import LocalExecutor
+from src.evaluation.replicas import backend_spec
+from src.utils.profiling import StageTimer
 
 
 def load_config():
@@ -40,8 +50,86 @@ def check_dataset():
         return False
 
 
-def run_evaluation(config):
-    """运行评测 - 使用EvalPlus v0.3.1的一体化命令 (HumanEval+)"""
+def find_samples(results_root: str, dataset: str = "humaneval") -> Optional[Path]:
+    """查找evalplus.codegen生成的（已清洗）样本文件"""
+    samples_dir = Path(results_root) / dataset
+    if not samples_dir.exists():
+        return None
+    candidates = [
+        p for p in samples_dir.glob("*.jsonl")
+        if not p.name.endswith(".raw.jsonl")
+    ]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda x: x.stat().st_mtime)
+
+
+def count_generated_output(samples_file: Path, model_path: str):
+    """统计生成的字符数和token数（去掉prompt前缀），tokenizer不可用时token数为None"""
+    prompts = {}
+    dataset_path = project_root / "data" / "HumanEvalPlus.jsonl"
+    if dataset_path.exists():
+        with open(dataset_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                problem = json.loads(line)
+                prompts[problem['task_id']] = problem['prompt']
+
+    outputs = []
+    with open(samples_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            sample = json.loads(line)
+            text = sample.get('solution', sample.get('completion', ''))
+            prompt = prompts.get(sample.get('task_id'), '')
+            if prompt and text.startswith(prompt):
+                text = text[len(prompt):]
+            outputs.append(text)
+
+    n_chars = sum(len(t) for t in outputs)
+    n_tokens = None
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        n_tokens = sum(len(tokenizer.encode(t, add_special_tokens=False)) for t in outputs)
+    except Exception as e:
+        print(f"⚠ 无法加载tokenizer统计token数，仅记录字符数: {e}")
+    return len(outputs), n_chars, n_tokens
+
+
+def generate_inprocess(eval_config, eval_mode: str, results_root: str, timer: StageTimer):
+    """进程内生成：引擎在同一进程的多次评测间保持常驻"""
+    backend_name, backend_kwargs = backend_spec(
+        eval_config['backend'],
+        tp=eval_config.get('tp') or eval_config.get('tensor_parallel_size') or 1,
+        dtype=eval_config.get('dtype', 'bfloat16'),
+        data_parallel=eval_config.get('data_parallel', 1),
+    )
+
+    with timer.stage("model_load"):
+        backend = get_backend(backend_name, eval_config['model_path'], **backend_kwargs)
+
+    with timer.stage("generation") as m:
+        problems = load_problems(project_root / "data" / "HumanEvalPlus.jsonl")
+        stats = run_codegen(
+            problems,
+            backend,
+            root=results_root,
+            dataset=eval_config['benchmark'],
+            eval_mode=eval_mode,
+            force_base_prompt=eval_config.get('force_base_prompt', True),
+            max_new_tokens=eval_config.get('max_new_tokens', 768),
+        )
+        m.add_count("samples", stats.n_samples)
+        m.add_count("chars", stats.output_chars)
+        m.add_count("tokens", stats.output_tokens)
+        m.extra["prompt_tokens"] = stats.prompt_tokens
+        m.extra["samples_file"] = str(stats.samples_file)
+    return stats.samples_file, stats.n_samples
+
+
+def run_evaluation(config, timer: Optional[StageTimer] = None):
+    """运行评测 - 使用EvalPlus v0.3.1 (HumanEval+)，代码生成和测试执行分两步计时"""
+    if timer is None:
+        timer = StageTimer()
     eval_config = config['evaluation']
     
     # 根据模型类型确定结果存储路径
@@ -73,10 +161,12 @@ def run_evaluation(config):
         os.environ['CUDA_VISIBLE_DEVICES'] = str(cuda_visible)
         print(f"设置 CUDA_VISIBLE_DEVICES={cuda_visible} (后端: {backend})")
     
-    # 构建一体化评测命令 - 直接使用evalplus.evaluate进行代码生成+评测
-    # 移除 --base_only 以使用 HumanEval+ 全量测试
-    cmd = [
-        "evalplus.evaluate",
+    generation = eval_config.get('generation', 'inprocess')  # inprocess | cli
+
+    # 代码生成命令 - evalplus.codegen 负责生成并清洗代码
+    # 使用 HumanEval+ 全量测试（不加 --base_only）
+    codegen_cmd = [
+        "evalplus.codegen",
         "--model", eval_config['model_path'],
         "--dataset", eval_config['benchmark'],
         "--backend", backend,
@@ -88,14 +178,17 @@ def run_evaluation(config):
     if backend == 'vllm':
         tp = eval_config.get('tp') or eval_config.get('tensor_parallel_size')
         if tp:
-            cmd.extend(["--tp", str(tp)])
+            codegen_cmd.extend(["--tp", str(tp)])
             print(f"使用 vLLM 后端，张量并行度: {tp}")
         else:
             print("使用 vLLM 后端，单GPU模式")
     elif backend == 'hf':
         print("使用 HuggingFace 后端（较慢，建议使用 vLLM）")
     
-    print(f"运行一体化评测命令: {' '.join(cmd)}")
+    if generation == 'cli':
+        print(f"运行代码生成命令: {' '.join(codegen_cmd)}")
+    else:
+        print(f"使用进程内 {backend} 后端生成，一次性批量提交全部题目")
     if backend == 'vllm' and eval_config.get('tp', 1) > 1:
         print("🚀 使用多GPU vLLM后端，评测速度将大幅提升！")
     elif backend == 'vllm':
@@ -105,8 +198,53 @@ def run_evaluation(config):
     print("注意: 这包括代码生成和评测，可能需要较长时间，请耐心等待...")
     
     try:
-        # 不捕获输出，让用户看到实时进度
-        result = subprocess.run(cmd, check=True)
+        if generation == 'cli':
+            # 不捕获输出，让用户看到实时进度
+            with timer.stage("generation") as m:
+                subprocess.run(codegen_cmd, check=True)
+                samples_file = find_samples(results_root, eval_config['benchmark'])
+                if samples_file is None:
+                    print(f"✗ 未找到生成的样本文件: {results_root}/{eval_config['benchmark']}")
+                    return False
+                n_samples, n_chars, n_tokens = count_generated_output(samples_file, eval_config['model_path'])
+                m.add_count("samples", n_samples)
+                m.add_count("chars", n_chars)
+                if n_tokens is not None:
+                    m.add_count("tokens", n_tokens)
+                m.extra["samples_file"] = str(samples_file)
+        else:
+            samples_file, n_samples = generate_inprocess(eval_config, eval_mode, results_root, timer)
+        print(f"代码生成完成: {samples_file}")
+
+        # 测试执行 - 对已生成的样本运行 base + plus 测试
+        execution = eval_config.get('execution', 'local')  # local | evalplus
+        with timer.stage("execution") as m:
+            if execution == 'evalplus':
+                evaluate_cmd = [
+                    "evalplus.evaluate",
+                    "--dataset", eval_config['benchmark'],
+                    "--samples", str(samples_file),
+                ]
+                print(f"运行测试执行命令: {' '.join(evaluate_cmd)}")
+                subprocess.run(evaluate_cmd, check=True)
+            else:
+                print("使用内置执行器：按参考答案耗时校准时限，首个失败输入即退出")
+                exec_cache = eval_config.get('exec_cache')
+                executor = LocalExecutor(
+                    project_root / "data" / "HumanEvalPlus.jsonl",
+                    fast_check=eval_config.get('fast_check', True),
+                    cache_path=project_root / exec_cache if exec_cache else None,
+                    cache_max_bytes=int(eval_config.get('exec_cache_max_gb', 2) * 1024 ** 3),
+                    harness_cache_dir=project_root / eval_config.get('harness_cache_dir', 'data/cache'),
+                    **({'n_workers': eval_config['n_workers']} if eval_config.get('n_workers') else {}),
+                )
+                results_file = executor(samples_file, eval_config['benchmark'])
+                m.extra["results_file"] = str(results_file)
+                m.extra["sanitize_time"] = executor.last_timings.get("sanitize")
+                m.extra["precheck_failed"] = executor.last_timings.get("precheck_failed")
+                m.extra["cache_hits"] = executor.last_timings.get("cache_hits")
+                m.extra["executed"] = executor.last_timings.get("executed")
+            m.add_count("samples", n_samples)
         print("评测完成!")
         return True
     except subprocess.CalledProcessError as e:
@@ -264,9 +402,26 @@ def generate_report(results_file, output_dir, eval_mode="unknown"):
             f.write(f"数据大小: {len(str(results))} 字符\n")
         
         print(f"📄 报告已生成: {report_path}")
+        return report_path
         
     except Exception as e:
         print(f"生成报告失败: {e}")
+        return None
+
+
+def write_metrics(timer: StageTimer, report_path, output_dir, eval_mode="unknown"):
+    """将阶段耗时写入报告末尾，并保存JSON sidecar，便于对比不同后端（hf/vllm）的性能回归"""
+    if report_path is not None:
+        metrics_path = Path(report_path).with_suffix(".metrics.json")
+        with open(report_path, 'a', encoding='utf-8') as f:
+            f.write("\n## ⏱️ 阶段耗时与吞吐量\n\n")
+            f.write(timer.to_markdown())
+    else:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        metrics_path = Path(output_dir) / f"evaluation_metrics_{eval_mode}_{timestamp}.json"
+    timer.write_json(metrics_path)
+    timer.print_summary()
+    print(f"⏱️ 阶段耗时已保存: {metrics_path}")
 
 
 def setup_offline_env():
@@ -300,17 +455,26 @@ def main():
     """主函数"""
     print("=== HumanEval模型评测 (离线模式) ===")
     print("使用EvalPlus v0.3.1进行评测")
+    timer = StageTimer()
     
     # 设置离线环境
-    setup_offline_env()
+    with timer.stage("setup"):
+        setup_offline_env()
     
     # 加载配置
     try:
-        config = load_config()
+        with timer.stage("config_load"):
+            config = load_config()
         print("✓ 配置加载成功")
     except Exception as e:
         print(f"✗ 配置加载失败: {e}")
         return 1
+    timer.metadata.update({
+        "model_path": config['evaluation'].get('model_path'),
+        "backend": config['evaluation'].get('backend'),
+        "tp": config['evaluation'].get('tp') or config['evaluation'].get('tensor_parallel_size'),
+        "benchmark": config['evaluation'].get('benchmark'),
+    })
     
     # 检查模型路径
     model_path = config['evaluation']['model_path']
@@ -345,36 +509,46 @@ def main():
     
     print(f"📊 当前评测模式: {eval_mode} ({'微调模型' if eval_mode == 'chat' else '基础模型'})")
     print(f"📁 结果存储路径: {results_root}")
+    timer.metadata["eval_mode"] = eval_mode
     
     # 检查是否已有生成的结果文件
     results_file = find_results(results_root)
     if results_file:
         print(f"✓ 找到已有的{eval_mode}模型结果文件: {results_file}")
         print("使用已有结果文件生成报告...")
-        generate_report(results_file, output_dir, eval_mode)
+        timer.metadata["reused_results"] = True
+        with timer.stage("report"):
+            report_path = generate_report(results_file, output_dir, eval_mode)
+        write_metrics(timer, report_path, output_dir, eval_mode)
         return 0
     
     # 检查数据集 (HumanEval+)
     print("\n=== 检查数据集 ===")
-    if not check_dataset():
+    with timer.stage("dataset_check"):
+        dataset_ok = check_dataset()
+    if not dataset_ok:
         print("数据集不存在，无法继续评测")
         return 1
     
-    # 运行一体化评测（代码生成+评测）
-    print("\n=== 开始一体化评测 ===")
-    if not run_evaluation(config):
+    # 运行评测（代码生成 + 测试执行）
+    print("\n=== 开始评测 ===")
+    if not run_evaluation(config, timer):
         print("✗ 评测失败!")
+        write_metrics(timer, None, output_dir, eval_mode)
         return 1
     
     print("✓ 评测成功完成!")
     
     # 查找并处理结果
     results_file = find_results(results_root)
+    report_path = None
     if results_file:
         print(f"✓ 找到{eval_mode}模型结果文件: {results_file}")
-        generate_report(results_file, output_dir, eval_mode)
+        with timer.stage("report"):
+            report_path = generate_report(results_file, output_dir, eval_mode)
     else:
         print(f"⚠ 未找到{eval_mode}模型结果文件")
+    write_metrics(timer, report_path, output_dir, eval_mode)
     
     return 0
 
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Checkpoint 管理 - 合并 ZeRO-3 分片、删除旧的优化器状态、按指标保留最好的 checkpoint
+
+后台运行:
+    nohup python scripts/qwen3-8b-test/manage_checkpoints.py watch saves/llamafactory/full/sft \\
+        --keep-latest-full 1 --metric pass@1_plus --keep-best 3 > logs/ckpt_manager.log 2>&1 &
+执行一轮（预览）:
+    python scripts/qwen3-8b-test/manage_checkpoints.py once saves/llamafactory/full/sft --dry-run
+登记评测指标:
+    python scripts/qwen3-8b-test/manage_checkpoints.py register saves/llamafactory/full/sft checkpoint-1000 pass@1_plus 0.61
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.checkpoints import CheckpointManager, RetentionPolicy, register_metric
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练 checkpoint 保留与整理")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, help_text in (("watch", "持续监视输出目录"), ("once", "执行一轮整理后退出")):
+        cmd = sub.add_parser(name, help=help_text)
+        cmd.add_argument("output_dir", type=str, help="训练输出目录（包含 checkpoint-*）")
+        cmd.add_argument("--keep-latest-full", type=int, default=1, help="保留优化器状态的最新 checkpoint 数")
+        cmd.add_argument("--keep-best", type=int, default=3, help="按指标保留的 checkpoint 数")
+        cmd.add_argument("--metric", type=str, default=None, help="用于挑选最好 checkpoint 的指标名")
+        cmd.add_argument("--lower-is-better", action="store_true", help="指标越小越好（如 eval_loss）")
+        cmd.add_argument("--prune", action="store_true", help="删除已评测且不在最好 N 个之内的 checkpoint")
+        cmd.add_argument("--settle-seconds", type=float, default=120.0, help="checkpoint 无写入多久后才处理")
+        cmd.add_argument("--dry-run", action="store_true", help="只打印将要执行的动作")
+        if name == "watch":
+            cmd.add_argument("--interval", type=float, default=60.0, help="检查间隔（秒）")
+
+    register = sub.add_parser("register", help="登记 checkpoint 的评测指标")
+    register.add_argument("output_dir", type=str)
+    register.add_argument("checkpoint", type=str, help="checkpoint 目录名，如 checkpoint-1000")
+    register.add_argument("metric", type=str)
+    register.add_argument("value", type=float)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.command == "register":
+        register_metric(args.output_dir, args.checkpoint, args.metric, args.value)
+        print(f"✓ 已登记 {args.checkpoint}: {args.metric}={args.value}")
+        return 0
+
+    policy = RetentionPolicy(
+        keep_latest_full=args.keep_latest_full,
+        keep_best=args.keep_best,
+        metric=args.metric,
+        higher_is_better=not args.lower_is_better,
+        prune=args.prune,
+        settle_seconds=args.settle_seconds,
+    )
+    manager = CheckpointManager(args.output_dir, policy, dry_run=args.dry_run)
+    print(f"📁 监视目录: {args.output_dir}")
+    try:
+        if args.command == "watch":
+            manager.watch(args.interval)
+        else:
+            report = manager.step(wait=True)
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+    except KeyboardInterrupt:
+        print("\n🛑 停止 checkpoint 管理")
+    finally:
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
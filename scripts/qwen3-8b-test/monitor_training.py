@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+训练实时监控 - 跟踪 nohup 训练的吞吐、ETA 与 step 耗时
+增量读取 trainer_log.jsonl 与标准输出日志，刷新终端面板，并在本地提供 Prometheus 指标
+
+用法:
+    python scripts/qwen3-8b-test/monitor_training.py --output-dir saves/llamafactory/full/sft \\
+        --log "logs/qwen_sft_train_*.log" --tokens-per-step 380000 --model-params-b 8.2
+    curl http://127.0.0.1:9465/metrics
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.monitor import LogTail, TrainingMonitor, follow, format_dashboard, poll, serve_metrics
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="训练吞吐实时监控")
+    parser.add_argument("--output-dir", type=str, default="saves/llamafactory/full/sft",
+                        help="LLaMA-Factory output_dir（读取其中的 trainer_log.jsonl）")
+    parser.add_argument("--log", type=str, default=str(project_root / "nohup_train.out"),
+                        help="标准输出日志路径，支持 glob（跟随最新的文件）")
+    parser.add_argument("--tokens-per-step", type=float, default=None,
+                        help="每个优化步的 token 数（可由 train_llamafactory_qwen3.py --plan 得到）")
+    parser.add_argument("--model-params-b", type=float, default=None, help="模型参数量（十亿），用于估计 MFU")
+    parser.add_argument("--n-gpus", type=int, default=8)
+    parser.add_argument("--gpu-tflops", type=float, default=312.0, help="单卡 bf16 峰值 TFLOPS")
+    parser.add_argument("--interval", type=float, default=5.0, help="刷新间隔（秒）")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9465, help="Prometheus 指标端口，0 表示不启动")
+    parser.add_argument("--once", action="store_true", help="读取一次并输出 JSON 快照后退出")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    monitor = TrainingMonitor(
+        tokens_per_step=args.tokens_per_step,
+        model_params=args.model_params_b * 1e9 if args.model_params_b else None,
+        n_gpus=args.n_gpus,
+        gpu_tflops=args.gpu_tflops,
+    )
+    trainer_log = LogTail(Path(args.output_dir) / "trainer_log.jsonl")
+    stdout_log = LogTail(args.log) if args.log else None
+
+    if args.once:
+        poll(monitor, trainer_log, stdout_log)
+        print(json.dumps(monitor.snapshot(), ensure_ascii=False, indent=2, default=str))
+        return 0
+
+    if args.port:
+        serve_metrics(monitor, args.host, args.port)
+        print(f"📡 Prometheus 指标: http://{args.host}:{args.port}/metrics")
+    try:
+        follow(monitor, trainer_log, stdout_log, interval=args.interval)
+    except KeyboardInterrupt:
+        print("\n" + format_dashboard(monitor.snapshot()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import argparse
+import json
 import os
 import shlex
 import shutil
@@ -6,6 +7,26 @@ import subprocess
 import sys
 from pathlib import Path
 
+import yaml
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.training.planner import (
+    count_records,
+    format_plan_markdown,
+    load_model_spec,
+    plan_training,
+    sample_lengths,
+    tokenized_lengths,
+)
+from src.training.tokenized_cache import (
+    FileHashMemo,
+    finalize_tokenized_cache,
+    find_tokenized_cache,
+    tokenized_cache_key,
+)
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
@@ -29,6 +50,33 @@ def parse_args() -> argparse.Namespace:
         default="",
         help="Extra CLI args appended to llamafactory-cli train (e.g. '--num_train_epochs 3.0')",
     )
+    parser.add_argument(
+        "--tokenized-cache-dir",
+        type=str,
+        default=str(project_root / "data" / "tokenized_cache"),
+        help="Directory holding pre-tokenized datasets keyed by data/tokenizer/template/cutoff_len",
+    )
+    parser.add_argument(
+        "--no-tokenized-cache",
+        action="store_true",
+        help="Tokenize inside the training job as before (ignores the pre-tokenized cache)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="CPU-only: estimate memory, padding waste, steps and wall time, recommend batch settings, then exit",
+    )
+    parser.add_argument("--plan-samples", type=int, default=2000, help="Records sampled for the length distribution")
+    parser.add_argument("--gpu-memory-gb", type=float, default=80.0, help="Per-GPU memory used by --plan")
+    parser.add_argument("--gpu-tflops", type=float, default=312.0, help="Per-GPU peak bf16 TFLOPS used by --plan")
+    parser.add_argument("--mfu", type=float, default=0.35, help="Saturated model FLOPs utilization used by --plan (scaled down for small micro steps)")
+    parser.add_argument(
+        "--model-params-b",
+        type=float,
+        default=None,
+        help="Model size in billions when model_name_or_path/config.json is not readable",
+    )
+    parser.add_argument("--plan-output", type=str, default=None, help="Optional JSON path for the plan")
     return parser.parse_args()
 
 
@@ -41,6 +89,131 @@ def ensure_uv() -> None:
         sys.exit(127)
 
 
+def write_config(config: dict, path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
+    return path
+
+
+def parse_extra_overrides(extra: str) -> dict:
+    """
+    Parse --extra into config overrides, accepting both '--key value' and 'key=value' forms.
+
+    Values are parsed as YAML scalars so they compare equal to the same setting written in the config.
+    """
+    overrides = {}
+    tokens = shlex.split(extra)
+    i = 0
+    while i < len(tokens):
+        name = tokens[i].lstrip("-")
+        if "=" in name:
+            key, value = name.split("=", 1)
+        elif i + 1 < len(tokens) and not tokens[i + 1].startswith("--"):
+            key, value = name, tokens[i + 1]
+            i += 1
+        else:
+            key, value = name, "true"
+        overrides[key] = yaml.safe_load(value)
+        i += 1
+    return overrides
+
+
+def load_config(config_path: Path, args: argparse.Namespace) -> dict:
+    """The YAML config with --extra overrides applied, i.e. what the training job actually sees."""
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    return dict(config, **parse_extra_overrides(args.extra))
+
+
+def prepare_tokenized_cache(config_path: Path, args: argparse.Namespace) -> Path:
+    """
+    Return a config that points LLaMA-Factory at a pre-tokenized Arrow dataset.
+
+    The cache key covers the dataset files, the tokenizer files and the preprocessing
+    options (template, cutoff_len, ...). On a miss, a single CPU-side process runs
+    LLaMA-Factory with `tokenized_path` set; it saves the tokenized dataset and exits
+    before loading the model, so the GPUs are only claimed once tokenization is done.
+    --extra overrides are folded into the config before keying, since LLaMA-Factory ignores
+    data arguments once `tokenized_path` is set.
+    """
+    config = load_config(config_path, args)
+    if config.get("tokenized_path") or config.get("streaming"):
+        return config_path
+
+    cache_root = Path(args.tokenized_cache_dir).expanduser().resolve()
+    memo = FileHashMemo(cache_root / "file_hashes.json")
+    # LLaMA-Factory resolves dataset_dir relative to the working directory
+    key_info = tokenized_cache_key(config, memo, base_dir=Path.cwd())
+    memo.save()
+    key = key_info["key"]
+
+    cached = find_tokenized_cache(cache_root, key)
+    if cached is not None:
+        print(f"Using pre-tokenized dataset: {cached}")
+    else:
+        tmp_dir = cache_root / f"{key}.tmp{os.getpid()}"
+        pretokenize = dict(config, tokenized_path=str(tmp_dir), overwrite_cache=True, report_to="none")
+        # Tokenization does not need DeepSpeed or multiple ranks
+        pretokenize.pop("deepspeed", None)
+        pretokenize_config = write_config(pretokenize, cache_root / f"{key}.pretokenize.yaml")
+        env = dict(os.environ, FORCE_TORCHRUN="0", CUDA_VISIBLE_DEVICES=args.devices.split(",")[0])
+        cmd = ["uv", "run", "llamafactory-cli", "train", str(pretokenize_config)]
+        print(f"Tokenized cache miss ({key}), pre-tokenizing: {' '.join(shlex.quote(x) for x in cmd)}")
+        subprocess.run(cmd, check=True, env=env)
+        cached = finalize_tokenized_cache(tmp_dir, cache_root, key_info)
+        print(f"Pre-tokenized dataset saved: {cached}")
+
+    train_config = dict(config, tokenized_path=str(cached))
+    return write_config(train_config, cache_root / f"{key}.{config_path.stem}.yaml")
+
+
+def run_plan(config_path: Path, args: argparse.Namespace) -> int:
+    """Estimate the training run on CPU before claiming any GPU."""
+    config = load_config(config_path, args)
+    world_size = len([d for d in args.devices.split(",") if d.strip()])
+    spec = load_model_spec(config, args.model_params_b)
+
+    lengths = None
+    memo = FileHashMemo(Path(args.tokenized_cache_dir).expanduser() / "file_hashes.json")
+    try:
+        cached = find_tokenized_cache(args.tokenized_cache_dir, tokenized_cache_key(config, memo)["key"])
+        if cached is not None:
+            lengths = tokenized_lengths(cached)
+            print(f"Token lengths read from pre-tokenized cache: {cached}")
+    except (ImportError, OSError, KeyError, ValueError) as e:
+        print(f"Pre-tokenized cache not usable for planning ({e}), sampling raw data instead")
+    if lengths is None:
+        tokenizer = None
+        try:
+            from transformers import AutoTokenizer
+
+            tokenizer = AutoTokenizer.from_pretrained(config["model_name_or_path"], trust_remote_code=True)
+        except Exception as e:
+            print(f"Tokenizer unavailable ({type(e).__name__}), estimating tokens from character counts")
+        lengths = sample_lengths(
+            config, max_records=args.plan_samples, seed=int(config.get("seed", 42)), tokenizer=tokenizer
+        )
+
+    plan = plan_training(
+        config,
+        lengths,
+        spec,
+        world_size=world_size,
+        n_samples=count_records(config),
+        gpu_memory_gb=args.gpu_memory_gb,
+        gpu_tflops=args.gpu_tflops,
+        mfu=args.mfu,
+    )
+    print(format_plan_markdown(plan))
+    if args.plan_output:
+        Path(args.plan_output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.plan_output, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False, indent=2)
+        print(f"Plan saved to {args.plan_output}")
+    return 0
+
+
 def main() -> int:
     args = parse_args()
 
@@ -49,8 +222,18 @@ def main() -> int:
         print(f"Config not found: {config_path}", file=sys.stderr)
         return 2
 
+    if args.plan:
+        return run_plan(config_path, args)
+
     ensure_uv()
 
+    if not args.no_tokenized_cache:
+        try:
+            config_path = prepare_tokenized_cache(config_path, args)
+        except subprocess.CalledProcessError as e:
+            print(f"Pre-tokenization failed with exit code {e.returncode}", file=sys.stderr)
+            return e.returncode
+
     # Environment setup
     os.environ.setdefault("FORCE_TORCHRUN", "1")
     os.environ["CUDA_VISIBLE_DEVICES"] = args.devices
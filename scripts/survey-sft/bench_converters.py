@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+数据集转换基准测试（离线）
+按 DATASET_CONVERSION_SPEC.md 的原始结构生成合成数据源（src/data/fixtures.py），逐个运行 convert_all_datasets.py
+中的转换，统计每个转换的吞吐（条/s、MB/s）与峰值内存，并校验输出与 golden 运行是否一致；
+每次运行追加到历史记录，与上一次同规模运行对比吞吐变化
+
+用法:
+    uv run scripts/survey-sft/bench_converters.py --rows 1000 100000
+    uv run scripts/survey-sft/bench_converters.py --rows 1000000 --datasets apps tiny-codes --repeat 3
+    uv run scripts/survey-sft/bench_converters.py --rows 10000 --update-golden   # 转换逻辑有意改动后更新 golden
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+# 基准测试不需要逐文件进度条
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import convert_all_datasets as converter  # noqa: E402
+from src.data.columnar_cache import RAW_SOURCE_SPECS, ensure_columnar_cache  # noqa: E402
+from src.data.external_shuffle import input_files, iter_json_lines  # noqa: E402
+from src.data.fixtures import FIXTURE_SPECS, fixture_root, generate_fixtures  # noqa: E402
+from src.data.sharded_writer import OUTPUT_FORMATS, output_path  # noqa: E402
+from src.utils.profiling import StageTimer, peak_rss_since_reset_mb, reset_peak_rss  # noqa: E402
+
+DEFAULT_BENCH_DIR = project_root / "data" / "cache" / "bench"
+
+
+def output_digest(path: Path) -> str:
+    """输出内容的 sha256：逐条按排序键重新序列化，与输出格式（jsonl / parquet / jsonl.zst）无关"""
+    digest = hashlib.sha256()
+    for file_path in input_files(path):
+        for line in iter_json_lines(file_path):
+            digest.update(json.dumps(json.loads(line), ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def git_revision() -> Dict[str, Any]:
+    """当前提交与工作区是否有未提交改动，不在 git 仓库中时返回空字典"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=project_root,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def warm_columnar_cache(dataset_name: str, dataset_dir: Path, files: List[Path], cache_root: Path) -> None:
+    """预先构建 JSONL 数据源的列式缓存，计时只反映稳定状态下的转换开销"""
+    if dataset_name in RAW_SOURCE_SPECS:
+        for file_path in files:
+            ensure_columnar_cache(dataset_name, file_path, dataset_dir, cache_root)
+
+
+def run_converter(timer: StageTimer, dataset_name: str, data_root: Path, output_root: Path, args) -> Dict[str, Any]:
+    """运行一个数据集的转换 --repeat 次，取最快的一次计时；每次输出都做摘要，不一致说明转换不确定"""
+    config = converter.DATASETS_CONFIG[dataset_name]
+    dataset_dir = data_root / dataset_name
+    files = sorted(dataset_dir.glob(config["pattern"]))
+    input_bytes = sum(f.stat().st_size for f in files)
+    if converter.COLUMNAR_CACHE["enabled"]:
+        warm_columnar_cache(dataset_name, dataset_dir, files, Path(converter.COLUMNAR_CACHE["root"]))
+
+    best = None
+    digests = set()
+    for attempt in range(args.repeat):
+        skipped: Counter = Counter()
+        out = output_path(output_root, dataset_name, args.output_format)
+        stage_name = f"{dataset_name}#{attempt}"
+        with timer.stage(stage_name) as metrics:
+            rss_reset = reset_peak_rss()
+            # 转换函数的逐文件提示不计入输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                writer = converter.convert_dataset(dataset_name, config, files, out, None, args.output_format,
+                                                   args.shard_size_mb, skipped)
+            metrics.add_count("records", writer.rows)
+            metrics.add_count("input_bytes", input_bytes)
+            peak = peak_rss_since_reset_mb() if rss_reset else None
+            metrics.extra["dataset_peak_rss_mb"] = round(peak if peak is not None else metrics.peak_rss_mb, 1)
+        digests.add(output_digest(out))
+        if best is None or metrics.wall_time < best[0].wall_time:
+            best = (metrics, writer, skipped)
+        if out.is_dir():
+            shutil.rmtree(out)
+        else:
+            out.unlink()
+
+    metrics, writer, skipped = best
+    throughput = metrics.throughput()
+    return {
+        "input_files": len(files),
+        "input_bytes": input_bytes,
+        "records": writer.rows,
+        "skipped": dict(sorted(skipped.items())),
+        "digest": digests.pop() if len(digests) == 1 else None,
+        "wall_time": round(metrics.wall_time, 4),
+        "cpu_time": round(metrics.cpu_time, 4),
+        "records_per_sec": round(throughput.get("records_per_sec", 0.0), 1),
+        "mb_per_sec": round(throughput.get("input_bytes_per_sec", 0.0) / 1024 ** 2, 2),
+        "peak_rss_mb": metrics.extra["dataset_peak_rss_mb"],
+    }
+
+
+def compare_golden(result: Dict[str, Any], golden: Optional[Dict[str, Any]]) -> str:
+    """与 golden 运行比较：记录数、跳过原因与内容摘要都一致才算一致"""
+    if result["digest"] is None:
+        return "nondeterministic"
+    if golden is None:
+        return "new"
+    same = (golden["records"], golden["skipped"], golden["digest"]) == (result["records"], result["skipped"], result["digest"])
+    return "match" if same else "diff"
+
+
+def previous_run(history_path: Path, key: str) -> Optional[Dict[str, Any]]:
+    """历史记录中同一规模/配置的最近一次运行"""
+    if not history_path.exists():
+        return None
+    last = None
+    with open(history_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("key") == key:
+                last = entry
+    return last
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="数据集转换基准测试（合成数据，离线）")
+    parser.add_argument("--rows", nargs="+", type=int, default=[10_000], help="每个数据集的合成行数（可给多个规模）")
+    parser.add_argument("--datasets", nargs="+", default=list(FIXTURE_SPECS), choices=list(FIXTURE_SPECS))
+    parser.add_argument("--seed", type=int, default=0, help="合成数据的随机种子")
+    parser.add_argument("--repeat", type=int, default=1, help="每个转换的重复次数，取最快的一次")
+    parser.add_argument("--output-format", type=str, default="jsonl", choices=list(OUTPUT_FORMATS))
+    parser.add_argument("--shard-size-mb", type=float, default=256)
+    parser.add_argument("--no-columnar-cache", action="store_true", help="JSONL 数据源直接逐行解析")
+    parser.add_argument("--bench-dir", type=str, default=str(DEFAULT_BENCH_DIR),
+                        help="合成数据、golden 与历史记录所在目录")
+    parser.add_argument("--scratch-dir", type=str, default=None, help="转换输出的临时目录（默认系统临时目录）")
+    parser.add_argument("--update-golden", action="store_true", help="用本次运行结果覆盖 golden")
+    parser.add_argument("--regenerate", action="store_true", help="重新生成合成数据")
+    parser.add_argument("--no-history", action="store_true", help="不追加历史记录")
+    args = parser.parse_args()
+
+    bench_dir = Path(args.bench_dir)
+    golden_path = bench_dir / "converters_golden.json"
+    history_path = bench_dir / "converters_history.jsonl"
+    golden_all = json.loads(golden_path.read_text(encoding="utf-8")) if golden_path.exists() else {}
+    revision = git_revision()
+
+    print("=" * 80)
+    print("🏁 数据集转换基准测试")
+    print("=" * 80)
+    if revision:
+        print(f"📌 提交: {revision['commit']}" + (" (工作区有改动)" if revision["dirty"] else ""))
+
+    failed = False
+    for rows in args.rows:
+        data_root = fixture_root(bench_dir / "fixtures", rows, args.seed)
+        print(f"\n📦 合成数据: {rows:,} 行/数据集 -> {data_root}")
+        manifest = generate_fixtures(data_root, rows, args.datasets, seed=args.seed, force=args.regenerate)
+        converter.COLUMNAR_CACHE.update(enabled=not args.no_columnar_cache, root=str(data_root / ".columnar"),
+                                        data_root=data_root)
+
+        key = f"rows{rows}-seed{args.seed}-{args.output_format}" + ("-raw" if args.no_columnar_cache else "")
+        golden = golden_all.get(f"rows{rows}-seed{args.seed}", {})
+        previous = previous_run(history_path, key)
+        timer = StageTimer(rows=rows, seed=args.seed, output_format=args.output_format,
+                           columnar_cache=not args.no_columnar_cache, **revision)
+        results: Dict[str, Dict[str, Any]] = {}
+
+        print(f"\n{'数据集':<40} {'输出条数':>9} {'条/s':>10} {'MB/s':>7} {'峰值MB':>7} {'对比上次':>8}  golden")
+        print("-" * 100)
+        with tempfile.TemporaryDirectory(dir=args.scratch_dir, prefix="bench-converters-") as scratch:
+            for name in args.datasets:
+                try:
+                    result = run_converter(timer, name, data_root, Path(scratch), args)
+                except Exception as e:
+                    print(f"{name:<40} ❌ {type(e).__name__}: {e}")
+                    results[name] = {"error": f"{type(e).__name__}: {e}"}
+                    failed = True
+                    continue
+                result["golden"] = compare_golden(result, golden.get(name))
+                failed |= result["golden"] == "nondeterministic" or (result["golden"] == "diff" and not args.update_golden)
+                results[name] = result
+
+                before = ((previous or {}).get("results") or {}).get(name) or {}
+                delta = ""
+                if before.get("records_per_sec"):
+                    delta = f"{result['records_per_sec'] / before['records_per_sec'] - 1:+.1%}"
+                mark = {"match": "✅", "new": "🆕", "diff": "❌", "nondeterministic": "⚠️ "}[result["golden"]]
+                print(f"{name:<40} {result['records']:>9,} {result['records_per_sec']:>10,.0f} "
+                      f"{result['mb_per_sec']:>7.1f} {result['peak_rss_mb']:>7.0f} {delta:>8}  {mark} {result['golden']}")
+                if result["golden"] == "diff":
+                    expected = golden[name]
+                    print(f"    golden: {expected['records']:,} 条, 跳过 {expected['skipped']}")
+                    print(f"    本次:   {result['records']:,} 条, 跳过 {result['skipped']}")
+
+        dirty_rows = sum(info["dirty"] for info in manifest["datasets"].values() if info)
+        print(f"\n🧪 合成数据中的脏行: {dirty_rows:,}（用于覆盖跳过逻辑）")
+
+        if args.update_golden:
+            golden_all[f"rows{rows}-seed{args.seed}"] = {
+                name: {k: r[k] for k in ("records", "skipped", "digest")}
+                for name, r in results.items() if r.get("digest") is not None
+            }
+            golden_path.parent.mkdir(parents=True, exist_ok=True)
+            golden_path.write_text(json.dumps(golden_all, ensure_ascii=False, indent=2), encoding="utf-8")
+            print(f"📄 golden 已更新: {golden_path}")
+        if not args.no_history:
+            entry = {"key": key, **timer.to_dict(), "results": results}
+            entry.pop("stages")
+            history_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            print(f"📄 历史记录: {history_path}")
+
+    if failed:
+        print("\n❌ 存在与 golden 不一致、结果不确定或运行失败的转换")
+        return 1
+    print("\n✅ 全部转换与 golden 一致（或首次记录）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
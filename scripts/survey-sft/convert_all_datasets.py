@@ -6,647 +6,738 @@
 
 import json
 import argparse
+import cProfile
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Dict, List, Any, Optional
-import pandas as pd
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
+import pyarrow.parquet as pq
 from tqdm import tqdm
-import glob
 
-
-def convert_apps(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 APPS 数据集 - JSONL格式，包含question和solutions"""
-    print(f"  转换 APPS 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for i, line in enumerate(tqdm(f, desc=f"  处理 {file_path.name}")):
-                if max_samples and len(converted) >= max_samples:
-                    break
-                try:
-                    data = json.loads(line)
-                    question = data.get("question", "")
-                    solutions = json.loads(data.get("solutions", "[]"))
-                    
-                    if question and solutions and len(solutions) > 0:
-                        converted.append({
-                            "messages": [
-                                {"role": "user", "content": f"Solve this programming problem:\n\n{question}"},
-                                {"role": "assistant", "content": f"```python\n{solutions[0]}\n```"}
-                            ]
-                        })
-                except Exception as e:
-                    continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_tiny_codes(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 tiny-codes 数据集 - Parquet格式"""
-    print(f"  转换 tiny-codes 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from src.data.columnar_cache import RAW_SOURCE_SPECS, ensure_columnar_cache, iter_cached_records, read_cache_build_stats
+from src.data.external_shuffle import iter_json_lines, iter_line_range
+from src.data.profiler import plan_units
+from src.data.sharded_writer import OUTPUT_FORMATS, dataset_info_entry, open_output, output_path, registrable
+from src.data.schema_probe import detect_pattern, find_data_files, match_columns, probe_columns
+from src.data.work_queue import SharedWorkQueue
+from src.evaluation.program_tests import VERIFIABLE_DATASETS, SolutionVerifier
+from src.utils.profiling import StageTimer, peak_rss_since_reset_mb, reset_peak_rss
+
+# JSONL 数据源的列式缓存设置，由 main() 根据命令行参数填写
+COLUMNAR_CACHE: Dict[str, Any] = {"enabled": False, "root": None, "data_root": None}
+
+# 竞赛题解的执行验证（--verify-solutions），由 main() 创建 SolutionVerifier
+SOLUTION_VERIFIER: Dict[str, Any] = {"verifier": None}
+
+# 多节点模式下的合并任务，所有转换任务完成后由一个 worker 领取
+MERGE_TASK_ID = "_merge"
+
+# 行转换函数：输入一条原始记录，返回 {"messages": [...]}，不可用时返回 None
+RowConverter = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+# 行被跳过的原因，计入转换汇总（转换函数抛出的异常记为 converter_error:<异常类型>）
+SKIP_PARSE_ERROR = "parse_error"
+SKIP_EMPTY_FIELD = "empty_field"
+SKIP_TOO_FEW_MESSAGES = "too_few_messages"
+SKIP_UNVERIFIED = "unverified"
+
+
+def iter_source_records(dataset_name: str, file_path: Path, skipped: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    """
+    逐条读取 JSONL 数据源：启用列式缓存时读取（必要时先构建）parquet 缓存，否则逐行解析。
+    两种方式产出的记录相同，嵌套的 JSON 字段都已解码；无法解析的行计入 skipped（缓存记录了构建时的坏行数）
+    """
+    spec = RAW_SOURCE_SPECS[dataset_name]
+    if COLUMNAR_CACHE["enabled"]:
+        dataset_dir = Path(COLUMNAR_CACHE["data_root"]) / dataset_name
+        cache_path = ensure_columnar_cache(dataset_name, file_path, dataset_dir, COLUMNAR_CACHE["root"])
+        if skipped is not None:
+            skipped[SKIP_PARSE_ERROR] += read_cache_build_stats(cache_path).get("skipped", 0)
+        yield from iter_cached_records(cache_path)
+        return
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
             try:
-                prompt = row.get('prompt', row.get('instruction', ''))
-                response = row.get('response', row.get('output', row.get('code', '')))
-                if prompt and response:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": prompt},
-                            {"role": "assistant", "content": response}
-                        ]
-                    })
-            except:
+                yield spec.decode(json.loads(line))
+            except (ValueError, AttributeError, TypeError):
+                if skipped is not None:
+                    skipped[SKIP_PARSE_ERROR] += 1
                 continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
 
 
-def convert_commitpackft(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 commitpackft 数据集 - JSONL格式在多个语言目录下"""
-    print(f"  转换 commitpackft 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                if max_samples and len(converted) >= max_samples:
-                    break
-                try:
-                    data = json.loads(line)
-                    commit_msg = data.get("subject", data.get("message", ""))
-                    new_code = data.get("new_contents", "")
-                    old_code = data.get("old_contents", "")
-                    
-                    if commit_msg and new_code:
-                        if old_code:
-                            prompt = f"Refactor the code based on: {commit_msg}\n\nOld code:\n```\n{old_code}\n```"
-                        else:
-                            prompt = f"Implement: {commit_msg}"
-                        
-                        converted.append({
-                            "messages": [
-                                {"role": "user", "content": prompt},
-                                {"role": "assistant", "content": f"```\n{new_code}\n```"}
-                            ]
-                        })
-                except:
-                    continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_stackexchange_codereview(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 stackexchange_codereview - Parquet格式，有conversations字段（numpy.ndarray类型）"""
-    print(f"  转换 stackexchange_codereview 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                # conversations字段是numpy.ndarray类型
-                if 'conversations' in row:
-                    conversations = row['conversations']
-                    # numpy.ndarray转list
-                    if hasattr(conversations, 'tolist'):
-                        conversations = conversations.tolist()
-                    
-                    if conversations and len(conversations) > 0:
-                        messages = []
-                        for msg in conversations:
-                            role = "user" if msg.get('from') == 'human' else "assistant"
-                            messages.append({"role": role, "content": msg.get('value', '')})
-                        if messages and len(messages) >= 2:
-                            converted.append({"messages": messages})
-                # 备用：使用instruction和completion
-                elif 'instruction' in row and 'completion' in row and row['instruction'] and row['completion']:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": str(row['instruction'])},
-                            {"role": "assistant", "content": str(row['completion'])}
-                        ]
-                    })
-            except Exception as e:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_code_contests(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 code_contests - Parquet格式，solutions是dict类型"""
-    print(f"  转换 code_contests 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                description = row.get('description', '')
-                solutions = row.get('solutions')
-                
-                if description and solutions:
-                    # solutions是dict格式，包含language和solution数组
-                    if isinstance(solutions, dict):
-                        solution_arr = solutions.get('solution', [])
-                        # 转换为list（可能是numpy.ndarray）
-                        if hasattr(solution_arr, 'tolist'):
-                            solution_arr = solution_arr.tolist()
-                        if solution_arr and len(solution_arr) > 0:
-                            solution = solution_arr[0]
-                            if solution:
-                                converted.append({
-                                    "messages": [
-                                        {"role": "user", "content": f"Solve this competitive programming problem:\n\n{description}"},
-                                        {"role": "assistant", "content": solution}
-                                    ]
-                                })
-            except Exception as e:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_reflection_seq_gpt(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 ReflectionSeq-GPT - JSONL格式，包含messages字段"""
-    print(f"  转换 ReflectionSeq-GPT 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in tqdm(f, desc=f"  处理 {file_path.name}"):
-                if max_samples and len(converted) >= max_samples:
-                    break
-                try:
-                    data = json.loads(line)
-                    if 'messages' in data:
-                        messages_raw = data['messages']
-                        if isinstance(messages_raw, str):
-                            messages_raw = json.loads(messages_raw)
-                        
-                        messages = []
-                        for msg in messages_raw:
-                            role = msg.get('role', 'user')
-                            content = msg.get('content', '')
-                            if isinstance(content, list):
-                                # 提取text类型的content
-                                text_content = ' '.join([c.get('content', '') for c in content if c.get('type') == 'text'])
-                                content = text_content
-                            if content:
-                                messages.append({"role": role, "content": content})
-                        
-                        if messages:
-                            converted.append({"messages": messages})
-                except:
-                    continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_codeforces(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 Codeforces-Python-Submissions - Parquet格式"""
-    print(f"  转换 Codeforces-Python-Submissions 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                # 优先使用prompt和response字段（已经格式化好的）
-                if 'prompt' in row and 'response' in row and row['prompt'] and row['response']:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": row['prompt']},
-                            {"role": "assistant", "content": row['response']}
-                        ]
-                    })
-                # 备用：使用problem-description和code
-                elif 'code' in row and row['code']:
-                    problem = row.get('problem-description', row.get('title', ''))
-                    code = row['code']
-                    if problem:
-                        prompt = f"Solve this Codeforces problem:\n\n{problem}"
-                    else:
-                        prompt = "Write a Python solution for this Codeforces problem."
-                    
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": prompt},
-                            {"role": "assistant", "content": f"```python\n{code}\n```"}
-                        ]
-                    })
-            except:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_self_oss_instruct(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 self-oss-instruct-sc2-exec-filter-50k - Parquet格式，instruction/response字段"""
-    print(f"  转换 self-oss-instruct 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                instruction = row.get('instruction', row.get('prompt', ''))
-                response = row.get('response', row.get('output', ''))
-                
-                if instruction and response:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": instruction},
-                            {"role": "assistant", "content": response}
-                        ]
-                    })
-            except:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_swe_problems(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 real-world-swe-problems - Parquet格式"""
-    print(f"  转换 real-world-swe-problems 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                prompt = row.get('prompt', '')
-                solution = row.get('gold_standard_solution', '')
-                
-                if prompt and solution:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": prompt},
-                            {"role": "assistant", "content": solution}
-                        ]
-                    })
-            except:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_stack_exchange_paired(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 stack-exchange-paired - Parquet格式"""
-    print(f"  转换 stack-exchange-paired 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                question = row.get('question', '')
-                response_j = row.get('response_j', '')
-                response_k = row.get('response_k', '')
-                
-                response = response_j if response_j else response_k
-                if question and response:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": question},
-                            {"role": "assistant", "content": response}
-                        ]
-                    })
-            except:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_react_code_instructions(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 react-code-instructions - JSONL格式，包含messages字段"""
-    print(f"  转换 react-code-instructions 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in tqdm(f, desc=f"  处理 {file_path.name}"):
-                if max_samples and len(converted) >= max_samples:
-                    break
-                try:
-                    data = json.loads(line)
-                    if 'messages' in data:
-                        messages = data['messages']
-                        standardized = []
-                        for msg in messages:
-                            role = msg.get('role', 'user')
-                            content = msg.get('content', '')
-                            if role and content:
-                                standardized.append({"role": role, "content": content})
-                        if standardized:
-                            converted.append({"messages": standardized})
-                except:
-                    continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_stackexchange_qa(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 stackexchange-question-answering - Parquet格式"""
-    print(f"  转换 stackexchange-question-answering 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                prompt = row.get('prompt', '')
-                answer = row.get('gold_standard_solution', '')
-                
-                if prompt and answer:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": prompt},
-                            {"role": "assistant", "content": answer}
-                        ]
-                    })
-            except:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
+def _chat(user: Any, assistant: Any) -> Dict[str, Any]:
+    return {
+        "messages": [
+            {"role": "user", "content": user},
+            {"role": "assistant", "content": assistant}
+        ]
+    }
 
 
-def convert_synthetic_2_sft(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 SYNTHETIC-2-SFT-verified - Parquet格式，包含messages字段（numpy.ndarray类型）"""
-    print(f"  转换 SYNTHETIC-2-SFT-verified 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
-            break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
+def _to_list(value: Any) -> Any:
+    """parquet 中的列表字段经 pandas 读出为 numpy.ndarray，统一转为 list"""
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def convert_apps_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """APPS - JSONL格式，包含question和solutions（solutions 已解码为列表）"""
+    question = row.get("question") or ""
+    solutions = row.get("solutions") or []
+    if isinstance(solutions, str):
+        # 未经列式缓存解码的原始 APPS 记录
+        solutions = json.loads(solutions)
+    if question and solutions and len(solutions) > 0:
+        return _chat(f"Solve this programming problem:\n\n{question}", f"```python\n{solutions[0]}\n```")
+    return None
+
+
+def convert_tiny_codes_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """tiny-codes - Parquet格式"""
+    prompt = row.get('prompt', row.get('instruction', ''))
+    response = row.get('response', row.get('output', row.get('code', '')))
+    if prompt and response:
+        return _chat(prompt, response)
+    return None
+
+
+def convert_commitpackft_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """commitpackft - JSONL格式在多个语言目录下"""
+    commit_msg = row.get("subject", row.get("message", ""))
+    new_code = row.get("new_contents") or ""
+    old_code = row.get("old_contents") or ""
+    if commit_msg and new_code:
+        if old_code:
+            prompt = f"Refactor the code based on: {commit_msg}\n\nOld code:\n```\n{old_code}\n```"
+        else:
+            prompt = f"Implement: {commit_msg}"
+        return _chat(prompt, f"```\n{new_code}\n```")
+    return None
+
+
+def convert_codereview_conversations_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """stackexchange_codereview - conversations字段（numpy.ndarray类型），human 以外的发言均视为 assistant"""
+    conversations = _to_list(row['conversations'])
+    if conversations and len(conversations) > 0:
+        messages = []
+        for msg in conversations:
+            role = "user" if msg.get('from') == 'human' else "assistant"
+            messages.append({"role": role, "content": msg.get('value', '')})
+        if messages and len(messages) >= 2:
+            return {"messages": messages}
+    return None
+
+
+def convert_instruction_completion_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """instruction + completion 两列"""
+    if row['instruction'] and row['completion']:
+        return _chat(str(row['instruction']), str(row['completion']))
+    return None
+
+
+def convert_code_contests_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """code_contests - Parquet格式，solutions是dict类型"""
+    description = row.get('description', '')
+    solutions = row.get('solutions')
+    # solutions是dict格式，包含language和solution数组
+    if description and solutions and isinstance(solutions, dict):
+        solution_arr = _to_list(solutions.get('solution', []))
+        if solution_arr and len(solution_arr) > 0 and solution_arr[0]:
+            return _chat(f"Solve this competitive programming problem:\n\n{description}", solution_arr[0])
+    return None
+
+
+def convert_reflection_seq_gpt_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ReflectionSeq-GPT - JSONL格式，messages 已解码为 [{role, content}]，列表形式的 content 已拼接为文本"""
+    messages = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in row.get("messages") or [] if msg["content"]
+    ]
+    return {"messages": messages} if messages else None
+
+
+def convert_codeforces_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Codeforces-Python-Submissions - Parquet格式"""
+    # 优先使用prompt和response字段（已经格式化好的）
+    if 'prompt' in row and 'response' in row and row['prompt'] and row['response']:
+        return _chat(row['prompt'], row['response'])
+    # 备用：使用problem-description和code
+    if 'code' in row and row['code']:
+        problem = row.get('problem-description', row.get('title', ''))
+        if problem:
+            prompt = f"Solve this Codeforces problem:\n\n{problem}"
+        else:
+            prompt = "Write a Python solution for this Codeforces problem."
+        return _chat(prompt, f"```python\n{row['code']}\n```")
+    return None
+
+
+def convert_self_oss_instruct_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """self-oss-instruct-sc2-exec-filter-50k - Parquet格式，instruction/response字段"""
+    instruction = row.get('instruction', row.get('prompt', ''))
+    response = row.get('response', row.get('output', ''))
+    if instruction and response:
+        return _chat(instruction, response)
+    return None
+
+
+def convert_swe_problems_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """real-world-swe-problems - Parquet格式"""
+    prompt = row.get('prompt', '')
+    solution = row.get('gold_standard_solution', '')
+    if prompt and solution:
+        return _chat(prompt, solution)
+    return None
+
+
+def convert_stack_exchange_paired_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """stack-exchange-paired - Parquet格式"""
+    question = row.get('question', '')
+    response_j = row.get('response_j', '')
+    response_k = row.get('response_k', '')
+    response = response_j if response_j else response_k
+    if question and response:
+        return _chat(question, response)
+    return None
+
+
+def convert_react_code_instructions_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """react-code-instructions - JSONL格式，包含messages字段"""
+    standardized = [
+        {"role": msg["role"], "content": msg["content"]}
+        for msg in row.get("messages") or [] if msg["role"] and msg["content"]
+    ]
+    return {"messages": standardized} if standardized else None
+
+
+def convert_stackexchange_qa_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """stackexchange-question-answering - Parquet格式"""
+    prompt = row.get('prompt', '')
+    answer = row.get('gold_standard_solution', '')
+    if prompt and answer:
+        return _chat(prompt, answer)
+    return None
+
+
+def convert_synthetic_2_sft_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """SYNTHETIC-2-SFT-verified - Parquet格式，包含messages字段（numpy.ndarray类型）"""
+    if 'messages' in row:
+        messages = _to_list(row['messages'])
+        if messages and len(messages) > 0:
+            standardized = []
+            for msg in messages:
+                role = msg.get('role', 'user')
+                content = msg.get('content', '')
+                if role and content:
+                    standardized.append({"role": role, "content": content})
+            if standardized and len(standardized) >= 2:
+                return {"messages": standardized}
+    return None
+
+
+def convert_sql_context_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """sql-create-context-instruction - Parquet格式，text字段使用[INST]...[/INST]格式"""
+    text = row.get('text', '')
+    # text格式: [INST] instruction [/INST] response
+    if text and '[INST]' in text and '[/INST]' in text:
+        inst_start = text.find('[INST]')
+        inst_end = text.find('[/INST]')
+        if inst_start != -1 and inst_end != -1 and inst_end > inst_start:
+            instruction = text[inst_start + 6:inst_end].strip()
+            response = text[inst_end + 7:].strip()
+            if instruction and response:
+                return _chat(instruction, response)
+    return None
+
+
+def convert_conversations_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """ShareGPT 风格 conversations字段（from/value，numpy.ndarray类型），如 Magpie-Qwen2.5-Coder-Pro-300K"""
+    conversations = _to_list(row['conversations'])
+    if conversations and len(conversations) > 0:
+        role_map = {'human': 'user', 'gpt': 'assistant', 'user': 'user', 'assistant': 'assistant'}
+        messages = []
+        for msg in conversations:
+            role = role_map.get(msg.get('from', 'user'), 'user')
+            content = msg.get('value', '')
+            if content:
+                messages.append({"role": role, "content": content})
+        if messages and len(messages) >= 2:
+            return {"messages": messages}
+    return None
+
+
+def convert_instruction_response_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """instruction + response 两列"""
+    if row['instruction'] and row['response']:
+        return _chat(str(row['instruction']), str(row['response']))
+    return None
+
+
+def convert_messages_row(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """通用 messages字段（role/content），兼容 JSON 字符串和列表形式的 content，用于自动识别的数据集"""
+    messages = _to_list(row['messages'])
+    if isinstance(messages, str):
+        messages = json.loads(messages)
+    standardized = []
+    for msg in messages or []:
+        role = msg.get('role', 'user')
+        content = msg.get('content', '')
+        if isinstance(content, list):
+            content = ' '.join(c.get('content', '') for c in content if c.get('type') == 'text')
+        if role and content:
+            standardized.append({"role": role, "content": content})
+    if len(standardized) >= 2:
+        return {"messages": standardized}
+    return None
+
+
+def iter_parquet_records(file_path: Path) -> Iterator[Dict[str, Any]]:
+    """按 record batch 读取 parquet，逐行产出字典"""
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=10_000):
+        yield from batch.to_pylist()
+
+
+def iter_jsonl_records(file_path: Path, skipped: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line in f:
             try:
-                if 'messages' in row:
-                    messages = row['messages']
-                    # numpy.ndarray转list
-                    if hasattr(messages, 'tolist'):
-                        messages = messages.tolist()
-                    
-                    if messages and len(messages) > 0:
-                        standardized = []
-                        for msg in messages:
-                            role = msg.get('role', 'user')
-                            content = msg.get('content', '')
-                            if role and content:
-                                standardized.append({"role": role, "content": content})
-                        if standardized and len(standardized) >= 2:
-                            converted.append({"messages": standardized})
-            except Exception as e:
+                yield json.loads(line)
+            except ValueError:
+                if skipped is not None:
+                    skipped[SKIP_PARSE_ERROR] += 1
                 continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
 
 
-def convert_sql_context(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 sql-create-context-instruction - Parquet格式，text字段使用[INST]...[/INST]格式"""
-    print(f"  转换 sql-create-context-instruction 数据集...")
-    converted = []
-    
+def iter_file_records(dataset_name: str, file_path: Path, skipped: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    if dataset_name in RAW_SOURCE_SPECS:
+        return iter_source_records(dataset_name, file_path, skipped)
+    if file_path.suffix == ".jsonl":
+        return iter_jsonl_records(file_path, skipped)
+    return iter_parquet_records(file_path)
+
+
+def select_row_converter(dataset_name: str, config: Dict[str, Any], file_path: Path) -> Optional[Tuple[str, RowConverter]]:
+    """
+    按文件选择行转换函数：配置了 variants 的数据集只读 parquet footer / JSONL 首行的列名，
+    选出第一个所需列齐全的分支；找不到匹配分支时返回 None
+    """
+    if "variants" not in config:
+        return "default", config["row_converter"]
+    # JSONL 数据源的列由列式缓存规格固定，不需要探测
+    if dataset_name in RAW_SOURCE_SPECS:
+        columns = frozenset(RAW_SOURCE_SPECS[dataset_name].schema.names)
+    else:
+        columns = probe_columns(file_path)
+    return match_columns(columns, config["variants"])
+
+
+def convert_row(row_converter: RowConverter, row: Dict[str, Any], skipped: Optional[Counter] = None) -> Optional[Dict[str, Any]]:
+    """
+    转换单行，字段缺失、类型异常或消息不足两条（LLaMA-Factory 无法组成问答对）的行跳过（返回 None），
+    跳过原因计入 skipped；只在跳过时计数，正常行没有额外开销
+    """
+    try:
+        item = row_converter(row)
+    except Exception as e:
+        if skipped is not None:
+            skipped[f"converter_error:{type(e).__name__}"] += 1
+        return None
+    if item is None:
+        reason = SKIP_EMPTY_FIELD
+    elif len(item.get("messages") or []) < 2:
+        reason = SKIP_TOO_FEW_MESSAGES
+    else:
+        return item
+    if skipped is not None:
+        skipped[reason] += 1
+    return None
+
+
+def convert_dataset(dataset_name: str, config: Dict[str, Any], input_files: List[Path], output_file: Path,
+                    max_samples: Optional[int] = None, output_format: str = "jsonl", shard_mb: float = 256,
+                    skipped: Optional[Counter] = None):
+    """
+    逐文件读取数据集并用选出的行转换函数转换，边转换边写出 LLaMA-Factory sharegpt 数据，返回写出器
+    （jsonl 为单个文件，parquet / jsonl.zst 为 output_file 目录下按大小切分的 zstd 分片）；
+    skipped 按原因累计被跳过的行数
+    """
+    print(f"  转换 {dataset_name} 数据集...")
+    writer = open_output(output_file, output_format, shard_mb)
+    with writer:
+        _convert_files(dataset_name, config, input_files, writer, max_samples, skipped)
+    return writer
+
+
+def _convert_files(dataset_name: str, config: Dict[str, Any], input_files: List[Path], writer: Any,
+                   max_samples: Optional[int], skipped: Optional[Counter] = None) -> None:
     for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
+        if max_samples and writer.rows >= max_samples:
             break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                text = row.get('text', '')
-                # text格式: [INST] instruction [/INST] response
-                if text and '[INST]' in text and '[/INST]' in text:
-                    # 解析 [INST]...[/INST] 格式
-                    inst_start = text.find('[INST]')
-                    inst_end = text.find('[/INST]')
-                    if inst_start != -1 and inst_end != -1 and inst_end > inst_start:
-                        instruction = text[inst_start + 6:inst_end].strip()
-                        response = text[inst_end + 7:].strip()
-                        
-                        if instruction and response:
-                            converted.append({
-                                "messages": [
-                                    {"role": "user", "content": instruction},
-                                    {"role": "assistant", "content": response}
-                                ]
-                            })
-            except Exception as e:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
-
-
-def convert_magpie_qwen(input_files: List[Path], output_file: Path, max_samples: Optional[int] = None):
-    """转换 Magpie-Qwen2.5-Coder-Pro-300K - Parquet格式，conversations字段（numpy.ndarray类型）"""
-    print(f"  转换 Magpie-Qwen2.5-Coder-Pro-300K 数据集...")
-    converted = []
-    
-    for file_path in input_files:
-        if max_samples and len(converted) >= max_samples:
+        selected = select_row_converter(dataset_name, config, file_path)
+        if selected is None:
+            print(f"  ⚠️  {file_path.name}: 列与任何转换分支都不匹配，跳过")
+            if skipped is not None:
+                skipped["unmatched_files"] += 1
+            continue
+        branch, row_converter = selected
+        if branch != "default":
+            print(f"  🔍 {file_path.name}: 使用 {branch} 分支")
+        records = iter_file_records(dataset_name, file_path, skipped)
+        _convert_records(dataset_name, row_converter, records, writer, max_samples, skipped, file_path.name)
+
+
+def _convert_records(dataset_name: str, row_converter: RowConverter, records: Iterator[Dict[str, Any]], writer: Any,
+                     max_samples: Optional[int], skipped: Optional[Counter], desc: str) -> None:
+    verifier = SOLUTION_VERIFIER["verifier"]
+    if verifier is not None and dataset_name in VERIFIABLE_DATASETS:
+        # 只保留通过自带测试的第一个 Python 解，没有测试或没有通过的解的题目丢弃
+        extract, rewrite = VERIFIABLE_DATASETS[dataset_name]
+        records = verifier.filter_rows(records, extract, rewrite)
+    for row in tqdm(records, desc=f"  处理 {desc}"):
+        if max_samples and writer.rows >= max_samples:
             break
-        df = pd.read_parquet(file_path)
-        for _, row in tqdm(df.iterrows(), total=len(df), desc=f"  处理 {file_path.name}"):
-            if max_samples and len(converted) >= max_samples:
-                break
-            try:
-                # conversations字段是numpy.ndarray类型
-                if 'conversations' in row:
-                    conversations = row['conversations']
-                    # numpy.ndarray转list
-                    if hasattr(conversations, 'tolist'):
-                        conversations = conversations.tolist()
-                    
-                    if conversations and len(conversations) > 0:
-                        messages = []
-                        for msg in conversations:
-                            role_map = {'human': 'user', 'gpt': 'assistant', 'user': 'user', 'assistant': 'assistant'}
-                            role = role_map.get(msg.get('from', 'user'), 'user')
-                            content = msg.get('value', '')
-                            if content:
-                                messages.append({"role": role, "content": content})
-                        if messages and len(messages) >= 2:
-                            converted.append({"messages": messages})
-                # 备用：使用instruction和response
-                elif 'instruction' in row and 'response' in row and row['instruction'] and row['response']:
-                    converted.append({
-                        "messages": [
-                            {"role": "user", "content": str(row['instruction'])},
-                            {"role": "assistant", "content": str(row['response'])}
-                        ]
-                    })
-            except Exception as e:
-                continue
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for item in converted:
-            f.write(json.dumps(item, ensure_ascii=False) + '\n')
-    
-    return len(converted)
+        item = convert_row(row_converter, row, skipped)
+        if item is not None:
+            writer.write(item)
 
 
 # 数据集配置
 DATASETS_CONFIG = {
     "apps": {
-        "converter": convert_apps,
+        "row_converter": convert_apps_row,
         "pattern": "*.jsonl"
     },
     "tiny-codes": {
-        "converter": convert_tiny_codes,
+        "row_converter": convert_tiny_codes_row,
         "pattern": "*.parquet"
     },
     "commitpackft": {
-        "converter": convert_commitpackft,
+        "row_converter": convert_commitpackft_row,
         "pattern": "data/**/data.jsonl"
     },
     "stackexchange_codereview": {
-        "converter": convert_stackexchange_codereview,
+        "variants": [
+            ("conversations", ("conversations",), convert_codereview_conversations_row),
+            ("instruction+completion", ("instruction", "completion"), convert_instruction_completion_row),
+        ],
         "pattern": "data/*.parquet"
     },
     "code_contests": {
-        "converter": convert_code_contests,
+        "row_converter": convert_code_contests_row,
         "pattern": "data/*.parquet"
     },
     "ReflectionSeq-GPT": {
-        "converter": convert_reflection_seq_gpt,
+        "row_converter": convert_reflection_seq_gpt_row,
         "pattern": "*.jsonl"
     },
     "Codeforces-Python-Submissions": {
-        "converter": convert_codeforces,
+        "row_converter": convert_codeforces_row,
         "pattern": "data/*.parquet"
     },
     "self-oss-instruct-sc2-exec-filter-50k": {
-        "converter": convert_self_oss_instruct,
+        "row_converter": convert_self_oss_instruct_row,
         "pattern": "data/*.parquet"
     },
     "real-world-swe-problems": {
-        "converter": convert_swe_problems,
+        "row_converter": convert_swe_problems_row,
         "pattern": "data/*.parquet"
     },
     "stack-exchange-paired": {
-        "converter": convert_stack_exchange_paired,
+        "row_converter": convert_stack_exchange_paired_row,
         "pattern": "data/**/*.parquet"
     },
     "react-code-instructions": {
-        "converter": convert_react_code_instructions,
+        "row_converter": convert_react_code_instructions_row,
         "pattern": "data/*.jsonl"
     },
     "stackexchange-question-answering": {
-        "converter": convert_stackexchange_qa,
+        "row_converter": convert_stackexchange_qa_row,
         "pattern": "data/*.parquet"
     },
     "SYNTHETIC-2-SFT-verified": {
-        "converter": convert_synthetic_2_sft,
+        "row_converter": convert_synthetic_2_sft_row,
         "pattern": "data/*.parquet"
     },
     "sql-create-context-instruction": {
-        "converter": convert_sql_context,
+        "row_converter": convert_sql_context_row,
         "pattern": "data/*.parquet"
     },
     "Magpie-Qwen2.5-Coder-Pro-300K-v0.1": {
-        "converter": convert_magpie_qwen,
+        "variants": [
+            ("conversations", ("conversations",), convert_conversations_row),
+            ("instruction+response", ("instruction", "response"), convert_instruction_response_row),
+        ],
         "pattern": "data/*.parquet"
     }
 }
 
 
+# 自动识别规则：(名称, 所需列, 行转换函数)，越具体的规则越靠前
+GENERIC_CONVERTERS = [
+    ("question+solutions", ("question", "solutions"), convert_apps_row),
+    ("description+solutions", ("description", "solutions"), convert_code_contests_row),
+    ("subject+new_contents", ("subject", "new_contents"), convert_commitpackft_row),
+    ("question+response_j", ("question", "response_j"), convert_stack_exchange_paired_row),
+    ("prompt+gold_standard_solution", ("prompt", "gold_standard_solution"), convert_swe_problems_row),
+    ("messages", ("messages",), convert_messages_row),
+    ("conversations", ("conversations",), convert_conversations_row),
+    ("instruction+response", ("instruction", "response"), convert_instruction_response_row),
+    ("instruction+completion", ("instruction", "completion"), convert_instruction_completion_row),
+    ("prompt+response", ("prompt", "response"), convert_tiny_codes_row),
+    ("instruction+output", ("instruction", "output"), convert_tiny_codes_row),
+    ("text", ("text",), convert_sql_context_row),
+]
+
+# data/ 下不是原始数据集的目录
+NON_DATASET_DIRS = {"llamafactory", "cache", "processed"}
+
+
+def discover_datasets(data_root: Path, names: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    为 data/ 下不在 DATASETS_CONFIG 中的数据集目录自动匹配转换函数，只探测第一个文件的列名
+    """
+    discovered = {}
+    candidates = [data_root / n for n in names] if names else sorted(p for p in data_root.iterdir() if p.is_dir())
+    for dataset_dir in candidates:
+        name = dataset_dir.name
+        if name in DATASETS_CONFIG or name in NON_DATASET_DIRS or name.startswith('.') or not dataset_dir.is_dir():
+            continue
+        files = find_data_files(dataset_dir)
+        if not files:
+            continue
+        columns = probe_columns(files[0])
+        matched = match_columns(columns, GENERIC_CONVERTERS)
+        if matched is None:
+            print(f"  ⚠️  {name}: 无法识别的列 {sorted(columns)}")
+            continue
+        rule, row_converter = matched
+        discovered[name] = {
+            "row_converter": row_converter,
+            "pattern": detect_pattern(dataset_dir, files),
+            "auto_detected": rule,
+        }
+        print(f"  🔍 自动识别 {name}: {rule} ({discovered[name]['pattern']})")
+    return discovered
+
+
+def plan_conversion_tasks(datasets: Dict[str, Dict[str, Any]], data_root: Path, task_bytes: int) -> List[Dict[str, Any]]:
+    """
+    多节点模式：把各数据集的输入切成 (数据集, 分片) 任务，parquet 按 row group 区间、JSONL 按字节区间，
+    每个任务约 task_bytes；任务顺序即合并顺序（文件按路径排序）
+    """
+    tasks = []
+    for dataset_name, config in datasets.items():
+        dataset_dir = data_root / dataset_name
+        if not dataset_dir.exists():
+            print(f"  ⚠️  目录不存在: {dataset_dir}")
+            continue
+        index = 0
+        for file_path in sorted(dataset_dir.glob(config["pattern"])):
+            for kind, _, start, end in plan_units(file_path, task_bytes):
+                tasks.append({"id": f"{dataset_name}.{index:05d}", "dataset": dataset_name,
+                              "file": str(file_path.relative_to(data_root)), "kind": kind, "start": start, "end": end})
+                index += 1
+    return tasks
+
+
+def iter_task_records(dataset_name: str, task: Dict[str, Any], data_root: Path,
+                      skipped: Optional[Counter] = None) -> Iterator[Dict[str, Any]]:
+    """读取一个任务的行区间；JSONL 数据源直接解码字节区间内的行，不经过（单节点构建的）列式缓存"""
+    file_path = data_root / task["file"]
+    if task["kind"] == "parquet":
+        row_groups = list(range(task["start"], task["end"]))
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=10_000, row_groups=row_groups):
+            yield from batch.to_pylist()
+        return
+    spec = RAW_SOURCE_SPECS.get(dataset_name)
+    for line in iter_line_range(file_path, task["start"], task["end"]):
+        try:
+            row = json.loads(line)
+            yield spec.decode(row) if spec is not None else row
+        except (ValueError, AttributeError, TypeError):
+            if skipped is not None:
+                skipped[SKIP_PARSE_ERROR] += 1
+
+
+def convert_task(dataset_name: str, config: Dict[str, Any], task: Dict[str, Any], data_root: Path, part_file: Path,
+                 skipped: Optional[Counter] = None):
+    """转换一个任务，写出未压缩 JSONL 分段文件，返回写出器"""
+    file_path = data_root / task["file"]
+    selected = select_row_converter(dataset_name, config, file_path)
+    with open_output(part_file, "jsonl") as writer:
+        if selected is None:
+            # 一个文件切成多个任务时只在第一个任务计数
+            if skipped is not None and task["start"] == 0:
+                skipped["unmatched_files"] += 1
+        else:
+            records = iter_task_records(dataset_name, task, data_root, skipped)
+            _convert_records(dataset_name, selected[1], records, writer, None, skipped, task["id"])
+    return writer
+
+
+def run_conversion_tasks(queue: SharedWorkQueue, tasks: List[Dict[str, Any]], datasets: Dict[str, Dict[str, Any]],
+                         data_root: Path) -> int:
+    """领取并转换任务直到队列全部完成（包括等待其他 worker 持有的任务，持有者退出后接手），返回本 worker 完成的任务数"""
+    parts_dir = queue.root / "parts"
+    finished = 0
+    for claim in queue.drain(tasks):
+        task = claim.task
+        dataset_name = task["dataset"]
+        # 分段先写到带领取令牌的文件名，确认仍持有锁后再改名，锁被夺走的旧持有者不会覆盖新结果
+        part_file = parts_dir / dataset_name / f"{claim.task_id}.{claim.token}.jsonl"
+        verifier = SOLUTION_VERIFIER["verifier"]
+        if verifier is not None:
+            verifier.reset_stats()
+        skipped: Counter = Counter()
+        start = time.perf_counter()
+        try:
+            writer = convert_task(dataset_name, datasets[dataset_name], task, data_root, part_file, skipped)
+        except Exception as e:
+            print(f"  ❌ {claim.task_id}: {type(e).__name__}: {e}")
+            queue.fail(claim, f"{type(e).__name__}: {e}")
+            continue
+        if verifier is not None and dataset_name in VERIFIABLE_DATASETS:
+            skipped[SKIP_UNVERIFIED] += verifier.stats['problems'] - verifier.stats['verified']
+        if claim.lost.is_set() or not queue.owns(claim):
+            part_file.unlink(missing_ok=True)
+            print(f"  ⚠️  {claim.task_id}: 租约已被其他 worker 接管，放弃本次结果")
+            continue
+        final_file = parts_dir / dataset_name / f"{claim.task_id}.jsonl"
+        os.replace(part_file, final_file)
+        elapsed = time.perf_counter() - start
+        result = {"records": writer.rows, "skipped": dict(skipped), "wall_time": round(elapsed, 3),
+                  "part": str(final_file.relative_to(queue.root))}
+        if queue.complete(claim, result):
+            finished += 1
+            progress = queue.status(tasks)
+            print(f"  ✅ {claim.task_id}: {writer.rows:,} 条，{elapsed:.1f}s "
+                  f"（队列 {progress['done']}/{progress['tasks']} 完成，{progress['running']} 进行中）")
+    return finished
+
+
+def merge_task_parts(queue: SharedWorkQueue, tasks: List[Dict[str, Any]], data_root: Path, output_root: Path,
+                     output_format: str, shard_mb: float) -> Tuple[Dict[str, int], Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    按任务顺序把各数据集的分段合并为最终输出，汇总各任务的跳过统计；
+    有任务最终失败的数据集不写出。返回 (条数, dataset_info 条目, 转换汇总)
+    """
+    by_dataset: Dict[str, List[Dict[str, Any]]] = {}
+    for task in tasks:
+        by_dataset.setdefault(task["dataset"], []).append(task)
+    results, dataset_info, summary = {}, {}, {}
+    for dataset_name, dataset_tasks in by_dataset.items():
+        files = sorted({task["file"] for task in dataset_tasks})
+        done = [queue.result(task["id"]) for task in dataset_tasks]
+        skipped: Counter = Counter()
+        for marker in done:
+            skipped.update(marker.get("result", {}).get("skipped", {}))
+        summary[dataset_name] = {
+            "input_files": len(files),
+            "input_bytes": sum((data_root / f).stat().st_size for f in files),
+            "tasks": len(dataset_tasks),
+            "workers": len({marker["worker"] for marker in done}),
+            "task_wall_time": round(sum(marker.get("result", {}).get("wall_time", 0) for marker in done), 3),
+            "skipped": dict(skipped.most_common()),
+        }
+        errors = [f"{task['id']}: {marker['error']}" for task, marker in zip(dataset_tasks, done) if "error" in marker]
+        if errors:
+            print(f"  ❌ {dataset_name}: {len(errors)} 个任务失败，不写出（{errors[0]}）")
+            summary[dataset_name]["error"] = errors
+            continue
+        output_file = output_path(output_root, dataset_name, output_format)
+        with open_output(output_file, output_format, shard_mb) as writer:
+            for marker in done:
+                for line in iter_json_lines(queue.root / marker["result"]["part"]):
+                    writer.write_line(line)
+        results[dataset_name] = writer.rows
+        summary[dataset_name].update(records=writer.rows, output=str(output_file), disk_bytes=writer.disk_bytes)
+        print(f"  ✅ {dataset_name}: {writer.rows:,} 条（{len(dataset_tasks)} 个任务）-> {output_file}")
+        if writer.rows > 0 and registrable(output_format):
+            dataset_key, entry = dataset_info_item(dataset_name, output_file, data_root)
+            dataset_info[dataset_key] = entry
+    return results, dataset_info, summary
+
+
+def run_distributed(args, datasets: Dict[str, Dict[str, Any]], data_root: Path, output_root: Path) -> int:
+    """
+    多节点模式（--queue-dir）：各节点上启动相同命令，worker 通过共享目录领取任务、写出分段；
+    全部任务完成后由一个 worker 领取合并任务，写出最终结果、dataset_info.json 与转换汇总
+    """
+    queue = SharedWorkQueue(args.queue_dir, lease_timeout=args.lease_timeout)
+    params = {
+        "data_root": str(data_root.resolve()),
+        "output_root": str(output_root.resolve()),
+        "datasets": sorted(datasets),
+        "task_mb": args.task_mb,
+        "output_format": args.output_format,
+        "verify_solutions": args.verify_solutions,
+    }
+    tasks = queue.publish(params, lambda: plan_conversion_tasks(datasets, data_root, int(args.task_mb * (1 << 20))))
+    print(f"🛰️  worker {queue.worker_id}: 队列 {queue.root}，共 {len(tasks)} 个任务")
+
+    finished = run_conversion_tasks(queue, tasks, datasets, data_root)
+    print(f"\n✅ 本 worker 完成 {finished} 个任务" + (f"（接管过期任务 {queue.reclaimed} 个）" if queue.reclaimed else ""))
+    if args.no_merge:
+        return 0
+
+    # 合并也是一个带租约的任务：其他 worker 等待，合并者退出时由等待者接手
+    for claim in queue.drain([{"id": MERGE_TASK_ID}]):
+        print(f"\n🔗 合并分段 -> {output_root}")
+        try:
+            results, dataset_info, summary = merge_task_parts(queue, tasks, data_root, output_root,
+                                                              args.output_format, args.shard_size_mb)
+        except Exception as e:
+            queue.fail(claim, f"{type(e).__name__}: {e}")
+            raise
+        dataset_info_path = update_dataset_info(data_root, dataset_info)
+        summary_path = output_root / "conversion_summary.json"
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        queue.complete(claim, {"records": sum(results.values()), "datasets": len(results)})
+        print(f"\n✅ 成功转换 {len(results)} 个数据集，共 {sum(results.values()):,} 条数据")
+        print(f"📄 dataset_info.json 已更新: {dataset_info_path}")
+        print(f"📄 转换汇总: {summary_path}")
+        print(f"💡 分段保留在 {queue.root / 'parts'}，确认结果后可删除整个队列目录")
+        return 1 if any("error" in s for s in summary.values()) else 0
+    print("ℹ️  合并已由其他 worker 完成")
+    return 0
+
+
+def dataset_info_item(dataset_name: str, output_file: Path, data_root: Path) -> Tuple[str, Dict[str, Any]]:
+    """dataset_info.json 中的键与条目（分片格式注册整个目录，LLaMA-Factory 会加载目录下的全部分片）"""
+    dataset_key = dataset_name.replace('-', '_').replace('.', '_').lower()
+    try:
+        file_name = str(output_file.resolve().relative_to(data_root.resolve()))
+    except ValueError:
+        file_name = str(output_file.resolve())
+    return dataset_key, dataset_info_entry(file_name)
+
+
+def update_dataset_info(data_root: Path, dataset_info: Dict[str, Any]) -> Path:
+    """把本次转换的条目合并进 data_root/dataset_info.json"""
+    dataset_info_path = data_root / "dataset_info.json"
+    
+    # 读取现有配置
+    if dataset_info_path.exists():
+        with open(dataset_info_path, 'r', encoding='utf-8') as f:
+            existing_info = json.load(f)
+    else:
+        existing_info = {}
+    
+    # 合并配置
+    existing_info.update(dataset_info)
+    
+    # 保存配置
+    with open(dataset_info_path, 'w', encoding='utf-8') as f:
+        json.dump(existing_info, f, ensure_ascii=False, indent=2)
+    return dataset_info_path
+
+
 def main():
     parser = argparse.ArgumentParser(description="转换15个代码数据集为LLaMA-Factory格式")
     
@@ -659,10 +750,43 @@ def main():
     parser.add_argument("--output-dir", type=str, default=str(default_output_dir), help="输出目录")
     parser.add_argument("--max-samples", type=int, default=None, help="每个数据集最多转换的样本数")
     parser.add_argument("--datasets", nargs="+", help="指定要转换的数据集")
+    parser.add_argument("--cache-dir", type=str, default=str(default_data_dir / "cache" / "columnar"),
+                        help="JSONL 数据源的 parquet 列式缓存目录（源文件变化时自动重建）")
+    parser.add_argument("--no-columnar-cache", action="store_true", help="直接逐行解析 JSONL，不使用列式缓存")
+    parser.add_argument("--output-format", type=str, default="jsonl", choices=list(OUTPUT_FORMATS),
+                        help="jsonl: 单个未压缩文件；parquet: zstd 分片目录（注册到 dataset_info）；"
+                             "jsonl.zst: zstd 压缩 JSONL 分片（仅归档，LLaMA-Factory 无法直接加载）")
+    parser.add_argument("--shard-size-mb", type=float, default=256, help="每个分片的未压缩数据量上限（MB）")
+    parser.add_argument("--auto-detect", action="store_true",
+                        help="为 data/ 下未配置的数据集目录按列名自动匹配转换函数")
+    parser.add_argument("--verify-solutions", action="store_true",
+                        help="在沙箱中运行 apps / code_contests 的候选 Python 解，只保留通过自带测试的解")
+    parser.add_argument("--verify-workers", type=int, default=None, help="并行验证的沙箱进程数（默认 CPU 核数-2）")
+    parser.add_argument("--verify-time-limit", type=float, default=4.0, help="每个测试用例的时限（秒）")
+    parser.add_argument("--verify-cache", type=str, default=str(default_data_dir / "cache" / "verdicts.sqlite"),
+                        help="验证结果缓存（按测试集哈希 + 归一化代码哈希）")
+    parser.add_argument("--profile", action="store_true",
+                        help="记录每个数据集的耗时、条/s、输入 MB/s 与峰值内存，写入 conversion_summary.json")
+    parser.add_argument("--cprofile-dir", type=str, default=None,
+                        help="为每个数据集保存 cProfile 结果（<dir>/<dataset>.prof，可用 snakeviz 查看）")
+    parser.add_argument("--queue-dir", type=str, default=None,
+                        help="多节点模式：共享文件系统上的任务队列目录，各节点运行相同命令即可协同转换")
+    parser.add_argument("--task-mb", type=float, default=256, help="多节点模式下每个任务的输入数据量（MB）")
+    parser.add_argument("--lease-timeout", type=float, default=300,
+                        help="多节点模式下任务租约（秒），持有者超过该时间未续租视为已退出，任务由其他 worker 接手")
+    parser.add_argument("--no-merge", action="store_true", help="多节点模式下本 worker 只转换，不参与最终合并")
     
     args = parser.parse_args()
+    if args.queue_dir and args.max_samples:
+        parser.error("--max-samples 按数据集整体截断，不支持多节点模式")
     
     data_root = Path(args.data_dir)
+    COLUMNAR_CACHE.update(enabled=not args.no_columnar_cache, root=args.cache_dir, data_root=data_root)
+    if args.verify_solutions:
+        verifier_kwargs = {"n_workers": args.verify_workers} if args.verify_workers else {}
+        SOLUTION_VERIFIER["verifier"] = SolutionVerifier(
+            time_limit=args.verify_time_limit, cache_path=args.verify_cache, **verifier_kwargs
+        )
     output_root = Path(args.output_dir)
     output_root.mkdir(parents=True, exist_ok=True)
     
@@ -678,11 +802,24 @@ def main():
     # 确定要转换的数据集
     if args.datasets:
         datasets = {k: v for k, v in DATASETS_CONFIG.items() if k in args.datasets}
+        unknown = [name for name in args.datasets if name not in DATASETS_CONFIG]
+        if unknown:
+            datasets.update(discover_datasets(data_root, unknown))
     else:
-        datasets = DATASETS_CONFIG
+        datasets = dict(DATASETS_CONFIG)
+        if args.auto_detect:
+            datasets.update(discover_datasets(data_root))
+    
+    if args.queue_dir:
+        if args.profile or args.cprofile_dir:
+            print("ℹ️  多节点模式不做 --profile / --cprofile-dir 统计，各任务耗时记录在转换汇总中")
+        return run_distributed(args, datasets, data_root, output_root)
     
     results = {}
     dataset_info = {}
+    # 转换汇总：每个数据集的输入/输出规模、按原因统计的跳过行数，--profile 时另含耗时、吞吐与峰值内存
+    summary: Dict[str, Dict[str, Any]] = {}
+    timer = StageTimer(output_format=args.output_format, max_samples=args.max_samples) if args.profile else None
     
     for dataset_name, config in datasets.items():
         print(f"\n{'='*80}")
@@ -696,7 +833,7 @@ def main():
         
         # 查找输入文件
         pattern = config["pattern"]
-        input_files = list(dataset_dir.glob(pattern))
+        input_files = sorted(dataset_dir.glob(pattern))
         
         if not input_files:
             print(f"  ⚠️  未找到匹配文件: {pattern}")
@@ -705,54 +842,76 @@ def main():
         print(f"  📁 找到 {len(input_files)} 个文件")
         
         # 转换数据集
-        output_file = output_root / f"{dataset_name}.jsonl"
+        output_file = output_path(output_root, dataset_name, args.output_format)
+        if SOLUTION_VERIFIER["verifier"] is not None:
+            SOLUTION_VERIFIER["verifier"].reset_stats()
+        skipped: Counter = Counter()
+        input_bytes = sum(f.stat().st_size for f in input_files)
+        summary[dataset_name] = {"input_files": len(input_files), "input_bytes": input_bytes}
         try:
-            count = config["converter"](input_files, output_file, args.max_samples)
+            profiler = cProfile.Profile() if args.cprofile_dir else None
+            with (timer.stage(dataset_name) if timer is not None else nullcontext()) as metrics:
+                # 每个数据集单独统计峰值内存（ru_maxrss 只能给出进程生命周期内的最大值）
+                rss_reset = metrics is not None and reset_peak_rss()
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    writer = convert_dataset(dataset_name, config, input_files, output_file, args.max_samples,
+                                             args.output_format, args.shard_size_mb, skipped)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                        profile_path = Path(args.cprofile_dir) / f"{dataset_name}.prof"
+                        profile_path.parent.mkdir(parents=True, exist_ok=True)
+                        profiler.dump_stats(str(profile_path))
+                        print(f"  🔬 cProfile: {profile_path}")
+                if metrics is not None:
+                    metrics.add_count("records", writer.rows)
+                    metrics.add_count("input_bytes", input_bytes)
+                    if rss_reset:
+                        metrics.extra["dataset_peak_rss_mb"] = round(peak_rss_since_reset_mb() or 0.0, 1)
+            count = writer.rows
             results[dataset_name] = count
+            verifier = SOLUTION_VERIFIER["verifier"]
+            if verifier is not None and dataset_name in VERIFIABLE_DATASETS:
+                stats = verifier.stats
+                skipped[SKIP_UNVERIFIED] += stats['problems'] - stats['verified']
+                print(f"  🧪 执行验证: {stats['verified']}/{stats['problems']} 题通过 "
+                      f"(无测试 {stats['no_tests']}, 执行 {stats['executed']} 次, 缓存命中 {stats['cache_hits']})")
+            summary[dataset_name].update(records=count, output=str(output_file), disk_bytes=writer.disk_bytes)
+            if skipped:
+                print("  🚮 跳过: " + ", ".join(f"{reason} {n:,}" for reason, n in skipped.most_common()))
+            if metrics is not None:
+                throughput = metrics.throughput()
+                print(f"  ⏱️  {metrics.wall_time:.1f}s, {throughput.get('records_per_sec', 0):,.0f} 条/s, "
+                      f"{throughput.get('input_bytes_per_sec', 0) / 1024 ** 2:.1f} MB/s, "
+                      f"峰值内存 {metrics.extra.get('dataset_peak_rss_mb', metrics.peak_rss_mb):.0f} MB")
             
             if count > 0:
                 print(f"  ✅ 转换成功: {count} 条数据")
-                print(f"  📄 输出文件: {output_file}")
-                print(f"  📊 文件大小: {output_file.stat().st_size / (1024**2):.2f} MB")
+                print(f"  📄 输出: {output_file}" + (f" ({len(writer.shards)} 个分片)" if output_file.is_dir() else ""))
+                print(f"  📊 磁盘占用: {writer.disk_bytes / (1024**2):.2f} MB")
                 
-                # 添加到dataset_info
-                dataset_key = dataset_name.replace('-', '_').replace('.', '_').lower()
-                dataset_info[dataset_key] = {
-                    "file_name": f"llamafactory/{dataset_name}.jsonl",
-                    "formatting": "sharegpt",
-                    "columns": {
-                        "messages": "messages"
-                    },
-                    "tags": {
-                        "role_tag": "role",
-                        "content_tag": "content",
-                        "user_tag": "user",
-                        "assistant_tag": "assistant"
-                    }
-                }
+                # 添加到dataset_info（分片格式注册整个目录，LLaMA-Factory 会加载目录下的全部分片）
+                if registrable(args.output_format):
+                    dataset_key, entry = dataset_info_item(dataset_name, output_file, data_root)
+                    dataset_info[dataset_key] = entry
+                else:
+                    print(f"  ℹ️  {args.output_format} 分片仅用于归档，不注册到 dataset_info.json")
             else:
                 print(f"  ⚠️  转换失败: 0 条数据")
         except Exception as e:
             print(f"  ❌ 转换失败: {str(e)}")
+            summary[dataset_name]["error"] = f"{type(e).__name__}: {e}"
             import traceback
             traceback.print_exc()
+        finally:
+            summary[dataset_name]["skipped"] = dict(skipped.most_common())
+            if timer is not None and timer.get(dataset_name) is not None:
+                summary[dataset_name]["profile"] = timer.get(dataset_name).to_dict()
     
     # 更新dataset_info.json
-    dataset_info_path = data_root / "dataset_info.json"
-    
-    # 读取现有配置
-    if dataset_info_path.exists():
-        with open(dataset_info_path, 'r', encoding='utf-8') as f:
-            existing_info = json.load(f)
-    else:
-        existing_info = {}
-    
-    # 合并配置
-    existing_info.update(dataset_info)
-    
-    # 保存配置
-    with open(dataset_info_path, 'w', encoding='utf-8') as f:
-        json.dump(existing_info, f, ensure_ascii=False, indent=2)
+    dataset_info_path = update_dataset_info(data_root, dataset_info)
     
     print(f"\n\n{'='*80}")
     print("📊 转换总结")
@@ -764,7 +923,15 @@ def main():
     for dataset_name, count in results.items():
         print(f"  - {dataset_name}: {count:,} 条")
     
+    summary_path = output_root / "conversion_summary.json"
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if timer is not None:
+        print()
+        timer.print_summary()
+    
     print(f"\n📄 dataset_info.json 已更新: {dataset_info_path}")
+    print(f"📄 转换汇总: {summary_path}")
     print(f"📁 所有数据已保存到: {output_root}")
     print(f"\n💡 在 LLaMA-Factory 中使用这些数据集:")
     print(f"   dataset: " + ",".join(list(dataset_info.keys())[:3]) + ",...")
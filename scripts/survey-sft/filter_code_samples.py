@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+代码回复过滤 - 标记非 Python 与语法错误的样本
+抽取助手回复中的代码块，判断语言并在进程池中批量 ast.parse，判定结果写到输入旁边的 <输入>.codefilter.npz；
+原始 JSONL / 分片不做改写，shuffle_merge.py --code-filter 合并时按 sidecar 跳过被丢弃的记录
+
+用法:
+    uv run scripts/survey-sft/filter_code_samples.py --workers 60
+    uv run scripts/survey-sft/filter_code_samples.py --inputs data/llamafactory/tiny-codes.jsonl --drop non_python
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.code_filter import DEFAULT_DROP, REASONS, build_code_filter, load_code_filter, sidecar_path, update_drop
+from src.data.sharded_writer import OUTPUT_FORMATS, output_path
+
+# 代码质量参差、非 Python 代码较多的数据集
+DEFAULT_DATASETS = ["tiny-codes", "Codeforces-Python-Submissions", "stack-exchange-paired"]
+
+
+def resolve_inputs(converted_dir: Path, datasets: list) -> list:
+    """数据集名 -> 转换结果（依次查找 jsonl 文件、parquet 分片目录、jsonl.zst 分片目录）"""
+    inputs = []
+    for name in datasets:
+        for fmt in OUTPUT_FORMATS:
+            path = output_path(converted_dir, name, fmt)
+            if path.exists():
+                inputs.append(path)
+                break
+        else:
+            print(f"  ⚠️  未找到 {name} 的转换结果")
+    return inputs
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="代码回复的语言与语法过滤")
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"), help="数据根目录")
+    parser.add_argument("--datasets", nargs="+", default=DEFAULT_DATASETS, help="要过滤的数据集（data/llamafactory 下的转换结果）")
+    parser.add_argument("--inputs", nargs="+", default=None, help="直接指定输入文件或分片目录（覆盖 --datasets）")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--batch-lines", type=int, default=4096, help="每个批次的记录数")
+    parser.add_argument("--drop", nargs="+", default=list(DEFAULT_DROP), choices=list(REASONS),
+                        help="要丢弃的判定原因")
+    parser.add_argument("--force", action="store_true", help="输入未变化时也重新判定")
+    args = parser.parse_args()
+
+    converted_dir = Path(args.data_dir) / "llamafactory"
+    inputs = [Path(p) for p in args.inputs] if args.inputs else resolve_inputs(converted_dir, args.datasets)
+    if not inputs:
+        print("❌ 没有可过滤的输入")
+        return 1
+
+    print("=" * 80)
+    print("🧹 代码回复过滤")
+    print("=" * 80)
+    for source in inputs:
+        loaded = None if args.force else load_code_filter(source)
+        if loaded is not None:
+            # 判定结果与丢弃策略无关，只需更新 sidecar 中的 drop
+            if loaded[1]["drop"] != args.drop:
+                update_drop(source, args.drop)
+            counts = loaded[1]["counts"]
+            print(f"\n✅ {source.name}: sidecar 已是最新，跳过判定")
+        else:
+            print(f"\n📄 {source}")
+            start = time.perf_counter()
+            stats = build_code_filter(source, args.workers, args.batch_lines, args.drop)
+            elapsed = time.perf_counter() - start
+            counts = {name: stats[name] for name in REASONS}
+            print(f"  ⏱️  {stats['rows']:,} 条，{elapsed:.1f}s（{stats['rows'] / max(elapsed, 1e-9):,.0f} 条/s）")
+            print(f"  📄 sidecar: {sidecar_path(source)}")
+        rows = sum(counts.values())
+        dropped = sum(counts[name] for name in args.drop)
+        for name in REASONS:
+            mark = "🗑️ " if name in args.drop else "  "
+            print(f"  {mark} {name:<13} {counts[name]:>10,} ({counts[name] / max(rows, 1):.1%})")
+        print(f"  保留 {rows - dropped:,} / {rows:,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
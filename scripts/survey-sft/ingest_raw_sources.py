@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+一次性把 JSONL 数据源转成 parquet 列式缓存（zstd 压缩、只保留所需列、嵌套 JSON 已解码）
+之后 convert_all_datasets.py 及统计/去重脚本直接读取缓存；源文件未变化时跳过
+
+用法:
+    uv run scripts/survey-sft/ingest_raw_sources.py
+    uv run scripts/survey-sft/ingest_raw_sources.py --datasets apps commitpackft --workers 8
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Tuple
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.columnar_cache import RAW_SOURCE_SPECS, build_columnar_cache, cache_path_for, is_cache_fresh
+
+# 与 convert_all_datasets.py 中 DATASETS_CONFIG 的 pattern 保持一致
+SOURCE_PATTERNS = {
+    "apps": "*.jsonl",
+    "commitpackft": "data/**/data.jsonl",
+    "ReflectionSeq-GPT": "*.jsonl",
+    "react-code-instructions": "data/*.jsonl",
+}
+
+
+def ingest_one(dataset_name: str, source: str, cache_path: str) -> Tuple[str, Dict[str, int], float]:
+    start = time.time()
+    stats = build_columnar_cache(source, cache_path, RAW_SOURCE_SPECS[dataset_name])
+    return source, stats, time.time() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="JSONL 数据源列式缓存")
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"), help="数据集根目录")
+    parser.add_argument("--cache-dir", type=str, default=str(project_root / "data" / "cache" / "columnar"))
+    parser.add_argument("--datasets", nargs="+", default=list(SOURCE_PATTERNS), choices=list(SOURCE_PATTERNS))
+    parser.add_argument("--workers", type=int, default=4, help="并行转换的文件数")
+    parser.add_argument("--force", action="store_true", help="忽略已有缓存，全部重建")
+    args = parser.parse_args()
+
+    data_root = Path(args.data_dir)
+    jobs = []
+    for dataset_name in args.datasets:
+        dataset_dir = data_root / dataset_name
+        sources = sorted(dataset_dir.glob(SOURCE_PATTERNS[dataset_name])) if dataset_dir.exists() else []
+        if not sources:
+            print(f"⚠️  {dataset_name}: 未找到 JSONL 文件")
+            continue
+        for source in sources:
+            cache_path = cache_path_for(source, dataset_dir, args.cache_dir)
+            if not args.force and is_cache_fresh(cache_path, source, RAW_SOURCE_SPECS[dataset_name]):
+                print(f"✓ 缓存有效: {cache_path}")
+                continue
+            jobs.append((dataset_name, str(source), str(cache_path)))
+
+    print(f"🔄 需要构建 {len(jobs)} 个缓存文件")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(ingest_one, *job): job for job in jobs}
+        for future in as_completed(futures):
+            dataset_name, source, cache_path = futures[future]
+            try:
+                _, stats, elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {source}: {e}")
+                continue
+            src_mb = Path(source).stat().st_size / 1024 ** 2
+            dst_mb = Path(cache_path).stat().st_size / 1024 ** 2
+            print(f"✅ {dataset_name}: {Path(source).name} -> {Path(cache_path).name} "
+                  f"{stats['rows']:,} 行 (跳过 {stats['skipped']}) {src_mb:.1f}MB -> {dst_mb:.1f}MB {elapsed:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+转换结果统计 - 选择混合比例前查看各数据源的分布
+并行流式读取 data/llamafactory 下的全部转换结果，一遍得到轮数、字符 / token 长度分位数与直方图、
+代码块占比和近似去重数（分位数草图 + HyperLogLog，内存与数据量无关），输出 JSON 与 Markdown
+
+用法:
+    uv run scripts/survey-sft/profile_datasets.py --workers 32
+    uv run scripts/survey-sft/profile_datasets.py --inputs data/llamafactory/apps.jsonl --tokenizer Qwen/Qwen3-8B
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.external_shuffle import converted_outputs
+from src.data.profiler import (
+    APPROX_BYTES_PER_TOKEN,
+    format_profile_markdown,
+    plan_units,
+    profile_report,
+    profile_sources,
+)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="转换结果的流式统计")
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"), help="数据根目录")
+    parser.add_argument("--inputs", nargs="+", default=None, help="输入文件或分片目录（默认 data/llamafactory 下全部转换结果）")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--chunk-mb", type=float, default=256, help="大文件按此大小切分为并行工作单元")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help=f"分词器路径，用于精确统计 token 数（默认按 UTF-8 字节数 / {APPROX_BYTES_PER_TOKEN} 近似）")
+    parser.add_argument("--output", type=str, default=None,
+                        help="输出路径前缀（默认 data/llamafactory/profile，生成 .json 与 .md）")
+    args = parser.parse_args()
+
+    converted_dir = Path(args.data_dir) / "llamafactory"
+    inputs = [Path(p) for p in args.inputs] if args.inputs else converted_outputs(converted_dir)
+    if not inputs:
+        print(f"❌ 没有找到转换结果: {converted_dir}")
+        return 1
+
+    chunk_bytes = int(args.chunk_mb * (1 << 20))
+    n_units = sum(len(plan_units(path, chunk_bytes)) for path in inputs)
+    print("=" * 80)
+    print(f"📊 统计 {len(inputs)} 个数据源（{n_units} 个工作单元）")
+    print("=" * 80)
+
+    start = time.perf_counter()
+    profiles = profile_sources(inputs, args.workers, chunk_bytes, args.tokenizer)
+    elapsed = time.perf_counter() - start
+    report = profile_report(profiles, inputs=[str(p) for p in inputs], tokenizer=args.tokenizer,
+                            elapsed_sec=round(elapsed, 2))
+    markdown = format_profile_markdown(report)
+
+    output = Path(args.output) if args.output else converted_dir / "profile"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    json_path, md_path = output.with_name(output.name + ".json"), output.with_name(output.name + ".md")
+    json_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    md_path.write_text(markdown, encoding="utf-8")
+
+    print(markdown)
+    records = report["all"]["records"]
+    print(f"⏱️  {records:,} 条，{elapsed:.1f}s（{records / max(elapsed, 1e-9):,.0f} 条/s）")
+    print(f"📄 JSON: {json_path}")
+    print(f"📄 Markdown: {md_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+从原始数据源直接抽取混合训练集（不做全量转换）
+行数来自 parquet 元数据 / JSONL 行索引；先抽行号，再只对被抽中的行运行 convert_all_datasets.py 中的行转换函数
+
+用法:
+    # 查看各数据源行数（只读元数据）
+    uv run scripts/survey-sft/sample_virtual_mix.py --counts-only
+    # 抽取 2 万条，各数据集平均分配
+    uv run scripts/survey-sft/sample_virtual_mix.py --total 20000 --seed 42
+    # 按行数比例分配，或手动指定权重
+    uv run scripts/survey-sft/sample_virtual_mix.py --total 20000 --allocation proportional
+    uv run scripts/survey-sft/sample_virtual_mix.py --total 20000 --weights apps=2 tiny-codes=1 commitpackft=1
+"""
+
+import argparse
+import json
+import sys
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from convert_all_datasets import DATASETS_CONFIG, convert_row, discover_datasets, select_row_converter
+from src.data.virtual_dataset import VirtualDataset, open_source
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="惰性抽取混合 SFT 数据集")
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"), help="数据集根目录")
+    parser.add_argument("--columnar-cache-dir", type=str, default=str(project_root / "data" / "cache" / "columnar"),
+                        help="JSONL 列式缓存目录（存在且有效时优先使用）")
+    parser.add_argument("--index-dir", type=str, default=str(project_root / "data" / "cache" / "line_index"),
+                        help="JSONL 行偏移索引目录")
+    parser.add_argument("--datasets", nargs="+", default=None, help="参与混合的数据集（默认全部）")
+    parser.add_argument("--total", type=int, default=20000, help="抽取的总样本数")
+    parser.add_argument("--allocation", type=str, default="equal", choices=["equal", "proportional"],
+                        help="未指定 --weights 时的配额分配方式")
+    parser.add_argument("--weights", nargs="+", default=None, help="数据集权重，如 apps=2 tiny-codes=1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None,
+                        help="输出 JSONL（默认 data/llamafactory/mix_<total>.jsonl）")
+    parser.add_argument("--dataset-name", type=str, default=None, help="注册到 dataset_info.json 的名称")
+    parser.add_argument("--counts-only", action="store_true", help="只打印各数据源行数")
+    parser.add_argument("--auto-detect", action="store_true", help="同时纳入 data/ 下按列名自动识别的数据集")
+    return parser.parse_args()
+
+
+def allocate(total: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """按权重分配配额（最大余数法，保证总数恰好为 total）"""
+    weight_sum = sum(weights.values())
+    exact = {name: total * w / weight_sum for name, w in weights.items()}
+    quota = {name: int(v) for name, v in exact.items()}
+    remainder = total - sum(quota.values())
+    for name in sorted(exact, key=lambda k: exact[k] - quota[k], reverse=True)[:remainder]:
+        quota[name] += 1
+    return quota
+
+
+def main() -> int:
+    args = parse_args()
+    data_root = Path(args.data_dir)
+    configs = dict(DATASETS_CONFIG)
+    if args.auto_detect or (args.datasets and any(n not in configs for n in args.datasets)):
+        unknown = [n for n in args.datasets if n not in configs] if args.datasets else None
+        configs.update(discover_datasets(data_root, unknown))
+    names = args.datasets or list(configs)
+
+    print("=" * 80)
+    print("🎲 惰性抽取混合数据集")
+    print("=" * 80)
+
+    datasets: Dict[str, VirtualDataset] = {}
+    start = time.time()
+    for name in names:
+        if name not in configs:
+            print(f"  ⚠️  未知数据集: {name}")
+            continue
+        dataset_dir = data_root / name
+        files = sorted(dataset_dir.glob(configs[name]["pattern"])) if dataset_dir.exists() else []
+        # 按文件选择转换分支，列不匹配的文件不参与抽样
+        selected = [(f, select_row_converter(name, configs[name], f)) for f in files]
+        selected = [(f, match[1]) for f, match in selected if match is not None]
+        if not selected:
+            print(f"  ⚠️  {name}: 未找到源文件")
+            continue
+        sources = [open_source(name, f, dataset_dir, args.columnar_cache_dir, args.index_dir) for f, _ in selected]
+        # 经 convert_row 转换，与全量转换使用相同的跳过规则（如消息不足两条）
+        datasets[name] = VirtualDataset(name, sources, [partial(convert_row, converter) for _, converter in selected])
+        print(f"  📦 {name}: {len(datasets[name]):,} 行 ({len(selected)} 个文件)")
+    print(f"  ⏱️  元数据读取耗时 {time.time() - start:.2f}s")
+
+    if args.counts_only or not datasets:
+        return 0
+
+    if args.weights:
+        weights = {}
+        for item in args.weights:
+            name, _, value = item.partition("=")
+            if name in datasets:
+                weights[name] = float(value or 1)
+    elif args.allocation == "proportional":
+        weights = {name: float(len(ds)) for name, ds in datasets.items()}
+    else:
+        weights = {name: 1.0 for name in datasets}
+    quota = allocate(args.total, weights)
+
+    samples: List[dict] = []
+    manifest = {"seed": args.seed, "total": args.total, "datasets": {}}
+    for name, n in quota.items():
+        if n <= 0:
+            continue
+        t0 = time.time()
+        picked = datasets[name].sample(n, seed=args.seed)
+        samples.extend(item for _, item in picked)
+        stats = datasets[name].stats
+        manifest["datasets"][name] = {
+            "requested": n,
+            "sampled": len(picked),
+            "rows": len(datasets[name]),
+            **stats,
+            "row_ids": [row_id for row_id, _ in picked],
+        }
+        flag = "✅" if len(picked) == n else "⚠️ "
+        print(f"  {flag} {name}: {len(picked)}/{n} 条 (读取 {stats['rows_read']} 行，"
+              f"丢弃 {stats['rejected']}) {time.time() - t0:.2f}s")
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(len(samples))
+    output = Path(args.output) if args.output else data_root / "llamafactory" / f"mix_{args.total}.jsonl"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for i in order:
+            f.write(json.dumps(samples[i], ensure_ascii=False) + "\n")
+    manifest_path = output.with_suffix(".manifest.json")
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    # 注册到 dataset_info.json
+    dataset_name = args.dataset_name or output.stem.replace("-", "_").lower()
+    dataset_info_path = data_root / "dataset_info.json"
+    info = json.loads(dataset_info_path.read_text(encoding="utf-8")) if dataset_info_path.exists() else {}
+    try:
+        file_name = str(output.resolve().relative_to(data_root.resolve()))
+    except ValueError:
+        file_name = str(output.resolve())
+    info[dataset_name] = {
+        "file_name": file_name,
+        "formatting": "sharegpt",
+        "columns": {"messages": "messages"},
+        "tags": {
+            "role_tag": "role",
+            "content_tag": "content",
+            "user_tag": "user",
+            "assistant_tag": "assistant"
+        }
+    }
+    with open(dataset_info_path, "w", encoding="utf-8") as f:
+        json.dump(info, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ 共 {len(samples):,} 条，总耗时 {time.time() - start:.2f}s")
+    print(f"📄 输出文件: {output}")
+    print(f"📄 抽样清单: {manifest_path}")
+    print(f"📄 dataset_info.json 已注册: {dataset_name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
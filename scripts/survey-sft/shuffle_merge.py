@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+合并所有已转换的数据集并做外存全局打乱
+流式把记录随机分桶到本地 scratch 盘，再逐桶在内存中打乱并写出分片，内存占用受 --memory-budget-mb 限制
+
+用法:
+    uv run scripts/survey-sft/shuffle_merge.py --scratch-dir /local/scratch --memory-budget-mb 4096
+    uv run scripts/survey-sft/shuffle_merge.py --inputs data/llamafactory/apps.jsonl data/llamafactory/tiny-codes \\
+        --output-format parquet --dataset-name sft_mixture
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from src.data.code_filter import load_keep_mask, sidecar_path
+from src.data.external_shuffle import converted_outputs, external_shuffle, manifest_path
+from src.data.sharded_writer import dataset_info_entry, registrable
+from src.utils.profiling import StageTimer
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="外存全局打乱合并")
+    parser.add_argument("--data-dir", type=str, default=str(project_root / "data"), help="数据根目录（dataset_info.json 所在）")
+    parser.add_argument("--inputs", nargs="+", default=None, help="输入文件或分片目录（默认 data/llamafactory 下全部）")
+    parser.add_argument("--output-dir", type=str, default=None, help="输出目录（默认 data/llamafactory/<dataset-name>）")
+    parser.add_argument("--dataset-name", type=str, default="sft_mixture", help="注册到 dataset_info.json 的名称")
+    parser.add_argument("--scratch-dir", type=str, default=None, help="临时分桶目录，建议使用本地盘（默认系统临时目录）")
+    parser.add_argument("--memory-budget-mb", type=float, default=2048, help="内存预算（MB）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-format", type=str, default="parquet", choices=["parquet", "jsonl", "jsonl.zst"])
+    parser.add_argument("--shard-size-mb", type=float, default=256, help="每个分片的未压缩数据量上限（MB）")
+    parser.add_argument("--code-filter", action="store_true",
+                        help="按 filter_code_samples.py 生成的 sidecar 跳过非 Python / 语法错误的记录")
+    parser.add_argument("--metrics", type=str, default=None, help="保存耗时统计的JSON路径")
+    args = parser.parse_args()
+
+    data_root = Path(args.data_dir)
+    converted_dir = data_root / "llamafactory"
+    output_dir = Path(args.output_dir) if args.output_dir else converted_dir / args.dataset_name
+    inputs = [Path(p) for p in args.inputs] if args.inputs else converted_outputs(converted_dir, exclude=output_dir)
+    if not inputs:
+        print(f"❌ 没有找到输入: {converted_dir}")
+        return 1
+
+    print("=" * 80)
+    print("🔀 外存全局打乱合并")
+    print("=" * 80)
+    for path in inputs:
+        print(f"  📄 {path}")
+
+    keep_masks = None
+    if args.code_filter:
+        keep_masks = [load_keep_mask(path) for path in inputs]
+        for path, keep in zip(inputs, keep_masks):
+            if keep is not None:
+                print(f"  🧹 {path.name}: 按 {sidecar_path(path).name} 保留 {int(keep.sum()):,} / {len(keep):,}")
+
+    timer = StageTimer(seed=args.seed, memory_budget_mb=args.memory_budget_mb, output_format=args.output_format)
+    stats = external_shuffle(
+        inputs,
+        output_dir,
+        scratch_dir=args.scratch_dir,
+        memory_budget=int(args.memory_budget_mb * (1 << 20)),
+        seed=args.seed,
+        fmt=args.output_format,
+        shard_bytes=int(args.shard_size_mb * (1 << 20)),
+        timer=timer,
+        keep_masks=keep_masks,
+    )
+    timer.get("shuffle_write").extra.update(buckets=stats["buckets"], resplit_buckets=stats["resplit_buckets"],
+                                             max_bucket_mb=round(stats["max_bucket_bytes"] / 1024 ** 2, 2))
+    timer.print_summary()
+
+    print(f"\n✅ 共 {stats['records']:,} 条，{len(stats['shards'])} 个分片，"
+          f"磁盘占用 {stats['disk_bytes'] / 1024 ** 2:.1f} MB（{stats['buckets']} 个桶）")
+    if stats["filtered"]:
+        print(f"🧹 按代码过滤结果跳过 {stats['filtered']:,} 条")
+    print(f"📁 输出目录: {output_dir}")
+    print(f"📄 打乱清单: {manifest_path(output_dir)}")
+
+    if registrable(args.output_format):
+        dataset_info_path = data_root / "dataset_info.json"
+        info = json.loads(dataset_info_path.read_text(encoding="utf-8")) if dataset_info_path.exists() else {}
+        try:
+            file_name = str(output_dir.resolve().relative_to(data_root.resolve()))
+        except ValueError:
+            file_name = str(output_dir.resolve())
+        info[args.dataset_name] = dataset_info_entry(file_name)
+        with open(dataset_info_path, "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        print(f"📄 dataset_info.json 已注册: {args.dataset_name}")
+    if args.metrics:
+        timer.write_json(args.metrics)
+        print(f"📄 统计已保存: {args.metrics}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
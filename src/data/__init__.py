@@ -0,0 +1,40 @@
+"""数据模块"""
+
+from .code_filter import build_code_filter, iter_kept_lines, load_keep_mask
+from .columnar_cache import RAW_SOURCE_SPECS, ensure_columnar_cache, iter_cached_records
+from .external_shuffle import converted_outputs, external_shuffle
+from .fixtures import FIXTURE_SPECS, generate_fixtures
+from .packed_dataset import PackedSequenceDataset, PrefetchLoader, packed_array_paths, write_packed_arrays
+from .profiler import HyperLogLog, QuantileSketch, SourceProfile, profile_sources
+from .schema_probe import match_columns, probe_columns
+from .sharded_writer import ShardedWriter, open_output
+from .virtual_dataset import VirtualDataset, open_source
+from .work_queue import SharedWorkQueue
+
+__all__ = [
+    "FIXTURE_SPECS",
+    "HyperLogLog",
+    "PackedSequenceDataset",
+    "PrefetchLoader",
+    "QuantileSketch",
+    "RAW_SOURCE_SPECS",
+    "ShardedWriter",
+    "SharedWorkQueue",
+    "SourceProfile",
+    "VirtualDataset",
+    "build_code_filter",
+    "converted_outputs",
+    "ensure_columnar_cache",
+    "external_shuffle",
+    "generate_fixtures",
+    "iter_cached_records",
+    "iter_kept_lines",
+    "load_keep_mask",
+    "match_columns",
+    "open_output",
+    "open_source",
+    "packed_array_paths",
+    "probe_columns",
+    "profile_sources",
+    "write_packed_arrays",
+]
@@ -0,0 +1,266 @@
+"""
+代码回复过滤
+从助手回复中抽取代码块（Markdown 围栏与 <pre><code>），按围栏标记或启发式规则判断语言，
+在进程池中批量 ast.parse Python 代码块；每条记录的判定原因（1 字节）写入输入旁边的 sidecar 文件，
+下游按 sidecar 跳过被丢弃的记录，不需要改写原始的大 JSONL 文件
+"""
+
+import ast
+import html
+import json
+import os
+import re
+import textwrap
+import warnings
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .external_shuffle import input_files, iter_json_lines
+
+# 判定原因，数组中按下标存储
+REASONS = ("python_ok", "no_code", "non_python", "syntax_error", "bad_record")
+PYTHON_OK, NO_CODE, NON_PYTHON, SYNTAX_ERROR, BAD_RECORD = range(len(REASONS))
+DEFAULT_DROP = ("non_python", "syntax_error", "bad_record")
+
+SIDECAR_SUFFIX = ".codefilter.npz"
+
+_FENCE_RE = re.compile(r"^[ \t]*(`{3,}|~{3,})[ \t]*([\w+#.-]*)[^\n]*\n(.*?)^[ \t]*\1[ \t]*$", re.M | re.S)
+_PRE_RE = re.compile(r"<pre[^>]*>\s*(?:<code[^>]*>)?(.*?)(?:</code>)?\s*</pre>", re.S | re.I)
+
+_PYTHON_TAGS = {"python", "python3", "py", "py3", "python2", "ipython", "pycon", "sage"}
+# 不是程序代码、不影响判定的围栏（命令行、输出、数据）
+_NEUTRAL_TAGS = {"", "text", "txt", "plaintext", "plain", "output", "console", "shell", "sh", "bash", "zsh",
+                 "shell-session", "cmd", "bat", "powershell", "ps", "json", "yaml", "yml", "toml", "ini", "csv",
+                 "xml", "html", "markdown", "md", "diff", "log", "none", "sql", "math", "latex", "tex"}
+
+# 未标注语言时的启发式特征：命中即认为是对应语言
+_LANGUAGE_HINTS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    ("cpp", re.compile(r"#include\s*[<\"]|\bstd::|\bint\s+main\s*\(|\bcout\s*<<|\bcin\s*>>")),
+    ("java", re.compile(r"\bpublic\s+(?:static\s+)?(?:class|void|int)\b|\bSystem\.out\.print|\bimport\s+java\.")),
+    ("csharp", re.compile(r"\busing\s+System\b|\bConsole\.Write|\bnamespace\s+\w+\s*\{")),
+    ("javascript", re.compile(r"\bfunction\s*\w*\s*\([^)]*\)\s*\{|\b(?:const|let|var)\s+\w+\s*=|=>\s*\{|\bconsole\.log\(")),
+    ("php", re.compile(r"<\?php|\$\w+\s*=.*;")),
+    ("go", re.compile(r"^package\s+\w+|\bfunc\s+\w+\s*\(|\bfmt\.Print", re.M)),
+    ("rust", re.compile(r"\bfn\s+\w+\s*\(.*\)\s*(?:->|\{)|\blet\s+mut\b|\bprintln!\(")),
+)
+_PYTHON_HINT = re.compile(r"^\s*(?:def\s+\w+\s*\(.*\)\s*(?:->.*)?:\s*$|class\s+\w+\s*(?:\([^)]*\))?\s*:\s*$|"
+                          r"import\s+[\w.]+(?:\s+as\s+\w+)?\s*$|from\s+[\w.]+\s+import\s|print\(|if\s+__name__\s*==)", re.M)
+
+
+def normalize_tag(tag: str) -> str:
+    tag = tag.strip().lower()
+    if tag in _PYTHON_TAGS:
+        return "python"
+    aliases = {"c++": "cpp", "cc": "cpp", "c": "c", "js": "javascript", "jsx": "javascript", "ts": "typescript",
+               "tsx": "typescript", "c#": "csharp", "cs": "csharp", "golang": "go", "rs": "rust", "rb": "ruby"}
+    return aliases.get(tag, tag)
+
+
+def extract_code_blocks(text: str) -> List[Tuple[str, str]]:
+    """抽取 (语言标记, 代码) 列表；HTML 的 <pre><code> 块没有语言标记"""
+    blocks = [(normalize_tag(m.group(2)), m.group(3)) for m in _FENCE_RE.finditer(text)]
+    if not blocks and "<pre" in text:
+        blocks = [("", html.unescape(re.sub(r"</?\w+[^>]*>", "", m.group(1)))) for m in _PRE_RE.finditer(text)]
+    return blocks
+
+
+def detect_language(code: str) -> str:
+    """
+    未标注代码的语言：先匹配其它语言的强特征，再匹配 Python 特征，都不命中返回空串（视为非程序文本）
+    """
+    for language, pattern in _LANGUAGE_HINTS:
+        if pattern.search(code):
+            # 同时带有明显 Python 语法时以 ast 结果为准（如 Python 中的字符串包含 C 代码）
+            if _PYTHON_HINT.search(code) and _parses(code):
+                return "python"
+            return language
+    return "python" if _PYTHON_HINT.search(code) else ""
+
+
+def _parses(code: str) -> bool:
+    try:
+        ast.parse(code)
+    except (SyntaxError, ValueError, MemoryError, RecursionError):
+        return False
+    return True
+
+
+def _assistant_texts(record: Dict[str, Any]) -> List[str]:
+    """sharegpt 的 messages（role/content）或 conversations（from/value）中的助手回复"""
+    if "messages" in record:
+        return [m.get("content") or "" for m in record["messages"] if m.get("role") == "assistant"]
+    return [m.get("value") or "" for m in record.get("conversations") or [] if m.get("from") in ("gpt", "assistant")]
+
+
+def classify_text(text: str) -> int:
+    blocks = extract_code_blocks(text)
+    if not blocks:
+        # 整个回复就是代码（未加围栏的提交代码）
+        language = detect_language(text)
+        if not language:
+            return NO_CODE
+        blocks = [(language, text)]
+    has_python = False
+    for tag, code in blocks:
+        # 列表项等位置的围栏块整体缩进，去掉公共缩进后再判断
+        code = textwrap.dedent(code)
+        language = tag if tag not in _NEUTRAL_TAGS else (detect_language(code) if not tag else "")
+        if not language:
+            continue
+        if language != "python":
+            return NON_PYTHON
+        if not _parses(code):
+            return SYNTAX_ERROR
+        has_python = True
+    return PYTHON_OK if has_python else NO_CODE
+
+
+def classify_record(line: bytes) -> int:
+    """一条 JSONL 记录的判定：所有助手回复中最差的原因"""
+    try:
+        texts = _assistant_texts(json.loads(line))
+    except (ValueError, AttributeError, TypeError):
+        return BAD_RECORD
+    if not texts:
+        return BAD_RECORD
+    codes = [classify_text(text) for text in texts if isinstance(text, str)]
+    if not codes:
+        return BAD_RECORD
+    # 原因的严重程度：non_python / syntax_error > python_ok > no_code
+    for reason in (NON_PYTHON, SYNTAX_ERROR, PYTHON_OK):
+        if reason in codes:
+            return reason
+    return NO_CODE
+
+
+def classify_batch(lines: List[bytes]) -> np.ndarray:
+    return np.fromiter((classify_record(line) for line in lines), dtype=np.uint8, count=len(lines))
+
+
+def sidecar_path(source: Union[str, Path]) -> Path:
+    """<文件或分片目录>.codefilter.npz（放在旁边：分片目录内只能有同类型的数据文件）"""
+    source = Path(source)
+    return source.with_name(source.name + SIDECAR_SUFFIX)
+
+
+def _signature(files: Sequence[Path]) -> List[List[Any]]:
+    return [[f.name, f.stat().st_size, f.stat().st_mtime_ns] for f in files]
+
+
+def _batches(files: Sequence[Path], batch_lines: int, file_rows: List[int]) -> Iterator[List[bytes]]:
+    batch: List[bytes] = []
+    for f in files:
+        rows = 0
+        for line in iter_json_lines(f):
+            batch.append(line)
+            rows += 1
+            if len(batch) >= batch_lines:
+                yield batch
+                batch = []
+        file_rows.append(rows)
+    if batch:
+        yield batch
+
+
+def build_code_filter(
+    source: Union[str, Path],
+    n_workers: Optional[int] = None,
+    batch_lines: int = 4096,
+    drop: Iterable[str] = DEFAULT_DROP,
+) -> Dict[str, Any]:
+    """
+    对一个转换结果（.jsonl / .jsonl.zst / .parquet 文件或分片目录）逐条判定并写出 sidecar，返回统计
+
+    主进程顺序读取原始行并按 batch_lines 分批，解析、抽取与 ast.parse 在进程池中完成，结果按原顺序拼接
+    """
+    source = Path(source)
+    files = input_files(source)
+    drop = tuple(drop)
+    unknown = set(drop) - set(REASONS)
+    if unknown:
+        raise ValueError(f"未知的过滤原因: {sorted(unknown)}")
+    file_rows: List[int] = []
+    parts: List[np.ndarray] = []
+    n_workers = n_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        # 同时在途的批次数有上限，读取不会跑在判定前面太多（Executor.map 会一次性读完全部输入）
+        max_pending = 2 * n_workers
+        pending: Deque[Future] = deque()
+        for batch in _batches(files, batch_lines, file_rows):
+            pending.append(pool.submit(classify_batch, batch))
+            if len(pending) >= max_pending:
+                parts.append(pending.popleft().result())
+        parts.extend(future.result() for future in pending)
+    reasons = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+    counts = np.bincount(reasons, minlength=len(REASONS))
+    meta = {
+        "reasons": list(REASONS),
+        "drop": list(drop),
+        "files": _signature(files),
+        "file_rows": file_rows,
+        "counts": {name: int(n) for name, n in zip(REASONS, counts)},
+    }
+    path = _write_sidecar(source, reasons, meta)
+    kept = int(keep_mask_from(reasons, drop).sum())
+    return {"sidecar": str(path), "rows": int(len(reasons)), "kept": kept, **meta["counts"]}
+
+
+def _write_sidecar(source: Union[str, Path], reasons: np.ndarray, meta: Dict[str, Any]) -> Path:
+    path = sidecar_path(source)
+    tmp = path.with_name(path.name + ".tmp.npz")
+    np.savez_compressed(tmp, reasons=reasons, meta=np.array(json.dumps(meta)))
+    tmp.replace(path)
+    return path
+
+
+def update_drop(source: Union[str, Path], drop: Iterable[str]) -> bool:
+    """只修改 sidecar 中记录的丢弃原因（判定结果不变，无需重新解析），sidecar 不可用时返回 False"""
+    loaded = load_code_filter(source)
+    if loaded is None:
+        return False
+    reasons, meta = loaded
+    meta["drop"] = list(drop)
+    _write_sidecar(source, reasons, meta)
+    return True
+
+
+def keep_mask_from(reasons: np.ndarray, drop: Iterable[str]) -> np.ndarray:
+    drop_codes = [REASONS.index(name) for name in drop]
+    return ~np.isin(reasons, drop_codes)
+
+
+def load_code_filter(source: Union[str, Path]) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """读取 sidecar，返回 (原因数组, 元信息)；不存在或输入文件已变化时返回 None"""
+    path = sidecar_path(source)
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        reasons = data["reasons"]
+        meta = json.loads(str(data["meta"]))
+    if meta["files"] != _signature(input_files(source)):
+        warnings.warn(f"{source} 在生成过滤结果后已变化，忽略 {path.name}")
+        return None
+    return reasons, meta
+
+
+def load_keep_mask(source: Union[str, Path], drop: Optional[Iterable[str]] = None) -> Optional[np.ndarray]:
+    """按 sidecar 生成保留掩码（与 input_files(source) 依次读出的记录一一对应），drop 默认取生成时的设置"""
+    loaded = load_code_filter(source)
+    if loaded is None:
+        return None
+    reasons, meta = loaded
+    return keep_mask_from(reasons, meta["drop"] if drop is None else drop)
+
+
+def iter_kept_lines(source: Union[str, Path], keep: Optional[np.ndarray] = None) -> Iterator[bytes]:
+    """按保留掩码逐行产出记录；keep 为 None 时产出全部记录"""
+    index = 0
+    for f in input_files(source):
+        for line in iter_json_lines(f):
+            if keep is None or keep[index]:
+                yield line
+            index += 1
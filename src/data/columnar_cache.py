@@ -0,0 +1,233 @@
+"""
+原始 JSONL 数据源的列式缓存
+APPS / commitpackft / ReflectionSeq-GPT / react-code-instructions 以 JSONL 发布，每次转换都要逐行 json.loads，
+APPS 还要再解析一次嵌套的 solutions 字符串。这里一次性把它们转成只保留所需列、嵌套字段已解码的
+zstd parquet，之后的转换、统计、去重直接按列读取；源文件大小或修改时间变化时自动重建
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+CACHE_FORMAT_VERSION = 1
+SOURCE_METADATA_KEY = b"lightsft_source"
+# 构建时的 {"rows", "skipped"}，写在文件 footer 中，读取缓存时可据此报告源文件中的坏行
+BUILD_STATS_KEY = b"lightsft_build_stats"
+
+MESSAGES_TYPE = pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())]))
+
+
+def _decode_json(value: Any) -> Any:
+    """嵌套字段可能已是对象，也可能是 JSON 字符串"""
+    if isinstance(value, str):
+        return json.loads(value) if value.strip() else None
+    return value
+
+
+def _decode_solutions(value: Any) -> Optional[List[str]]:
+    solutions = _decode_json(value)
+    if not solutions:
+        return None
+    return [str(s) for s in solutions]
+
+
+def _decode_messages(value: Any) -> Optional[List[Dict[str, str]]]:
+    """统一为 [{role, content}]，content 为列表时只拼接其中 text 类型的内容"""
+    messages = _decode_json(value)
+    if not messages:
+        return None
+    decoded = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(c.get("content", "") for c in content if c.get("type") == "text")
+        decoded.append({"role": str(msg.get("role", "user")), "content": "" if content is None else str(content)})
+    return decoded
+
+
+@dataclass
+class SourceSpec:
+    """一个 JSONL 数据源保留的列、类型，以及需要预先解码的嵌套字段"""
+
+    schema: pa.Schema
+    decoders: Dict[str, Callable[[Any], Any]] = field(default_factory=dict)
+
+    def decode(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        row = {}
+        for name in self.schema.names:
+            value = record.get(name)
+            if name in self.decoders:
+                value = self.decoders[name](value)
+            elif value is not None and pa.types.is_string(self.schema.field(name).type) and not isinstance(value, str):
+                value = json.dumps(value, ensure_ascii=False)
+            row[name] = value
+        return row
+
+    def fingerprint(self) -> str:
+        return f"{CACHE_FORMAT_VERSION}:{self.schema.to_string(show_schema_metadata=False)}"
+
+
+RAW_SOURCE_SPECS: Dict[str, SourceSpec] = {
+    "apps": SourceSpec(
+        pa.schema([
+            ("problem_id", pa.int64()),
+            ("question", pa.string()),
+            ("solutions", pa.list_(pa.string())),
+            # 执行验证需要原始测试用例，保持 JSON 字符串（输入输出类型不统一）
+            ("input_output", pa.string()),
+            ("difficulty", pa.string()),
+            ("starter_code", pa.string()),
+        ]),
+        {"solutions": _decode_solutions},
+    ),
+    "commitpackft": SourceSpec(
+        pa.schema([
+            ("subject", pa.string()),
+            ("message", pa.string()),
+            ("old_contents", pa.string()),
+            ("new_contents", pa.string()),
+            ("lang", pa.string()),
+        ]),
+    ),
+    "ReflectionSeq-GPT": SourceSpec(pa.schema([("messages", MESSAGES_TYPE)]), {"messages": _decode_messages}),
+    "react-code-instructions": SourceSpec(pa.schema([("messages", MESSAGES_TYPE)]), {"messages": _decode_messages}),
+}
+
+
+def source_signature(path: Union[str, Path], spec: SourceSpec) -> Dict[str, Any]:
+    """源文件签名：大小 + 修改时间 + 缓存格式，任一变化即视为失效"""
+    stat = Path(path).stat()
+    return {"source": str(Path(path).resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "spec": spec.fingerprint()}
+
+
+def cache_path_for(source: Union[str, Path], dataset_dir: Union[str, Path], cache_root: Union[str, Path]) -> Path:
+    """data/<dataset>/data/python/data.jsonl -> <cache_root>/<dataset>/data__python__data.parquet"""
+    source = Path(source)
+    dataset_dir = Path(dataset_dir)
+    try:
+        relative = source.relative_to(dataset_dir)
+    except ValueError:
+        relative = Path(source.name)
+    name = "__".join(relative.with_suffix("").parts) + ".parquet"
+    return Path(cache_root) / dataset_dir.name / name
+
+
+def read_cache_signature(path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    """读取 parquet footer 中记录的源文件签名（只读 footer，不读数据）"""
+    try:
+        metadata = pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    raw = metadata.get(SOURCE_METADATA_KEY)
+    return json.loads(raw) if raw else None
+
+
+def read_cache_build_stats(path: Union[str, Path]) -> Dict[str, int]:
+    """读取构建缓存时记录的行数与跳过的坏行数（旧版本缓存没有该信息时返回空字典）"""
+    try:
+        metadata = pq.read_metadata(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+    raw = metadata.get(BUILD_STATS_KEY)
+    return json.loads(raw) if raw else {}
+
+
+def is_cache_fresh(cache_path: Union[str, Path], source: Union[str, Path], spec: SourceSpec) -> bool:
+    return Path(cache_path).exists() and read_cache_signature(cache_path) == source_signature(source, spec)
+
+
+def build_columnar_cache(
+    source: Union[str, Path],
+    cache_path: Union[str, Path],
+    spec: SourceSpec,
+    batch_rows: int = 50_000,
+    row_group_rows: int = 100_000,
+    compression_level: int = 3,
+) -> Dict[str, int]:
+    """
+    流式把一个 JSONL 文件写成 zstd parquet，返回 {"rows", "skipped"}
+
+    无法解析或类型不符的行会被跳过并计数（与原转换脚本逐行 try/except 的行为一致）
+    """
+    source = Path(source)
+    cache_path = Path(cache_path)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    signature = source_signature(source, spec)
+    schema = spec.schema.with_metadata({SOURCE_METADATA_KEY: json.dumps(signature).encode()})
+    tmp = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    stats = {"rows": 0, "skipped": 0}
+
+    def flush(rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        try:
+            table = pa.Table.from_pylist(rows, schema=schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            # 批量转换失败时逐行定位坏行
+            good = []
+            for row in rows:
+                try:
+                    pa.Table.from_pylist([row], schema=schema)
+                    good.append(row)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+                    stats["skipped"] += 1
+            table = pa.Table.from_pylist(good, schema=schema)
+        writer.write_table(table, row_group_size=row_group_rows)
+        stats["rows"] += table.num_rows
+
+    try:
+        with pq.ParquetWriter(tmp, schema, compression="zstd", compression_level=compression_level) as writer:
+            rows: List[Dict[str, Any]] = []
+            with open(source, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rows.append(spec.decode(json.loads(line)))
+                    except (ValueError, AttributeError, TypeError):
+                        stats["skipped"] += 1
+                        continue
+                    if len(rows) >= batch_rows:
+                        flush(rows)
+                        rows = []
+            flush(rows)
+            writer.add_key_value_metadata({BUILD_STATS_KEY: json.dumps(stats)})
+        os.replace(tmp, cache_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return stats
+
+
+def ensure_columnar_cache(
+    dataset_name: str,
+    source: Union[str, Path],
+    dataset_dir: Union[str, Path],
+    cache_root: Union[str, Path],
+) -> Optional[Path]:
+    """
+    返回源文件对应的最新 parquet 缓存路径，必要时先构建；数据集没有缓存规格时返回 None
+    """
+    spec = RAW_SOURCE_SPECS.get(dataset_name)
+    if spec is None:
+        return None
+    cache_path = cache_path_for(source, dataset_dir, cache_root)
+    if not is_cache_fresh(cache_path, source, spec):
+        build_columnar_cache(source, cache_path, spec)
+    return cache_path
+
+
+def iter_cached_records(
+    path: Union[str, Path],
+    columns: Optional[Sequence[str]] = None,
+    batch_size: int = 10_000,
+) -> Iterator[Dict[str, Any]]:
+    """按批读取缓存并逐行产出字典，只解码需要的列"""
+    parquet = pq.ParquetFile(path)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=list(columns) if columns else None):
+        yield from batch.to_pylist()
@@ -0,0 +1,251 @@
+"""
+外存全局打乱
+两遍流式处理，内存占用受 memory_budget 限制：
+1. scatter：顺序读取所有输入，按固定种子把每条记录随机分到 N 个桶文件（本地 scratch 盘）
+2. shuffle：逐个读入桶文件，在内存中随机排列后写入分片输出
+N 的选取保证单个桶能装入内存预算；个别桶超出预算时对该桶递归再做一次外存打乱
+"""
+
+import io
+import json
+import math
+import shutil
+import tempfile
+from contextlib import nullcontext
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .sharded_writer import SHARD_SUFFIXES, ShardedWriter
+
+# 压缩输入估算未压缩大小时使用的放大系数
+COMPRESSED_RATIO = 5.0
+MAX_BUCKETS = 4096
+
+
+def input_files(path: Union[str, Path]) -> List[Path]:
+    """输入可以是单个 .jsonl / .jsonl.zst / .parquet 文件，也可以是分片目录"""
+    path = Path(path)
+    if path.is_dir():
+        return sorted(p for p in path.iterdir() if p.is_file() and p.name.endswith(tuple(SHARD_SUFFIXES.values())))
+    return [path]
+
+
+def converted_outputs(converted_dir: Union[str, Path], exclude: Optional[Union[str, Path]] = None) -> List[Path]:
+    """
+    data/llamafactory 下的转换结果：*.jsonl 文件与分片目录
+    跳过混合抽样结果（mix_*）、以往的打乱结果（带 .shuffle.json 清单）、临时目录和 exclude 本身
+    """
+    converted_dir = Path(converted_dir)
+    excluded = Path(exclude).resolve() if exclude is not None else None
+    outputs = []
+    for path in sorted(converted_dir.iterdir()):
+        if path.resolve() == excluded or path.name.startswith(("mix_", ".")) or ".tmp-" in path.name:
+            continue
+        if manifest_path(path).exists():
+            continue
+        if path.is_file() and path.suffix == ".jsonl":
+            outputs.append(path)
+        elif path.is_dir() and input_files(path):
+            # 同一数据集同时存在 jsonl 与分片目录时只取一份
+            if not (converted_dir / f"{path.name.removesuffix('-jsonl-zst')}.jsonl").exists():
+                outputs.append(path)
+    return outputs
+
+
+def estimate_raw_bytes(path: Path) -> int:
+    """估算未压缩的 JSONL 字节数，用于决定桶数"""
+    if path.suffix == ".parquet":
+        metadata = pq.ParquetFile(path).metadata
+        return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+    if path.name.endswith(".zst"):
+        return int(path.stat().st_size * COMPRESSED_RATIO)
+    return path.stat().st_size
+
+
+def iter_json_lines(path: Path, buffer_size: int = 1 << 20) -> Iterator[bytes]:
+    """逐行产出 JSON 字节串（JSONL 不做解析，parquet 按 batch 序列化）"""
+    if path.suffix == ".parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=4096):
+            for item in batch.to_pylist():
+                yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+        return
+    if path.name.endswith(".zst"):
+        stream = io.BufferedReader(pa.input_stream(str(path), compression="zstd"), buffer_size=buffer_size)
+    else:
+        stream = open(path, "rb", buffering=buffer_size)
+    with stream:
+        for line in stream:
+            if line.strip():
+                yield line if line.endswith(b"\n") else line + b"\n"
+
+
+def iter_line_range(path: Path, start: int, end: int, buffer_size: int = 1 << 20) -> Iterator[bytes]:
+    """
+    逐行产出未压缩 JSONL 中起始位置落在字节区间 [start, end) 内的非空行；
+    相邻区间首尾相接即可不重不漏地覆盖整个文件，用于把大文件切成多个并行单元
+    """
+    with open(path, "rb", buffering=buffer_size) as f:
+        if start:
+            # 从 start-1 读到换行为止：start 恰好是行首时不会丢掉这一行
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                yield line
+
+
+def choose_buckets(total_bytes: int, memory_budget: int) -> int:
+    """每个桶的预计大小（含对象开销）不超过内存预算的一半"""
+    return max(1, min(MAX_BUCKETS, math.ceil(total_bytes * 2 / max(memory_budget, 1))))
+
+
+def _scatter(
+    lines: Iterator[bytes],
+    bucket_dir: Path,
+    n_buckets: int,
+    rng: np.random.Generator,
+    memory_budget: int,
+    chunk_lines: int = 65536,
+) -> List[Path]:
+    """把记录随机分到 n_buckets 个桶文件，写缓冲总量约为内存预算的 1/4"""
+    bucket_dir.mkdir(parents=True, exist_ok=True)
+    paths = [bucket_dir / f"bucket-{i:05d}.jsonl" for i in range(n_buckets)]
+    buffering = max(64 << 10, min(8 << 20, memory_budget // (4 * n_buckets)))
+    files = [open(p, "wb", buffering=buffering) for p in paths]
+    try:
+        chunk: List[bytes] = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_lines:
+                for b, item in zip(rng.integers(0, n_buckets, size=len(chunk)).tolist(), chunk):
+                    files[b].write(item)
+                chunk = []
+        if chunk:
+            for b, item in zip(rng.integers(0, n_buckets, size=len(chunk)).tolist(), chunk):
+                files[b].write(item)
+    finally:
+        for f in files:
+            f.close()
+    return paths
+
+
+def _shuffle_bucket(
+    path: Path,
+    writer: ShardedWriter,
+    rng: np.random.Generator,
+    memory_budget: int,
+    stats: Dict[str, Any],
+    depth: int = 0,
+) -> None:
+    """桶能装入内存时整体打乱后写出，否则对该桶递归外存打乱"""
+    size = path.stat().st_size
+    if size * 2 > memory_budget and depth < 3:
+        stats["resplit_buckets"] += 1
+        sub_dir = path.with_name(path.stem + ".split")
+        n_sub = choose_buckets(size, memory_budget)
+        sub_paths = _scatter(iter_json_lines(path), sub_dir, max(n_sub, 2), rng, memory_budget)
+        path.unlink()
+        for sub in sub_paths:
+            _shuffle_bucket(sub, writer, rng, memory_budget, stats, depth + 1)
+        shutil.rmtree(sub_dir, ignore_errors=True)
+        return
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    path.unlink()
+    for i in rng.permutation(len(lines)).tolist():
+        writer.write_line(lines[i])
+    stats["max_bucket_bytes"] = max(stats["max_bucket_bytes"], size)
+
+
+def external_shuffle(
+    inputs: Sequence[Union[str, Path]],
+    output_dir: Union[str, Path],
+    scratch_dir: Optional[Union[str, Path]] = None,
+    memory_budget: int = 2 << 30,
+    seed: int = 42,
+    fmt: str = "parquet",
+    shard_bytes: int = 256 << 20,
+    timer: Any = None,
+    keep_masks: Optional[Sequence[Optional[np.ndarray]]] = None,
+) -> Dict[str, Any]:
+    """
+    把所有输入合并并全局打乱，写成 output_dir 下的分片，返回统计信息
+
+    相同的输入（顺序相同）与种子得到完全相同的输出；timer 为可选的 StageTimer，记录两个阶段的耗时与吞吐；
+    keep_masks 与 inputs 一一对应（如 code_filter 的 sidecar），掩码为 False 的记录在 scatter 时跳过
+    """
+    per_input = [input_files(path) for path in inputs]
+    files = [f for group in per_input for f in group]
+    if not files:
+        raise ValueError("没有找到可合并的输入文件")
+    total_bytes = sum(estimate_raw_bytes(f) for f in files)
+    n_buckets = choose_buckets(total_bytes, memory_budget)
+    rng = np.random.default_rng(seed)
+    stats: Dict[str, Any] = {
+        "inputs": [str(f) for f in files],
+        "estimated_bytes": total_bytes,
+        "buckets": n_buckets,
+        "resplit_buckets": 0,
+        "max_bucket_bytes": 0,
+        "seed": seed,
+        "filtered": 0,
+    }
+
+    def stage(name: str) -> Any:
+        return timer.stage(name) if timer is not None else nullcontext()
+
+    scratch = Path(tempfile.mkdtemp(prefix="lightsft-shuffle-", dir=scratch_dir))
+    try:
+        with stage("scatter") as m:
+            counted = {"lines": 0, "bytes": 0}
+
+            def lines() -> Iterator[bytes]:
+                for i, group in enumerate(per_input):
+                    keep = keep_masks[i] if keep_masks is not None else None
+                    for index, line in enumerate(chain.from_iterable(iter_json_lines(f) for f in group)):
+                        if keep is not None and not keep[index]:
+                            stats["filtered"] += 1
+                            continue
+                        counted["lines"] += 1
+                        counted["bytes"] += len(line)
+                        yield line
+
+            buckets = _scatter(lines(), scratch, n_buckets, rng, memory_budget)
+            if m is not None:
+                m.add_count("records", counted["lines"])
+                m.add_count("bytes", counted["bytes"])
+
+        with stage("shuffle_write") as m:
+            # parquet 按 row group 缓冲 Python 对象，缓冲量计入内存预算
+            writer = ShardedWriter(output_dir, fmt, shard_bytes=shard_bytes,
+                                   row_group_bytes=max(1 << 20, memory_budget // 8))
+            with writer:
+                for bucket in buckets:
+                    _shuffle_bucket(bucket, writer, rng, memory_budget, stats)
+            if m is not None:
+                m.add_count("records", writer.rows)
+                m.add_count("bytes", writer.raw_bytes)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    stats.update(records=writer.rows, raw_bytes=writer.raw_bytes, shards=[str(p) for p in writer.shards],
+                 disk_bytes=writer.disk_bytes)
+    # 清单写在输出目录旁边：LLaMA-Factory 要求目录内文件类型一致
+    manifest_path(output_dir).write_text(json.dumps(stats, ensure_ascii=False, indent=2), encoding="utf-8")
+    return stats
+
+
+def manifest_path(output_dir: Union[str, Path]) -> Path:
+    """打乱结果的清单（输入、种子、桶数、分片）：<output_dir>.shuffle.json"""
+    output_dir = Path(output_dir)
+    return output_dir.with_name(output_dir.name + ".shuffle.json")
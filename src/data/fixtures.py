@@ -0,0 +1,346 @@
+"""
+转换脚本基准测试用的合成数据源
+按 DATASET_CONVERSION_SPEC.md 中各数据集的原始结构（字段名、嵌套类型、JSON 字符串字段、文件布局）
+离线生成 parquet / JSONL，规模可从 1K 到 1M 行；内容由固定种子决定，相同参数得到逐字节相同的文件。
+少量“脏”行（必需字段为空、无法解析的 JSONL 行）用于覆盖转换脚本的跳过逻辑
+"""
+
+import json
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FIXTURE_VERSION = 1
+MANIFEST_NAME = "fixtures.json"
+
+_WORDS = (
+    "array string integer function return value input output list dictionary loop index sum maximum minimum "
+    "sort query table column request response server client error exception test case binary tree graph node "
+    "edge path cost number element subarray prefix modulo prime divisor matrix row grid character word count"
+).split()
+
+_PYTHON_TEMPLATES = (
+    "def {name}(nums):\n    total = 0\n    for x in nums:\n        total += x * {k}\n    return total\n",
+    "n = int(input())\na = list(map(int, input().split()))\nprint(sum(a) % {k})\n",
+    "import sys\n\ndef {name}():\n    data = sys.stdin.read().split()\n    print(len(data) + {k})\n\n{name}()\n",
+    "class Solution:\n    def {name}(self, s: str) -> int:\n        return len(set(s)) * {k}\n",
+)
+_CPP_TEMPLATE = "#include <bits/stdc++.h>\nusing namespace std;\nint main() {{ int n; cin >> n; cout << n * {k} << endl; }}\n"
+
+Row = Dict[str, Any]
+
+
+class _Text:
+    """预先生成文本片段池，逐行只做随机挑选与拼接，生成百万行时开销很小"""
+
+    def __init__(self, rng: random.Random, pool_size: int = 2048):
+        self.rng = rng
+        self.sentences = [
+            " ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+            for _ in range(pool_size)
+        ]
+
+    def text(self, i: int, min_sentences: int = 1, max_sentences: int = 8) -> str:
+        n = self.rng.randint(min_sentences, max_sentences)
+        return " ".join(self.rng.choice(self.sentences) for _ in range(n)) + f" (#{i})"
+
+    def code(self, i: int, cpp_ratio: float = 0.0) -> str:
+        if self.rng.random() < cpp_ratio:
+            return _CPP_TEMPLATE.format(k=i % 97 + 1)
+        return self.rng.choice(_PYTHON_TEMPLATES).format(name=f"solve_{i % 1000}", k=i % 97 + 1)
+
+
+@dataclass(frozen=True)
+class FixtureSpec:
+    """
+    一个数据集的合成规格
+
+    files: 相对数据集目录的文件路径，行按顺序轮流写入各文件（可用不同 row 函数模拟列结构不同的文件）
+    row: (行号, 文本生成器, 是否为脏行) -> 原始记录
+    schema: parquet 文件的显式 schema（避免整批为空值时类型推断不一致），JSONL 为 None
+    """
+
+    files: Tuple[str, ...]
+    row: Union[Callable[[int, _Text, bool], Row], Tuple[Callable[[int, _Text, bool], Row], ...]]
+    schema: Union[Optional[pa.Schema], Tuple[pa.Schema, ...]] = None
+
+    @property
+    def is_jsonl(self) -> bool:
+        return self.files[0].endswith(".jsonl")
+
+    def row_fn(self, file_index: int) -> Callable[[int, _Text, bool], Row]:
+        return self.row[file_index] if isinstance(self.row, tuple) else self.row
+
+    def file_schema(self, file_index: int) -> Optional[pa.Schema]:
+        return self.schema[file_index] if isinstance(self.schema, tuple) else self.schema
+
+
+_STR = pa.string()
+_CONVERSATIONS = pa.list_(pa.struct([("from", _STR), ("value", _STR)]))
+_MESSAGES = pa.list_(pa.struct([("role", _STR), ("content", _STR)]))
+_TESTS = pa.struct([("input", pa.list_(_STR)), ("output", pa.list_(_STR))])
+
+
+def _apps(i: int, t: _Text, dirty: bool) -> Row:
+    solutions = [] if dirty else [t.code(i) for _ in range(t.rng.randint(1, 3))]
+    io = {"inputs": [f"{i % 7}\n1 2 3\n"], "outputs": [f"{i % 5}\n"]}
+    return {"id": i, "question": t.text(i, 3, 12), "solutions": json.dumps(solutions), "input_output": json.dumps(io),
+            "difficulty": t.rng.choice(["interview", "competition", "introductory"]),
+            "url": f"https://codeforces.com/problemset/problem/{i}/A", "starter_code": ""}
+
+
+def _tiny_codes(i: int, t: _Text, dirty: bool) -> Row:
+    return {"prompt": t.text(i, 1, 4), "response": "" if dirty else t.text(i, 1, 3) + "\n\n```python\n" + t.code(i) + "```",
+            "main_topic": t.rng.choice(_WORDS), "subtopic": t.rng.choice(_WORDS),
+            "programming_language": t.rng.choice(["Python", "JavaScript", "Rust"])}
+
+
+def _commitpackft(i: int, t: _Text, dirty: bool) -> Row:
+    return {"commit": f"{i:040x}", "old_file": f"src/mod_{i}.py", "new_file": f"src/mod_{i}.py",
+            "old_contents": t.code(i) if i % 3 else "", "new_contents": "" if dirty else t.code(i + 1),
+            "subject": t.text(i, 1, 1), "message": t.text(i, 1, 3), "lang": "Python", "license": "mit",
+            "repos": f"user/repo_{i % 100}"}
+
+
+def _codereview_conversations(i: int, t: _Text, dirty: bool) -> Row:
+    turns = [] if dirty else [{"from": "human" if k % 2 == 0 else "gpt", "value": t.text(i, 2, 6)}
+                              for k in range(2 * t.rng.randint(1, 2))]
+    return {"instruction": t.text(i, 2, 5), "completion": t.text(i, 2, 6), "conversations": turns}
+
+
+def _codereview_instruction(i: int, t: _Text, dirty: bool) -> Row:
+    return {"instruction": t.text(i, 2, 5), "completion": "" if dirty else t.text(i, 2, 6)}
+
+
+def _code_contests(i: int, t: _Text, dirty: bool) -> Row:
+    n = t.rng.randint(1, 4)
+    languages = [t.rng.choice([2, 3, 3]) for _ in range(n)]
+    solutions = [t.code(i, cpp_ratio=1.0) if lang == 2 else t.code(i) for lang in languages]
+    tests = {"input": [f"{i % 11}\n"], "output": [f"{i % 13}\n"]}
+    return {"name": f"Problem {i}", "description": "" if dirty else t.text(i, 4, 14),
+            "public_tests": tests, "private_tests": tests, "generated_tests": {"input": [], "output": []},
+            "source": t.rng.choice(["CODEFORCES", "ATCODER"]), "difficulty": t.rng.randint(0, 20),
+            "solutions": {"language": languages, "solution": solutions}}
+
+
+def _reflection_seq(i: int, t: _Text, dirty: bool) -> Row:
+    messages = [
+        {"role": "user", "content": [{"type": "text", "content": t.text(i, 2, 6)}]},
+        {"role": "assistant", "content": [{"type": "text", "content": "" if dirty else t.text(i, 3, 10)}]},
+    ]
+    return {"messages": json.dumps(messages), "type": "reflection"}
+
+
+def _codeforces(i: int, t: _Text, dirty: bool) -> Row:
+    formatted = i % 2 == 0
+    return {"contestId": i % 2000, "name": f"Problem {i}", "problem-description": t.text(i, 3, 10),
+            "input-specification": t.text(i, 1, 2), "output-specification": t.text(i, 1, 2),
+            "demo-input": "1\n", "demo-output": "1\n", "code": None if dirty else t.code(i),
+            "prompt": t.text(i, 3, 10) if formatted and not dirty else None,
+            "response": "```python\n" + t.code(i) + "```" if formatted and not dirty else None,
+            "verdict": "OK", "rating": 800 + (i % 20) * 100}
+
+
+def _self_oss(i: int, t: _Text, dirty: bool) -> Row:
+    return {"fingerprint": None, "sha1": f"{i:040x}", "seed": t.code(i), "instruction": t.text(i, 1, 4),
+            "response": "" if dirty else t.code(i + 7), "concepts": [t.rng.choice(_WORDS) for _ in range(3)],
+            "prompt": t.text(i, 2, 5), "id": i}
+
+
+def _gold_standard(i: int, t: _Text, dirty: bool) -> Row:
+    return {"source": "stackoverflow", "task_type": "qa", "in_source_id": f"q_{i}", "prompt": t.text(i, 2, 8),
+            "gold_standard_solution": "" if dirty else t.text(i, 2, 8), "verification_info": "{}",
+            "metadata": "{}", "problem_id": f"p_{i}"}
+
+
+def _stack_exchange_paired(i: int, t: _Text, dirty: bool) -> Row:
+    return {"qid": i, "question": "" if dirty else t.text(i, 2, 8), "date": "2023/01/01",
+            "metadata": [f"https://stackoverflow.com/questions/{i}"], "response_j": t.text(i, 2, 8),
+            "response_k": t.text(i, 1, 4)}
+
+
+def _react(i: int, t: _Text, dirty: bool) -> Row:
+    messages = [{"role": "system", "content": t.text(i, 1, 2)}, {"role": "user", "content": t.text(i, 1, 4)}]
+    if not dirty:
+        messages.append({"role": "assistant", "content": "import React from 'react';\n" + t.text(i, 2, 8)})
+    else:
+        messages = messages[:1]
+    return {"created_at": "2024-01-01", "model": "model", "messages": messages, "recommended": True, "upvoted": i % 2 == 0}
+
+
+def _synthetic(i: int, t: _Text, dirty: bool) -> Row:
+    messages = [{"role": "user", "content": t.text(i, 1, 4)},
+                {"role": "assistant", "content": "" if dirty else t.code(i)}]
+    return {"problem_id": f"syn_{i}", "task_type": "code_generation", "reward": round(t.rng.random(), 3),
+            "messages": messages}
+
+
+def _sql(i: int, t: _Text, dirty: bool) -> Row:
+    if dirty:
+        return {"text": t.text(i, 1, 2)}
+    return {"text": f"[INST] Write SQLite query to answer the following question given the database schema. "
+                    f"Schema: CREATE TABLE table_{i % 500} (id INT, name TEXT) Question: {t.text(i, 1, 2)} [/INST] "
+                    f"Here is the SQLite query to answer to the question: SELECT name FROM table_{i % 500} WHERE id = {i}"}
+
+
+def _magpie_conversations(i: int, t: _Text, dirty: bool) -> Row:
+    row = _magpie_instruction(i, t, False)
+    row["conversations"] = [] if dirty else [{"from": "human", "value": row["instruction"]},
+                                             {"from": "gpt", "value": row["response"]}]
+    return row
+
+
+def _magpie_instruction(i: int, t: _Text, dirty: bool) -> Row:
+    return {"uuid": f"{i:032x}", "model": "Qwen/Qwen2.5-Coder-32B-Instruct", "instruction": t.text(i, 1, 4),
+            "response": "" if dirty else t.text(i, 1, 3) + "\n```python\n" + t.code(i) + "```",
+            "task_category": "Coding & Debugging", "difficulty": t.rng.choice(["easy", "medium", "hard"]),
+            "reward_model": round(t.rng.random(), 3), "language": "EN"}
+
+
+_MAGPIE_BASE = [("uuid", _STR), ("model", _STR), ("instruction", _STR), ("response", _STR), ("task_category", _STR),
+                ("difficulty", _STR), ("reward_model", pa.float64()), ("language", _STR)]
+_GOLD_SCHEMA = pa.schema([(name, _STR) for name in ("source", "task_type", "in_source_id", "prompt",
+                                                     "gold_standard_solution", "verification_info", "metadata",
+                                                     "problem_id")])
+
+FIXTURE_SPECS: Dict[str, FixtureSpec] = {
+    "apps": FixtureSpec(("train.jsonl",), _apps),
+    "tiny-codes": FixtureSpec(
+        ("part_00000.parquet", "part_00001.parquet"), _tiny_codes,
+        pa.schema([(name, _STR) for name in ("prompt", "response", "main_topic", "subtopic", "programming_language")]),
+    ),
+    "commitpackft": FixtureSpec(("data/python/data.jsonl", "data/javascript/data.jsonl"), _commitpackft),
+    "stackexchange_codereview": FixtureSpec(
+        ("data/train-00000.parquet", "data/train-00001.parquet"),
+        (_codereview_conversations, _codereview_instruction),
+        (pa.schema([("instruction", _STR), ("completion", _STR), ("conversations", _CONVERSATIONS)]),
+         pa.schema([("instruction", _STR), ("completion", _STR)])),
+    ),
+    "code_contests": FixtureSpec(
+        ("data/train-00000.parquet",), _code_contests,
+        pa.schema([("name", _STR), ("description", _STR), ("public_tests", _TESTS), ("private_tests", _TESTS),
+                   ("generated_tests", _TESTS), ("source", _STR), ("difficulty", pa.int64()),
+                   ("solutions", pa.struct([("language", pa.list_(pa.int64())), ("solution", pa.list_(_STR))]))]),
+    ),
+    "ReflectionSeq-GPT": FixtureSpec(("train.jsonl",), _reflection_seq),
+    "Codeforces-Python-Submissions": FixtureSpec(
+        ("data/train-00000.parquet",), _codeforces,
+        pa.schema([("contestId", pa.int64()), ("name", _STR), ("problem-description", _STR),
+                   ("input-specification", _STR), ("output-specification", _STR), ("demo-input", _STR),
+                   ("demo-output", _STR), ("code", _STR), ("prompt", _STR), ("response", _STR), ("verdict", _STR),
+                   ("rating", pa.int64())]),
+    ),
+    "self-oss-instruct-sc2-exec-filter-50k": FixtureSpec(
+        ("data/train-00000-of-00001.parquet",), _self_oss,
+        pa.schema([("fingerprint", _STR), ("sha1", _STR), ("seed", _STR), ("instruction", _STR), ("response", _STR),
+                   ("concepts", pa.list_(_STR)), ("prompt", _STR), ("id", pa.int64())]),
+    ),
+    "real-world-swe-problems": FixtureSpec(("data/train-00000-of-00001.parquet",), _gold_standard, _GOLD_SCHEMA),
+    "stack-exchange-paired": FixtureSpec(
+        ("data/reward/train-00000.parquet", "data/evaluation/test-00000.parquet"), _stack_exchange_paired,
+        pa.schema([("qid", pa.int64()), ("question", _STR), ("date", _STR), ("metadata", pa.list_(_STR)),
+                   ("response_j", _STR), ("response_k", _STR)]),
+    ),
+    "react-code-instructions": FixtureSpec(("data/train-00000.jsonl",), _react),
+    "stackexchange-question-answering": FixtureSpec(("data/train-00000.parquet",), _gold_standard, _GOLD_SCHEMA),
+    "SYNTHETIC-2-SFT-verified": FixtureSpec(
+        ("data/train-00000.parquet",), _synthetic,
+        pa.schema([("problem_id", _STR), ("task_type", _STR), ("reward", pa.float64()), ("messages", _MESSAGES)]),
+    ),
+    "sql-create-context-instruction": FixtureSpec(("data/train-00000.parquet",), _sql, pa.schema([("text", _STR)])),
+    "Magpie-Qwen2.5-Coder-Pro-300K-v0.1": FixtureSpec(
+        ("data/train-00000.parquet", "data/train-00001.parquet"),
+        (_magpie_conversations, _magpie_instruction),
+        (pa.schema(_MAGPIE_BASE + [("conversations", _CONVERSATIONS)]), pa.schema(_MAGPIE_BASE)),
+    ),
+}
+
+
+def _dataset_seed(seed: int, dataset_name: str) -> int:
+    # 不使用 hash()：字符串哈希按进程随机化
+    return seed * 1_000_003 + sum((k + 1) * ord(c) for k, c in enumerate(dataset_name))
+
+
+def write_fixture(
+    dataset_name: str,
+    dataset_dir: Union[str, Path],
+    rows: int,
+    seed: int = 0,
+    dirty_ratio: float = 0.01,
+    batch_rows: int = 10_000,
+) -> Dict[str, Any]:
+    """为一个数据集生成 rows 行合成数据（各文件轮流分配），返回 {"rows", "dirty", "bad_lines", "files"}"""
+    spec = FIXTURE_SPECS[dataset_name]
+    dataset_dir = Path(dataset_dir)
+    rng = random.Random(_dataset_seed(seed, dataset_name))
+    text = _Text(rng)
+    n_files = len(spec.files)
+    stats = {"rows": rows, "dirty": 0, "bad_lines": 0, "files": list(spec.files)}
+
+    for file_index, relative in enumerate(spec.files):
+        path = dataset_dir / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        row_fn = spec.row_fn(file_index)
+        indices = range(file_index, rows, n_files)
+        if spec.is_jsonl:
+            with open(path, "w", encoding="utf-8") as f:
+                for i in indices:
+                    dirty = rng.random() < dirty_ratio
+                    stats["dirty"] += dirty
+                    if dirty and rng.random() < 0.5:
+                        # 截断的 JSON 行
+                        f.write(json.dumps(row_fn(i, text, False), ensure_ascii=False)[:40] + "\n")
+                        stats["bad_lines"] += 1
+                        continue
+                    f.write(json.dumps(row_fn(i, text, dirty), ensure_ascii=False) + "\n")
+            continue
+        schema = spec.file_schema(file_index)
+        with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+            batch: List[Row] = []
+            for i in indices:
+                dirty = rng.random() < dirty_ratio
+                stats["dirty"] += dirty
+                batch.append(row_fn(i, text, dirty))
+                if len(batch) >= batch_rows:
+                    writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                    batch = []
+            if batch or not indices:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+    return stats
+
+
+def fixture_root(cache_dir: Union[str, Path], rows: int, seed: int) -> Path:
+    return Path(cache_dir) / f"rows{rows}-seed{seed}-v{FIXTURE_VERSION}"
+
+
+def generate_fixtures(
+    root: Union[str, Path],
+    rows: int,
+    datasets: Optional[Iterable[str]] = None,
+    seed: int = 0,
+    dirty_ratio: float = 0.01,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    在 root 下按 data/<dataset>/ 的布局生成全部（或指定）数据集，清单写入 root/fixtures.json；
+    参数相同且文件已存在时直接复用
+    """
+    root = Path(root)
+    manifest_path = root / MANIFEST_NAME
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8")) if manifest_path.exists() else {}
+    params = {"rows": rows, "seed": seed, "dirty_ratio": dirty_ratio, "version": FIXTURE_VERSION}
+    if manifest.get("params") != params:
+        manifest = {"params": params, "datasets": {}}
+    for name in datasets or FIXTURE_SPECS:
+        existing = manifest["datasets"].get(name)
+        if not force and existing and all((root / name / f).exists() for f in existing["files"]):
+            continue
+        manifest["datasets"][name] = write_fixture(name, root / name, rows, seed, dirty_ratio)
+        root.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
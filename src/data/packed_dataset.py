@@ -0,0 +1,305 @@
+"""
+内存映射的打包序列数据集
+processed_data_path（如 data/processed/sft_data.npy）保存所有样本首尾相接的 token，
+同目录下的 sft_data_loss_mask.npy 与 sft_data_offsets.npy 分别保存逐 token 的 loss 掩码和样本边界。
+三个数组都以 mmap_mode='r' 打开：同一节点上的 8 个 rank 共享页缓存，不会各自 np.load 一份完整拷贝
+"""
+
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+IGNORE_INDEX = -100
+ARRAY_SUFFIXES = {"tokens": "", "loss_mask": "_loss_mask", "offsets": "_offsets"}
+
+
+def packed_array_paths(path: Union[str, Path]) -> Dict[str, Path]:
+    """processed_data_path -> token / loss 掩码 / 样本边界 三个 .npy 文件路径"""
+    path = Path(path)
+    stem = path.name[:-4] if path.name.endswith(".npy") else path.name
+    return {key: path.with_name(f"{stem}{suffix}.npy") for key, suffix in ARRAY_SUFFIXES.items()}
+
+
+def write_packed_arrays(
+    path: Union[str, Path],
+    samples: Iterable[Tuple[Sequence[int], Sequence[int]]],
+    dtype: Any = np.int32,
+    chunk_tokens: int = 1 << 22,
+) -> int:
+    """
+    把 (input_ids, loss_mask) 样本流写成三个 .npy 文件，返回样本数
+
+    token 先流式写入临时二进制文件，再分块拷贝进 .npy，内存占用与数据集大小无关
+    """
+    paths = packed_array_paths(path)
+    paths["tokens"].parent.mkdir(parents=True, exist_ok=True)
+    raw = {key: paths[key].with_name(paths[key].name + f".{os.getpid()}.bin") for key in ("tokens", "loss_mask")}
+    offsets = [0]
+    try:
+        with open(raw["tokens"], "wb") as ftok, open(raw["loss_mask"], "wb") as fmask:
+            for input_ids, loss_mask in samples:
+                if len(input_ids) != len(loss_mask):
+                    raise ValueError(f"样本 {len(offsets) - 1} 的 input_ids 与 loss_mask 长度不一致")
+                np.asarray(input_ids, dtype=dtype).tofile(ftok)
+                np.asarray(loss_mask, dtype=np.uint8).tofile(fmask)
+                offsets.append(offsets[-1] + len(input_ids))
+
+        total = offsets[-1]
+        for key, array_dtype in (("tokens", dtype), ("loss_mask", np.uint8)):
+            source = np.memmap(raw[key], dtype=array_dtype, mode="r", shape=(total,)) if total else np.zeros(0, array_dtype)
+            tmp = paths[key].with_name(paths[key].name + ".tmp.npy")
+            target = np.lib.format.open_memmap(tmp, mode="w+", dtype=array_dtype, shape=(total,))
+            for start in range(0, total, chunk_tokens):
+                target[start:start + chunk_tokens] = source[start:start + chunk_tokens]
+            target.flush()
+            del target, source
+            os.replace(tmp, paths[key])
+        np.save(paths["offsets"], np.asarray(offsets, dtype=np.int64))
+    finally:
+        for file in raw.values():
+            file.unlink(missing_ok=True)
+    return len(offsets) - 1
+
+
+class PackedSequenceDataset:
+    """
+    按样本索引读取的数据集（实现 __len__ / __getitem__，可直接交给 torch DataLoader）
+
+    数组在首次访问时才打开，fork 或 spawn 出的 DataLoader worker 各自重新映射，不会拷贝数据
+    """
+
+    def __init__(self, path: Union[str, Path], max_length: Optional[int] = None):
+        self.path = Path(path)
+        self.max_length = max_length
+        self.paths = packed_array_paths(self.path)
+        missing = [str(p) for p in self.paths.values() if not p.exists()]
+        if missing:
+            raise FileNotFoundError(f"打包数据文件不存在: {', '.join(missing)}")
+        self._arrays: Optional[Dict[str, np.ndarray]] = None
+        self._lengths: Optional[np.ndarray] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        if self._arrays is None:
+            self._arrays = {key: np.load(p, mmap_mode="r") for key, p in self.paths.items()}
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self.arrays["offsets"]) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """每个样本截断后的 token 数"""
+        if self._lengths is None:
+            lengths = np.diff(self.arrays["offsets"])
+            if self.max_length:
+                lengths = np.minimum(lengths, self.max_length)
+            self._lengths = lengths
+        return self._lengths
+
+    def __getitem__(self, idx: int) -> Dict[str, np.ndarray]:
+        offsets = self.arrays["offsets"]
+        start = int(offsets[idx])
+        end = int(offsets[idx + 1])
+        if self.max_length:
+            end = min(end, start + self.max_length)
+        input_ids = np.asarray(self.arrays["tokens"][start:end], dtype=np.int64)
+        mask = np.asarray(self.arrays["loss_mask"][start:end], dtype=bool)
+        return {"input_ids": input_ids, "labels": np.where(mask, input_ids, IGNORE_INDEX)}
+
+
+def plan_rows(
+    lengths: np.ndarray,
+    indices: Sequence[int],
+    packed: bool,
+    max_length: Optional[int],
+) -> List[List[int]]:
+    """
+    把样本索引安排成若干行：非打包模式每行一个样本；
+    打包模式按顺序把样本拼进当前行，放不下时另起一行（每行不超过 max_length）
+    """
+    if not packed:
+        return [[int(i)] for i in indices]
+    if not max_length:
+        raise ValueError("打包模式需要 max_length")
+    rows: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for i in indices:
+        length = int(lengths[i])
+        if current and used + length > max_length:
+            rows.append(current)
+            current, used = [], 0
+        current.append(int(i))
+        used += length
+    if current:
+        rows.append(current)
+    return rows
+
+
+def collate_rows(
+    dataset: PackedSequenceDataset,
+    rows: List[List[int]],
+    pad_token_id: int = 0,
+    pad_to_multiple_of: int = 8,
+) -> Dict[str, np.ndarray]:
+    """
+    把若干行组装成一个 micro-batch，补齐到最长行（向上取整到 pad_to_multiple_of）
+
+    打包行内 position_ids 在每个样本处重新从 0 开始，且每个样本首 token 的 label 置为
+    IGNORE_INDEX，避免模型学习“上一个样本末尾 -> 下一个样本开头”的跨样本预测
+    """
+    samples = [[dataset[i] for i in row] for row in rows]
+    row_lengths = [sum(len(s["input_ids"]) for s in row) for row in samples]
+    width = max(row_lengths) if row_lengths else 0
+    if pad_to_multiple_of:
+        width = -(-width // pad_to_multiple_of) * pad_to_multiple_of
+
+    batch = {
+        "input_ids": np.full((len(rows), width), pad_token_id, dtype=np.int64),
+        "labels": np.full((len(rows), width), IGNORE_INDEX, dtype=np.int64),
+        "attention_mask": np.zeros((len(rows), width), dtype=np.int64),
+        "position_ids": np.zeros((len(rows), width), dtype=np.int64),
+    }
+    for r, row in enumerate(samples):
+        pos = 0
+        for k, sample in enumerate(row):
+            n = len(sample["input_ids"])
+            batch["input_ids"][r, pos:pos + n] = sample["input_ids"]
+            batch["labels"][r, pos:pos + n] = sample["labels"]
+            if k > 0:
+                batch["labels"][r, pos] = IGNORE_INDEX
+            batch["attention_mask"][r, pos:pos + n] = 1
+            batch["position_ids"][r, pos:pos + n] = np.arange(n)
+            pos += n
+    return batch
+
+
+class PrefetchLoader:
+    """
+    micro-batch 迭代器：后台线程读取 mmap、组装批次并放入锁页内存，训练主线程只需
+    .to(device, non_blocking=True)
+
+    用法:
+        loader = PrefetchLoader(dataset, micro_batch_size=16, packed=True, max_length=1280,
+                                rank=rank, world_size=world_size)
+        for epoch in range(num_epochs):
+            loader.set_epoch(epoch)
+            for batch in loader:
+                ...
+    """
+
+    def __init__(
+        self,
+        dataset: PackedSequenceDataset,
+        micro_batch_size: int,
+        packed: bool = False,
+        max_length: Optional[int] = None,
+        pad_token_id: int = 0,
+        shuffle: bool = True,
+        seed: int = 42,
+        rank: int = 0,
+        world_size: int = 1,
+        prefetch: int = 4,
+        pin_memory: Optional[bool] = None,
+        as_tensors: bool = True,
+    ):
+        self.dataset = dataset
+        self.micro_batch_size = micro_batch_size
+        self.packed = packed
+        self.max_length = max_length or dataset.max_length
+        self.pad_token_id = pad_token_id
+        self.shuffle = shuffle
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.prefetch = prefetch
+        self.pin_memory = pin_memory
+        self.as_tensors = as_tensors
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def plan(self) -> List[List[List[int]]]:
+        """
+        本 rank 在当前 epoch 的批次计划（批次 -> 行 -> 样本索引）
+
+        所有 rank 用同一个种子生成相同的全局计划，再按批次轮流分配并截断到相同数量，
+        保证各 rank 每个 epoch 的步数一致
+        """
+        indices = np.arange(len(self.dataset))
+        if self.shuffle:
+            np.random.default_rng(self.seed + self.epoch).shuffle(indices)
+        rows = plan_rows(self.dataset.lengths, indices, self.packed, self.max_length)
+        batches = [rows[i:i + self.micro_batch_size] for i in range(0, len(rows), self.micro_batch_size)]
+        usable = len(batches) // self.world_size * self.world_size
+        return batches[self.rank:usable:self.world_size]
+
+    def __len__(self) -> int:
+        return len(self.plan())
+
+    def _finalize(self, batch: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        if not self.as_tensors:
+            return batch
+        import torch
+
+        pin = torch.cuda.is_available() if self.pin_memory is None else self.pin_memory
+        tensors = {key: torch.from_numpy(value) for key, value in batch.items()}
+        if pin:
+            tensors = {key: value.pin_memory() for key, value in tensors.items()}
+        return tensors
+
+    def _build(self, rows: List[List[int]]) -> Dict[str, Any]:
+        return self._finalize(collate_rows(self.dataset, rows, self.pad_token_id))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        batches = self.plan()
+        if self.prefetch <= 0:
+            for rows in batches:
+                yield self._build(rows)
+            return
+
+        buffer: "queue.Queue[Any]" = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        done = object()
+
+        def producer() -> None:
+            try:
+                for rows in batches:
+                    if stop.is_set():
+                        return
+                    item = self._build(rows)
+                    while not stop.is_set():
+                        try:
+                            buffer.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+            except BaseException as e:  # 在主线程重新抛出
+                buffer.put(e)
+                return
+            buffer.put(done)
+
+        thread = threading.Thread(target=producer, name="packed-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join(timeout=5)
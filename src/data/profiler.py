@@ -0,0 +1,403 @@
+"""
+转换结果的流式统计
+每个数据源维护可合并、内存与数据量无关的草图：
+- QuantileSketch：相对误差有界的对数分桶分位数草图（DDSketch）
+- HyperLogLog：近似去重计数（不同 prompt / 回复数）
+- FixedHistogram：固定分桶直方图
+大文件按字节区间 / row group 切成多个工作单元并行统计，结果按数据源合并后输出 JSON 与 Markdown
+"""
+
+import bisect
+import hashlib
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from .code_filter import extract_code_blocks
+from .external_shuffle import input_files, iter_json_lines, iter_line_range
+
+TURN_EDGES = (1, 2, 3, 4, 6, 8, 12, 16, 32)
+CHAR_EDGES = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+TOKEN_EDGES = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# 没有分词器时按 UTF-8 字节数近似 token 数（BPE 分词器在代码与英文混合文本上约 3.5~4 字节/token）
+APPROX_BYTES_PER_TOKEN = 3.7
+
+
+class QuantileSketch:
+    """对数分桶分位数草图：分位数的相对误差不超过 relative_accuracy，桶数只与数值范围有关"""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                # 桶 (gamma^(key-1), gamma^key] 的代表值，与真实值的相对误差不超过 relative_accuracy
+                value = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self, quantiles: Sequence[float] = (0.5, 0.9, 0.99)) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        result = {"count": self.count, "mean": round(self.total / self.count, 2), "min": self.min, "max": self.max}
+        for q in quantiles:
+            result[f"p{int(q * 100)}"] = round(self.quantile(q), 1)
+        return result
+
+
+class HyperLogLog:
+    """HyperLogLog 近似去重计数，2^p 个 1 字节寄存器（p=14 时 16KB，标准误差约 0.8%）"""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, item: Union[str, bytes]) -> None:
+        if isinstance(item, str):
+            item = item.encode("utf-8")
+        h = int.from_bytes(hashlib.blake2b(item, digest_size=8).digest(), "little")
+        index = h >> (64 - self.p)
+        rest = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> None:
+        merged = np.maximum(np.frombuffer(self.registers, dtype=np.uint8), np.frombuffer(other.registers, dtype=np.uint8))
+        self.registers = bytearray(merged.tobytes())
+
+    def estimate(self) -> int:
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # 小基数时使用线性计数
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class FixedHistogram:
+    """固定分桶直方图：桶 i 统计 (edges[i-1], edges[i]]，最后一个桶统计大于 edges[-1] 的值"""
+
+    def __init__(self, edges: Sequence[float]):
+        self.edges = tuple(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+
+    def merge(self, other: "FixedHistogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def labels(self) -> List[str]:
+        labels = [f"≤{self.edges[0]}"]
+        for lo, hi in zip(self.edges, self.edges[1:]):
+            labels.append(str(hi) if hi == lo + 1 else f"{lo}-{hi}")
+        return labels + [f">{self.edges[-1]}"]
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(zip(self.labels(), self.counts))
+
+
+class _Distribution:
+    """一个数值字段的分位数草图 + 固定分桶直方图"""
+
+    def __init__(self, edges: Sequence[float]):
+        self.sketch = QuantileSketch()
+        self.histogram = FixedHistogram(edges)
+
+    def add(self, value: float) -> None:
+        self.sketch.add(value)
+        self.histogram.add(value)
+
+    def merge(self, other: "_Distribution") -> None:
+        self.sketch.merge(other.sketch)
+        self.histogram.merge(other.histogram)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.sketch.summary(), "histogram": self.histogram.to_dict()}
+
+
+class SourceProfile:
+    """一个数据源的统计，可与其它工作单元的结果合并"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.records = 0
+        self.bad_records = 0
+        self.turns = _Distribution(TURN_EDGES)
+        self.prompt_chars = _Distribution(CHAR_EDGES)
+        self.response_chars = _Distribution(CHAR_EDGES)
+        self.tokens = _Distribution(TOKEN_EDGES)
+        self.assistant_messages = 0
+        self.assistant_with_code = 0
+        self.response_chars_total = 0
+        self.code_chars_total = 0
+        self.distinct_prompts = HyperLogLog()
+        self.distinct_responses = HyperLogLog()
+
+    def add(self, record: Dict[str, Any], tokens: Optional[int] = None) -> None:
+        messages = record_messages(record)
+        if not messages:
+            self.bad_records += 1
+            return
+        self.records += 1
+        self.turns.add(len(messages))
+        prompt = next((content for role, content in messages if role == "user"), "")
+        self.prompt_chars.add(len(prompt))
+        self.distinct_prompts.add(" ".join(prompt.split()))
+        response_chars = 0
+        for role, content in messages:
+            if role != "assistant":
+                continue
+            response_chars += len(content)
+            self.assistant_messages += 1
+            self.distinct_responses.add(content)
+            blocks = extract_code_blocks(content) if "```" in content or "~~~" in content or "<pre" in content else []
+            if blocks:
+                self.assistant_with_code += 1
+                self.code_chars_total += sum(len(code) for _, code in blocks)
+        self.response_chars.add(response_chars)
+        self.response_chars_total += response_chars
+        if tokens is None:
+            tokens = round(sum(len(content.encode("utf-8")) for _, content in messages) / APPROX_BYTES_PER_TOKEN)
+        self.tokens.add(tokens)
+
+    def merge(self, other: "SourceProfile") -> None:
+        self.records += other.records
+        self.bad_records += other.bad_records
+        for name in ("turns", "prompt_chars", "response_chars", "tokens"):
+            getattr(self, name).merge(getattr(other, name))
+        self.assistant_messages += other.assistant_messages
+        self.assistant_with_code += other.assistant_with_code
+        self.response_chars_total += other.response_chars_total
+        self.code_chars_total += other.code_chars_total
+        self.distinct_prompts.merge(other.distinct_prompts)
+        self.distinct_responses.merge(other.distinct_responses)
+
+    def to_dict(self) -> Dict[str, Any]:
+        distinct_prompts = min(self.distinct_prompts.estimate(), self.records)
+        return {
+            "records": self.records,
+            "bad_records": self.bad_records,
+            "turns": self.turns.to_dict(),
+            "prompt_chars": self.prompt_chars.to_dict(),
+            "response_chars": self.response_chars.to_dict(),
+            "tokens": self.tokens.to_dict(),
+            "code_block_ratio": round(self.assistant_with_code / max(self.assistant_messages, 1), 4),
+            "code_char_ratio": round(self.code_chars_total / max(self.response_chars_total, 1), 4),
+            "distinct_prompts": distinct_prompts,
+            "duplicate_prompt_ratio": round(1 - distinct_prompts / max(self.records, 1), 4),
+            "distinct_responses": min(self.distinct_responses.estimate(), self.assistant_messages),
+        }
+
+
+def record_messages(record: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """sharegpt 记录 -> [(role, content)]，兼容 messages（role/content）与 conversations（from/value）"""
+    if "messages" in record:
+        pairs = [(m.get("role") or "", m.get("content") or "") for m in record["messages"] or []]
+    else:
+        roles = {"human": "user", "gpt": "assistant"}
+        pairs = [(roles.get(m.get("from"), m.get("from") or ""), m.get("value") or "")
+                 for m in record.get("conversations") or []]
+    return [(role, content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+            for role, content in pairs]
+
+
+def source_name(path: Union[str, Path]) -> str:
+    """apps.jsonl / apps/ / apps-jsonl-zst/ -> apps"""
+    path = Path(path)
+    name = path.name.removesuffix(".jsonl") if path.is_file() else path.name
+    return name.removesuffix("-jsonl-zst")
+
+
+def plan_units(path: Union[str, Path], chunk_bytes: int = 256 << 20) -> List[Tuple[str, str, int, int]]:
+    """
+    把一个转换结果切成工作单元 (kind, 文件, start, end)：
+    未压缩 JSONL 按字节区间切分，parquet 按 row group 区间切分，jsonl.zst 每个分片一个单元
+    """
+    units = []
+    for f in input_files(path):
+        if f.suffix == ".parquet":
+            metadata = pq.ParquetFile(f).metadata
+            start, size = 0, 0
+            for i in range(metadata.num_row_groups):
+                size += metadata.row_group(i).total_byte_size
+                if size >= chunk_bytes:
+                    units.append(("parquet", str(f), start, i + 1))
+                    start, size = i + 1, 0
+            if start < metadata.num_row_groups:
+                units.append(("parquet", str(f), start, metadata.num_row_groups))
+        elif f.name.endswith(".zst"):
+            units.append(("stream", str(f), 0, 0))
+        else:
+            total = f.stat().st_size
+            units.extend(("jsonl", str(f), start, min(start + chunk_bytes, total))
+                         for start in range(0, max(total, 1), chunk_bytes))
+    return units
+
+
+def _iter_unit(kind: str, path: str, start: int, end: int) -> Iterator[bytes]:
+    if kind == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=4096, row_groups=list(range(start, end))):
+            for item in batch.to_pylist():
+                yield json.dumps(item, ensure_ascii=False).encode("utf-8")
+        return
+    if kind == "stream":
+        yield from iter_json_lines(Path(path))
+        return
+    yield from iter_line_range(Path(path), start, end)
+
+
+_TOKENIZERS: Dict[str, Any] = {}
+
+
+def _count_tokens(tokenizer_path: str, texts: List[str]) -> List[int]:
+    tokenizer = _TOKENIZERS.get(tokenizer_path)
+    if tokenizer is None:
+        from transformers import AutoTokenizer
+
+        tokenizer = _TOKENIZERS[tokenizer_path] = AutoTokenizer.from_pretrained(tokenizer_path, trust_remote_code=True)
+    return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+
+def profile_unit(name: str, unit: Tuple[str, str, int, int], tokenizer_path: Optional[str] = None,
+                 batch_size: int = 256) -> SourceProfile:
+    """统计一个工作单元；指定分词器时批量分词得到精确 token 数，否则按 UTF-8 字节数 / APPROX_BYTES_PER_TOKEN 近似"""
+    profile = SourceProfile(name)
+    pending: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        texts = ["\n".join(content for _, content in record_messages(record)) for record in pending]
+        for record, n in zip(pending, _count_tokens(tokenizer_path, texts)):
+            profile.add(record, n)
+        pending.clear()
+
+    for line in _iter_unit(*unit):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            profile.bad_records += 1
+            continue
+        if not isinstance(record, dict):
+            profile.bad_records += 1
+        elif tokenizer_path is None:
+            profile.add(record)
+        else:
+            pending.append(record)
+            if len(pending) >= batch_size:
+                flush()
+    if pending:
+        flush()
+    return profile
+
+
+def profile_sources(
+    sources: Sequence[Union[str, Path]],
+    n_workers: Optional[int] = None,
+    chunk_bytes: int = 256 << 20,
+    tokenizer_path: Optional[str] = None,
+) -> Dict[str, SourceProfile]:
+    """并行统计所有数据源，返回 {数据源名: 合并后的统计}（顺序与 sources 一致）"""
+    profiles = {source_name(path): SourceProfile(source_name(path)) for path in sources}
+    jobs = [(source_name(path), unit) for path in sources for unit in plan_units(path, chunk_bytes)]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(profile_unit, name, unit, tokenizer_path) for name, unit in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            profiles[result.name].merge(result)
+    return profiles
+
+
+def profile_report(profiles: Dict[str, SourceProfile], **metadata: Any) -> Dict[str, Any]:
+    """JSON 报告：各数据源与全部数据合并后的统计"""
+    total = SourceProfile("all")
+    for profile in profiles.values():
+        total.merge(profile)
+    return {
+        "metadata": metadata,
+        "sources": {name: profile.to_dict() for name, profile in profiles.items()},
+        "all": total.to_dict(),
+    }
+
+
+def format_profile_markdown(report: Dict[str, Any]) -> str:
+    """Markdown 报告：汇总表 + token 长度直方图"""
+    rows = {**report["sources"], "**all**": report["all"]}
+    token_label = "tokens" if report["metadata"].get("tokenizer") else "tokens≈"
+    lines = [
+        "# 数据集统计",
+        "",
+        f"| 数据源 | 记录数 | 轮数 p50 | prompt 字符 p50/p90 | 回复字符 p50/p90/p99 | {token_label} p50/p90/max "
+        "| 含代码回复 | 代码字符占比 | 不同 prompt | 重复率 |",
+        "|---|---:|---:|---:|---:|---:|---:|---:|---:|---:|",
+    ]
+    for name, stats in rows.items():
+        if not stats["records"]:
+            lines.append(f"| {name} | 0 | | | | | | | | |")
+            continue
+        prompt, response, tokens = stats["prompt_chars"], stats["response_chars"], stats["tokens"]
+        lines.append(
+            f"| {name} | {stats['records']:,} | {stats['turns']['p50']:.0f} "
+            f"| {prompt['p50']:,.0f} / {prompt['p90']:,.0f} "
+            f"| {response['p50']:,.0f} / {response['p90']:,.0f} / {response['p99']:,.0f} "
+            f"| {tokens['p50']:,.0f} / {tokens['p90']:,.0f} / {tokens['max']:,} "
+            f"| {stats['code_block_ratio']:.1%} | {stats['code_char_ratio']:.1%} "
+            f"| {stats['distinct_prompts']:,} | {stats['duplicate_prompt_ratio']:.1%} |"
+        )
+    labels = list(report["all"]["tokens"].get("histogram", {}))
+    if labels:
+        lines += ["", f"## {token_label} 长度分布（占比）", "",
+                  "| 数据源 | " + " | ".join(labels) + " |",
+                  "|---|" + "---:|" * len(labels)]
+        for name, stats in rows.items():
+            histogram = stats["tokens"].get("histogram")
+            if not histogram:
+                continue
+            n = max(sum(histogram.values()), 1)
+            lines.append(f"| {name} | " + " | ".join(f"{histogram[label] / n:.1%}" for label in labels) + " |")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+"""
+数据文件结构探测
+只读取 parquet footer 或 JSONL 第一条非空记录得到列名，用于按文件（而不是按行）选择转换分支，
+以及为 data/ 下新出现的数据集自动匹配转换函数
+"""
+
+import json
+from pathlib import Path
+from typing import Any, FrozenSet, List, Optional, Sequence, Tuple, Union
+
+import pyarrow.parquet as pq
+
+DATA_SUFFIXES = (".parquet", ".jsonl")
+
+
+def probe_columns(path: Union[str, Path], max_lines: int = 16) -> FrozenSet[str]:
+    """返回文件的顶层列名；parquet 只读 footer，JSONL 只解析第一条可解析的记录"""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return frozenset(pq.read_schema(path).names)
+    with open(path, "r", encoding="utf-8") as f:
+        for _, line in zip(range(max_lines), f):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                return frozenset(record)
+    return frozenset()
+
+
+def match_columns(
+    columns: FrozenSet[str],
+    rules: Sequence[Tuple[str, Sequence[str], Any]],
+) -> Optional[Tuple[str, Any]]:
+    """按顺序返回第一条所需列全部存在的规则 (名称, 值)；规则越具体越应排在前面"""
+    for name, required, value in rules:
+        if set(required) <= columns:
+            return name, value
+    return None
+
+
+def find_data_files(dataset_dir: Union[str, Path], limit: Optional[int] = None) -> List[Path]:
+    """递归查找目录下的 parquet / JSONL 文件（按路径排序）"""
+    files = sorted(p for p in Path(dataset_dir).rglob("*") if p.suffix in DATA_SUFFIXES and p.is_file())
+    return files[:limit] if limit else files
+
+
+def detect_pattern(dataset_dir: Union[str, Path], files: Sequence[Path]) -> str:
+    """根据找到的文件推断 glob pattern（同目录同后缀时用 <dir>/*.<ext>，否则递归匹配）"""
+    dataset_dir = Path(dataset_dir)
+    parents = {f.parent for f in files}
+    suffix = files[0].suffix
+    if len(parents) == 1 and all(f.suffix == suffix for f in files):
+        relative = next(iter(parents)).relative_to(dataset_dir)
+        return str(relative / f"*{suffix}") if str(relative) != "." else f"*{suffix}"
+    return f"**/*{suffix}"
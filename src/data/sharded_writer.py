@@ -0,0 +1,224 @@
+"""
+转换结果的分片输出
+按大小上限把样本写成多个分片：zstd 压缩的 parquet（LLaMA-Factory 可把整个目录作为 file_name 加载，
+多分片可并行读取）、zstd 压缩的 JSONL（归档/传输用）或未压缩 JSONL。先写入临时目录，全部完成后再替换目标目录
+"""
+
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+OUTPUT_FORMATS = ("jsonl", "parquet", "jsonl.zst")
+SHARD_SUFFIXES = {"parquet": ".parquet", "jsonl.zst": ".jsonl.zst", "jsonl": ".jsonl"}
+
+MESSAGES_SCHEMA = pa.schema([
+    ("messages", pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())]))),
+])
+
+
+class ShardedWriter:
+    """
+    分片写出器，每个分片的未压缩数据量不超过 shard_bytes（单条样本超过上限时独占一个分片）
+
+    用法:
+        with ShardedWriter("data/llamafactory/apps", "parquet", shard_bytes=256 << 20) as writer:
+            for item in items:
+                writer.write(item)
+        writer.shards   # 分片文件列表
+    """
+
+    def __init__(
+        self,
+        output_dir: Union[str, Path],
+        fmt: str = "parquet",
+        shard_bytes: int = 256 << 20,
+        row_group_bytes: int = 32 << 20,
+        compression_level: int = 3,
+        schema: pa.Schema = MESSAGES_SCHEMA,
+    ):
+        if fmt not in SHARD_SUFFIXES:
+            raise ValueError(f"不支持的分片格式: {fmt}，可选 {list(SHARD_SUFFIXES)}")
+        self.output_dir = Path(output_dir)
+        self.fmt = fmt
+        self.shard_bytes = shard_bytes
+        self.row_group_bytes = min(row_group_bytes, shard_bytes)
+        self.compression_level = compression_level
+        self.schema = schema
+        self.tmp_dir = self.output_dir.with_name(f"{self.output_dir.name}.tmp-{os.getpid()}")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        self.tmp_dir.mkdir(parents=True)
+        self.shards: List[Path] = []
+        self.rows = 0
+        self.raw_bytes = 0
+        self._writer: Any = None
+        self._shard_bytes = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_bytes = 0
+
+    def _open_shard(self) -> None:
+        path = self.tmp_dir / f"part-{len(self.shards):05d}{SHARD_SUFFIXES[self.fmt]}"
+        if self.fmt == "parquet":
+            self._writer = pq.ParquetWriter(path, self.schema, compression="zstd",
+                                            compression_level=self.compression_level)
+        elif self.fmt == "jsonl.zst":
+            self._writer = pa.CompressedOutputStream(str(path), "zstd")
+        else:
+            self._writer = open(path, "wb", buffering=1 << 20)
+        self.shards.append(path)
+        self._shard_bytes = 0
+
+    def _close_shard(self) -> None:
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _flush(self) -> None:
+        if not self._buffer:
+            return
+        if self.fmt == "parquet":
+            self._writer.write_table(pa.Table.from_pylist(self._buffer, schema=self.schema))
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def write(self, item: Dict[str, Any]) -> None:
+        self._write(item, (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    def write_line(self, line: bytes) -> None:
+        """写入一行已序列化的 JSON（JSONL 格式直接写字节，无需重新序列化）"""
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        self._write(json.loads(line) if self.fmt == "parquet" else None, line)
+
+    def _write(self, item: Optional[Dict[str, Any]], line: bytes) -> None:
+        if self._writer is None or (self._shard_bytes and self._shard_bytes + len(line) > self.shard_bytes):
+            self._close_shard()
+            self._open_shard()
+        if self.fmt == "parquet":
+            self._buffer.append(item)
+            self._buffer_bytes += len(line)
+            if self._buffer_bytes >= self.row_group_bytes:
+                self._flush()
+        else:
+            self._writer.write(line)
+        self._shard_bytes += len(line)
+        self.raw_bytes += len(line)
+        self.rows += 1
+
+    def close(self) -> List[Path]:
+        """写完最后一个分片，并用临时目录替换目标目录，返回最终的分片路径"""
+        self._close_shard()
+        if self.output_dir.exists():
+            shutil.rmtree(self.output_dir)
+        os.replace(self.tmp_dir, self.output_dir)
+        self.shards = [self.output_dir / p.name for p in self.shards]
+        return self.shards
+
+    def abort(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def __enter__(self) -> "ShardedWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def disk_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.shards if p.exists())
+
+
+class JsonlWriter:
+    """单文件未压缩 JSONL（原有输出格式），同样先写临时文件再替换"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_name(f"{self.path.name}.tmp-{os.getpid()}")
+        self._f = open(self.tmp, "w", encoding="utf-8")
+        self.rows = 0
+        self.shards: List[Path] = [self.path]
+
+    def write(self, item: Dict[str, Any]) -> None:
+        self._f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        self.rows += 1
+
+    def write_line(self, line: bytes) -> None:
+        """写入一行已序列化的 JSON"""
+        self._f.write(line.decode("utf-8") if line.endswith(b"\n") else line.decode("utf-8") + "\n")
+        self.rows += 1
+
+    def close(self) -> List[Path]:
+        self._f.close()
+        os.replace(self.tmp, self.path)
+        return self.shards
+
+    def abort(self) -> None:
+        self._f.close()
+        self.tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def disk_bytes(self) -> int:
+        return self.path.stat().st_size if self.path.exists() else 0
+
+
+def dataset_info_entry(file_name: str) -> Dict[str, Any]:
+    """LLaMA-Factory sharegpt 格式的 dataset_info 条目；file_name 可以是文件或分片目录"""
+    return {
+        "file_name": file_name,
+        "formatting": "sharegpt",
+        "columns": {
+            "messages": "messages"
+        },
+        "tags": {
+            "role_tag": "role",
+            "content_tag": "content",
+            "user_tag": "user",
+            "assistant_tag": "assistant"
+        }
+    }
+
+
+def registrable(fmt: str) -> bool:
+    """LLaMA-Factory 按扩展名识别文件类型，不识别 .zst，因此压缩 JSONL 分片不注册"""
+    return fmt in ("jsonl", "parquet")
+
+
+def output_path(output_root: Union[str, Path], dataset_name: str, fmt: str) -> Path:
+    """
+    jsonl 输出单个文件 <name>.jsonl；parquet 分片目录 <name>/（注册到 dataset_info）；
+    jsonl.zst 分片目录 <name>-jsonl-zst/，避免覆盖已注册的 parquet 目录
+    """
+    output_root = Path(output_root)
+    if fmt == "jsonl":
+        return output_root / f"{dataset_name}.jsonl"
+    if fmt == "jsonl.zst":
+        return output_root / f"{dataset_name}-jsonl-zst"
+    return output_root / dataset_name
+
+
+def open_output(path: Union[str, Path], fmt: str, shard_mb: float = 256) -> Any:
+    """按输出格式返回写出器（均提供 write / write_line / close / rows / disk_bytes）"""
+    if fmt == "jsonl":
+        return JsonlWriter(path)
+    return ShardedWriter(path, fmt, shard_bytes=int(shard_mb * (1 << 20)))
@@ -0,0 +1,221 @@
+"""
+原始数据源之上的惰性“虚拟数据集”
+行数直接取自 parquet footer 元数据或 JSONL 行偏移索引，不做任何转换；
+抽样时先确定行号，再只读取这些行所在的 row group / 行，并只对它们运行对应的行转换函数
+"""
+
+import json
+import math
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .columnar_cache import RAW_SOURCE_SPECS, cache_path_for, is_cache_fresh
+
+RowConverter = Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+class ParquetSource:
+    """parquet 文件：行数与 row group 边界来自 footer，读取时只解码用到的 row group"""
+
+    def __init__(self, path: Union[str, Path], columns: Optional[Sequence[str]] = None):
+        self.path = Path(path)
+        self.columns = list(columns) if columns else None
+        metadata = pq.ParquetFile(self.path).metadata
+        group_rows = [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)]
+        self.group_starts = np.concatenate([[0], np.cumsum(group_rows, dtype=np.int64)])
+        self.num_rows = int(self.group_starts[-1])
+
+    def read(self, local_ids: Sequence[int]) -> List[Optional[Dict[str, Any]]]:
+        local_ids = np.asarray(local_ids, dtype=np.int64)
+        if len(local_ids) == 0:
+            return []
+        groups = np.searchsorted(self.group_starts, local_ids, side="right") - 1
+        needed = sorted(set(groups.tolist()))
+        table = pq.ParquetFile(self.path).read_row_groups(needed, columns=self.columns)
+        # 读出的表按 row group 顺序拼接，换算成表内行号
+        table_starts = {}
+        offset = 0
+        for g in needed:
+            table_starts[g] = offset
+            offset += int(self.group_starts[g + 1] - self.group_starts[g])
+        positions = [table_starts[g] + int(i - self.group_starts[g]) for g, i in zip(groups, local_ids)]
+        return table.take(pa.array(positions, type=pa.int64())).to_pylist()
+
+
+def build_line_index(path: Union[str, Path], chunk_bytes: int = 1 << 24) -> np.ndarray:
+    """扫描换行符得到每行起始字节偏移（不解析 JSON），末尾追加文件长度作为哨兵"""
+    starts = [np.zeros(1, dtype=np.int64)]
+    position = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+            starts.append(newlines.astype(np.int64) + position + 1)
+            position += len(chunk)
+    offsets = np.concatenate(starts)
+    if offsets[-1] != position:
+        offsets = np.append(offsets, position)
+    return offsets
+
+
+class JsonlSource:
+    """
+    JSONL 文件：首次访问时建立行偏移索引（保存到 index_dir，源文件大小或修改时间变化时重建），
+    读取时按偏移 seek 到对应行再解析
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        index_path: Optional[Union[str, Path]] = None,
+        decode: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    ):
+        self.path = Path(path)
+        self.decode = decode
+        self.offsets = self._load_index(Path(index_path) if index_path else None)
+        self.num_rows = len(self.offsets) - 1
+
+    def _load_index(self, index_path: Optional[Path]) -> np.ndarray:
+        stat = self.path.stat()
+        signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        meta_path = index_path.with_suffix(".json") if index_path else None
+        if index_path and index_path.exists() and meta_path.exists():
+            if json.loads(meta_path.read_text()) == signature:
+                return np.load(index_path, mmap_mode="r")
+        offsets = build_line_index(self.path)
+        if index_path:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(index_path, offsets)
+            meta_path.write_text(json.dumps(signature))
+        return offsets
+
+    def read(self, local_ids: Sequence[int]) -> List[Optional[Dict[str, Any]]]:
+        records: List[Optional[Dict[str, Any]]] = []
+        with open(self.path, "rb") as f:
+            for i in local_ids:
+                start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+                f.seek(start)
+                line = f.read(end - start)
+                try:
+                    record = json.loads(line)
+                    records.append(self.decode(record) if self.decode else record)
+                except (ValueError, AttributeError, TypeError):
+                    records.append(None)
+        return records
+
+
+def open_source(
+    dataset_name: str,
+    path: Union[str, Path],
+    dataset_dir: Union[str, Path],
+    columnar_cache_dir: Optional[Union[str, Path]] = None,
+    index_dir: Optional[Union[str, Path]] = None,
+) -> Union[ParquetSource, JsonlSource]:
+    """
+    为一个源文件选择读取方式：parquet 直接读；JSONL 优先使用最新的列式缓存，否则建立行偏移索引
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        return ParquetSource(path)
+    spec = RAW_SOURCE_SPECS.get(dataset_name)
+    if spec is not None and columnar_cache_dir:
+        cached = cache_path_for(path, dataset_dir, columnar_cache_dir)
+        if is_cache_fresh(cached, path, spec):
+            return ParquetSource(cached)
+    index_path = cache_path_for(path, dataset_dir, index_dir).with_suffix(".lines.npy") if index_dir else None
+    return JsonlSource(path, index_path, decode=spec.decode if spec else None)
+
+
+class VirtualDataset:
+    """
+    多个源文件拼成的惰性数据集，全局行号按文件顺序连续编号
+
+    row_converter 可以是一个函数，也可以是与 sources 一一对应的列表（各文件按列结构选出的转换分支）
+
+    用法:
+        ds = VirtualDataset("apps", [open_source("apps", p, dataset_dir) for p in files], convert_apps_row)
+        len(ds)                       # 只读元数据/行索引
+        items = ds.sample(2000, seed=42)   # 只转换被抽中的行
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sources: Sequence[Union[ParquetSource, JsonlSource]],
+        row_converter: Union[RowConverter, Sequence[RowConverter]],
+    ):
+        self.name = name
+        self.sources = list(sources)
+        if callable(row_converter):
+            row_converter = [row_converter] * len(self.sources)
+        if len(row_converter) != len(self.sources):
+            raise ValueError("row_converter 列表长度必须与 sources 一致")
+        self.row_converters = list(row_converter)
+        self.starts = np.concatenate([[0], np.cumsum([s.num_rows for s in self.sources], dtype=np.int64)])
+        self.stats = {"rows_read": 0, "converted": 0, "rejected": 0}
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    def locate(self, ids: Sequence[int]) -> np.ndarray:
+        """全局行号 -> 所在文件下标"""
+        return np.searchsorted(self.starts, np.asarray(ids, dtype=np.int64), side="right") - 1
+
+    def read(self, ids: Sequence[int]) -> List[Optional[Dict[str, Any]]]:
+        """按全局行号读取原始记录，按请求顺序返回；同一文件的行一次读取"""
+        ids = np.asarray(ids, dtype=np.int64)
+        file_index = self.locate(ids)
+        records: List[Optional[Dict[str, Any]]] = [None] * len(ids)
+        for f in np.unique(file_index):
+            positions = np.flatnonzero(file_index == f)
+            order = positions[np.argsort(ids[positions], kind="stable")]
+            local_ids = ids[order] - self.starts[f]
+            for pos, record in zip(order, self.sources[f].read(local_ids)):
+                records[pos] = record
+        self.stats["rows_read"] += len(ids)
+        return records
+
+    def convert(self, ids: Sequence[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """读取并转换指定行，返回转换成功的 (行号, 样本)"""
+        converted = []
+        for row_id, f, record in zip(ids, self.locate(ids), self.read(ids)):
+            item = None
+            if record is not None:
+                try:
+                    item = self.row_converters[f](record)
+                except Exception:
+                    item = None
+            if item is None:
+                self.stats["rejected"] += 1
+            else:
+                converted.append((int(row_id), item))
+        self.stats["converted"] += len(converted)
+        return converted
+
+    def sample(self, n: int, seed: int = 42, oversample: float = 1.2) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        无放回随机抽取 n 条可用样本
+
+        按随机排列分批取行号；转换失败的行会被丢弃，下一批按已观察到的通过率放大，
+        直到凑满 n 条或所有行都已尝试
+        """
+        order = np.random.default_rng(seed).permutation(len(self))
+        results: List[Tuple[int, Dict[str, Any]]] = []
+        cursor = 0
+        accept_rate = 1.0
+        while len(results) < n and cursor < len(order):
+            need = n - len(results)
+            take = min(len(order) - cursor, max(1, math.ceil(need / max(accept_rate, 0.05) * oversample)))
+            batch = order[cursor:cursor + take]
+            cursor += take
+            converted = self.convert(batch)
+            results.extend(converted)
+            tried = self.stats["converted"] + self.stats["rejected"]
+            accept_rate = self.stats["converted"] / tried if tried else 1.0
+        return results[:n]
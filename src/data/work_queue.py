@@ -0,0 +1,277 @@
+"""
+共享文件系统上的任务队列
+多个节点的 worker 通过同一个共享目录（NFS）领取任务，不依赖任何外部服务：
+- tasks.json: 任务列表，由第一个 worker 原子发布，之后的 worker 校验参数一致后复用
+- claims/<任务>.lock: 领取锁，用 link() 原子创建（NFS 上 O_EXCL 不可靠，link 是传统的可靠做法），内容为领取令牌；
+  持有者定期 touch 续租，mtime 超过 lease_timeout 视为持有者已退出，其他 worker 改名夺取后重新领取
+- done/<任务>.json: 完成标记与结果统计，先写临时文件再改名
+过期判断使用文件服务器的时间（touch 自己的时钟文件后读取 mtime），不要求各节点时钟同步
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Union
+
+TASKS_NAME = "tasks.json"
+
+
+def _write_json_atomic(path: Path, obj: Any) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _link_exclusive(src: Path, dst: Path) -> bool:
+    """以硬链接原子创建 dst，已存在时返回 False"""
+    try:
+        os.link(src, dst)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        # NFS 上 link 的应答可能丢失而实际已经成功，按源文件的链接计数判断
+        try:
+            return os.stat(src).st_nlink == 2
+        except OSError:
+            return False
+
+
+class Claim:
+    """一个已领取的任务；后台线程定期续租，发现锁被夺走时置位 lost，持有者应放弃该任务"""
+
+    def __init__(self, queue: "SharedWorkQueue", task: Dict[str, Any], token: str, lock_path: Path):
+        self.queue = queue
+        self.task = task
+        self.token = token
+        self.lock_path = lock_path
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name=f"heartbeat-{task['id']}", daemon=True)
+
+    @property
+    def task_id(self) -> str:
+        return self.task["id"]
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.queue.heartbeat_interval):
+            if not self.queue.owns(self):
+                self.lost.set()
+                return
+            try:
+                os.utime(self.lock_path)
+            except FileNotFoundError:
+                self.lost.set()
+                return
+
+
+class SharedWorkQueue:
+    """
+    基于共享目录的任务队列
+
+    用法:
+        queue = SharedWorkQueue("/volume/pt-train/queue/convert", lease_timeout=300)
+        tasks = queue.publish(params={...}, plan=lambda: [{"id": "apps.00000", ...}, ...])
+        for claim in queue.drain(tasks):
+            try:
+                result = run(claim.task)
+            except Exception as e:
+                queue.fail(claim, repr(e))
+            else:
+                queue.complete(claim, result)
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        lease_timeout: float = 300.0,
+        heartbeat_interval: Optional[float] = None,
+        max_attempts: int = 3,
+        worker_id: Optional[str] = None,
+    ):
+        self.root = Path(root)
+        self.lease_timeout = lease_timeout
+        self.heartbeat_interval = heartbeat_interval or lease_timeout / 6
+        self.max_attempts = max_attempts
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.claims_dir = self.root / "claims"
+        self.done_dir = self.root / "done"
+        self.attempts_dir = self.root / "attempts"
+        self.clock_dir = self.root / "clock"
+        for d in (self.claims_dir, self.done_dir, self.attempts_dir, self.clock_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        # 本 worker 夺取过的过期任务数
+        self.reclaimed = 0
+
+    def publish(self, params: Dict[str, Any], plan: Callable[[], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """
+        发布 plan() 生成的任务列表（每个任务需有唯一的 "id"），已由其他 worker 发布时直接返回已发布的列表；
+        参数不一致说明队列目录属于另一次运行，抛出 ValueError
+        """
+        path = self.root / TASKS_NAME
+        if not path.exists():
+            tmp = path.with_name(f".{TASKS_NAME}.{uuid.uuid4().hex}.tmp")
+            tmp.write_text(json.dumps({"params": params, "tasks": plan()}, ensure_ascii=False), encoding="utf-8")
+            _link_exclusive(tmp, path)
+            tmp.unlink()
+        published = json.loads(path.read_text(encoding="utf-8"))
+        if published["params"] != params:
+            raise ValueError(f"队列目录 {self.root} 已发布了参数不同的任务，请换一个 --queue-dir 或清空该目录")
+        return published["tasks"]
+
+    def fs_now(self) -> float:
+        """文件服务器的当前时间：touch 本 worker 的时钟文件后读取 mtime"""
+        clock = self.clock_dir / self.worker_id
+        clock.touch()
+        os.utime(clock)
+        return clock.stat().st_mtime
+
+    def done_ids(self) -> Set[str]:
+        return {name[:-len(".json")] for name in os.listdir(self.done_dir) if name.endswith(".json")}
+
+    def result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        path = self.done_dir / f"{task_id}.json"
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+    def _lock_path(self, task_id: str) -> Path:
+        return self.claims_dir / f"{task_id}.lock"
+
+    def owns(self, claim: Claim) -> bool:
+        try:
+            return json.loads(claim.lock_path.read_text(encoding="utf-8"))["token"] == claim.token
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _try_lock(self, task: Dict[str, Any]) -> Optional[Claim]:
+        token = uuid.uuid4().hex
+        lock = self._lock_path(task["id"])
+        tmp = self.claims_dir / f".{token}.tmp"
+        tmp.write_text(json.dumps({"token": token, "worker": self.worker_id, "task": task["id"],
+                                   "claimed_at": datetime.now().isoformat(timespec="seconds")}), encoding="utf-8")
+        try:
+            locked = _link_exclusive(tmp, lock)
+        finally:
+            tmp.unlink()
+        return Claim(self, task, token, lock) if locked else None
+
+    def _break_stale(self, lock: Path, now: float) -> bool:
+        """锁已不存在或已过期并被本 worker 移走时返回 True"""
+        try:
+            if now - os.stat(lock).st_mtime <= self.lease_timeout:
+                return False
+        except FileNotFoundError:
+            return True
+        grave = lock.with_name(f"{lock.name}.stale-{uuid.uuid4().hex}")
+        try:
+            os.rename(lock, grave)
+        except FileNotFoundError:
+            # 其他 worker 已经移走或持有者刚好释放
+            return True
+        try:
+            # 检查与改名之间锁可能已被续租或被重新领取，移走的若不是过期锁就放回原处
+            if now - grave.stat().st_mtime <= self.lease_timeout:
+                return not _link_exclusive(grave, lock)
+            self.reclaimed += 1
+            return True
+        finally:
+            grave.unlink()
+
+    def claim(self, tasks: List[Dict[str, Any]]) -> Optional[Claim]:
+        """
+        领取一个未完成的任务（必要时夺取过期的锁），没有可领取的任务时返回 None；
+        各 worker 从按 worker_id 错开的位置开始扫描，减少争抢同一个锁
+        """
+        if not tasks:
+            return None
+        done = self.done_ids()
+        now = None
+        offset = int(hashlib.md5(self.worker_id.encode()).hexdigest(), 16) % len(tasks)
+        for task in tasks[offset:] + tasks[:offset]:
+            if task["id"] in done:
+                continue
+            lock = self._lock_path(task["id"])
+            if lock.exists():
+                if now is None:
+                    now = self.fs_now()
+                if not self._break_stale(lock, now):
+                    continue
+            claim = self._try_lock(task)
+            if claim is None:
+                continue
+            # 完成标记可能在读取 done 目录之后才写出（持有者随后释放了锁）
+            if (self.done_dir / f"{task['id']}.json").exists():
+                self._unlock(claim)
+                continue
+            claim.start()
+            return claim
+        return None
+
+    def drain(self, tasks: List[Dict[str, Any]], poll_interval: Optional[float] = None) -> Iterator[Claim]:
+        """
+        依次产出领取到的任务，直到全部完成；暂时没有可领取的任务（都被其他 worker 持有）时等待，
+        以便在持有者退出、锁过期后接手。调用方须在取下一个任务前 complete 或 fail 当前任务
+        """
+        while True:
+            claim = self.claim(tasks)
+            if claim is not None:
+                yield claim
+                continue
+            if self.done_ids().issuperset(task["id"] for task in tasks):
+                return
+            time.sleep(poll_interval or self.heartbeat_interval)
+
+    def _unlock(self, claim: Claim) -> None:
+        claim.stop()
+        if self.owns(claim):
+            claim.lock_path.unlink(missing_ok=True)
+
+    def complete(self, claim: Claim, result: Dict[str, Any]) -> bool:
+        """写出完成标记并释放锁；锁已被夺走时不写，返回 False（该任务由新的持有者完成）"""
+        claim.stop()
+        if claim.lost.is_set() or not self.owns(claim):
+            return False
+        _write_json_atomic(self.done_dir / f"{claim.task_id}.json", {
+            "worker": self.worker_id,
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "result": result,
+        })
+        self._unlock(claim)
+        return True
+
+    def fail(self, claim: Claim, error: str) -> None:
+        """释放锁以便重试；累计失败 max_attempts 次后写出带 error 的完成标记，不再重试"""
+        claim.stop()
+        if not self.owns(claim):
+            return
+        attempts_path = self.attempts_dir / f"{claim.task_id}.json"
+        errors = json.loads(attempts_path.read_text(encoding="utf-8")) if attempts_path.exists() else []
+        errors.append({"worker": self.worker_id, "error": error})
+        _write_json_atomic(attempts_path, errors)
+        if len(errors) >= self.max_attempts:
+            _write_json_atomic(self.done_dir / f"{claim.task_id}.json", {
+                "worker": self.worker_id,
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+                "error": error,
+                "attempts": len(errors),
+            })
+        self._unlock(claim)
+
+    def status(self, tasks: List[Dict[str, Any]]) -> Dict[str, int]:
+        done = self.done_ids()
+        running = sum(1 for task in tasks if task["id"] not in done and self._lock_path(task["id"]).exists())
+        finished = sum(1 for task in tasks if task["id"] in done)
+        return {"tasks": len(tasks), "done": finished, "running": running, "pending": len(tasks) - finished - running}
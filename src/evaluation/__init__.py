@@ -0,0 +1,43 @@
+"""评测模块"""
+
+from .backends import (
+    FakeBackend,
+    GenerationBackend,
+    GenerationResult,
+    HFBackend,
+    SamplingConfig,
+    VLLMBackend,
+    available_backends,
+    get_backend,
+    register_backend,
+    release_backends,
+)
+from .codegen import CodegenStats, run_codegen
+from .humaneval import build_prompt, load_problems
+from .program_tests import ProgramTests, SolutionVerifier, run_program_tests
+from .replicas import DataParallelBackend
+from .server import EvalJob, EvalService, make_server
+
+__all__ = [
+    "CodegenStats",
+    "DataParallelBackend",
+    "EvalJob",
+    "EvalService",
+    "FakeBackend",
+    "GenerationBackend",
+    "GenerationResult",
+    "HFBackend",
+    "ProgramTests",
+    "SamplingConfig",
+    "SolutionVerifier",
+    "VLLMBackend",
+    "available_backends",
+    "build_prompt",
+    "get_backend",
+    "load_problems",
+    "make_server",
+    "register_backend",
+    "release_backends",
+    "run_codegen",
+    "run_program_tests",
+]
@@ -0,0 +1,412 @@
+"""
+代码生成后端
+进程内的 vLLM / HuggingFace / Fake 后端，统一接口，一次性批量生成所有提示词，
+并在同一进程内复用已加载的引擎，避免每次评测重复支付导入和模型加载开销
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .humaneval import truncate_at_stop
+
+
+@dataclass
+class SamplingConfig:
+    """采样参数；temperature 为 0 时使用贪心解码"""
+
+    max_new_tokens: int = 768
+    temperature: float = 0.0
+    top_p: float = 1.0
+    n: int = 1
+    stop: List[str] = field(default_factory=list)
+
+    @property
+    def greedy(self) -> bool:
+        return self.temperature == 0.0
+
+
+@dataclass
+class GenerationResult:
+    """一次批量生成的结果，outputs[i] 对应 prompts[i] 的 n 个补全"""
+
+    outputs: List[List[str]]
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+class GenerationBackend(ABC):
+    """生成后端基类，子类通过 register_backend 注册"""
+
+    name = "base"
+
+    def __init__(self, model_path: str, **kwargs: Any):
+        self.model_path = model_path
+        self.options = kwargs
+
+    @property
+    def tokenizer(self) -> Optional[Any]:
+        """用于构造chat提示词，无tokenizer的后端返回None"""
+        return None
+
+    @abstractmethod
+    def generate(self, prompts: List[str], sampling: SamplingConfig) -> GenerationResult:
+        """批量生成，返回顺序与 prompts 一致"""
+
+    def close(self) -> None:
+        """释放引擎占用的资源"""
+
+
+_BACKENDS: Dict[str, Type[GenerationBackend]] = {}
+_ENGINES: Dict[Tuple[str, str, str], GenerationBackend] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def register_backend(name: str) -> Callable[[Type[GenerationBackend]], Type[GenerationBackend]]:
+    """注册生成后端的装饰器"""
+
+    def decorator(cls: Type[GenerationBackend]) -> Type[GenerationBackend]:
+        cls.name = name
+        _BACKENDS[name] = cls
+        return cls
+
+    return decorator
+
+
+def available_backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+def _engine_key(name: str, model_path: str, kwargs: Dict[str, Any]) -> Tuple[str, str, str]:
+    return (name, str(model_path), json.dumps(kwargs, sort_keys=True, default=str))
+
+
+def get_backend(name: str, model_path: str, **kwargs: Any) -> GenerationBackend:
+    """
+    获取（或创建）生成后端实例
+
+    相同 (后端, 模型路径, 参数) 的实例在进程内缓存，重复评测时保持引擎常驻
+    """
+    if name not in _BACKENDS:
+        raise ValueError(f"未知的生成后端: {name}，可选: {', '.join(available_backends())}")
+    key = _engine_key(name, model_path, kwargs)
+    with _ENGINES_LOCK:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            print(f"🔧 加载 {name} 生成后端: {model_path}")
+            start = time.perf_counter()
+            engine = _BACKENDS[name](model_path, **kwargs)
+            print(f"✓ 后端加载完成，耗时 {time.perf_counter() - start:.1f}s")
+            _ENGINES[key] = engine
+        return engine
+
+
+def release_backends() -> None:
+    """释放所有缓存的引擎"""
+    with _ENGINES_LOCK:
+        for engine in _ENGINES.values():
+            try:
+                engine.close()
+            except Exception as e:
+                print(f"⚠ 释放后端失败: {e}")
+        _ENGINES.clear()
+
+
+@register_backend("vllm")
+class VLLMBackend(GenerationBackend):
+    """vLLM 进程内引擎，tp 对应张量并行度"""
+
+    def __init__(
+        self,
+        model_path: str,
+        tp: int = 1,
+        dtype: str = "bfloat16",
+        max_model_len: Optional[int] = None,
+        gpu_memory_utilization: float = 0.9,
+        enable_prefix_caching: bool = True,
+        **kwargs: Any,
+    ):
+        super().__init__(model_path, **kwargs)
+        from vllm import LLM
+
+        engine_kwargs: Dict[str, Any] = {
+            "model": model_path,
+            "tensor_parallel_size": int(tp or 1),
+            "dtype": dtype,
+            "trust_remote_code": True,
+            "gpu_memory_utilization": gpu_memory_utilization,
+            "enable_prefix_caching": enable_prefix_caching,
+        }
+        if max_model_len:
+            engine_kwargs["max_model_len"] = max_model_len
+        self.llm = LLM(**engine_kwargs)
+
+    @property
+    def tokenizer(self) -> Optional[Any]:
+        return self.llm.get_tokenizer()
+
+    def generate(self, prompts: List[str], sampling: SamplingConfig) -> GenerationResult:
+        from vllm import SamplingParams
+
+        params = SamplingParams(
+            n=sampling.n,
+            temperature=sampling.temperature,
+            top_p=1.0 if sampling.greedy else sampling.top_p,
+            max_tokens=sampling.max_new_tokens,
+            stop=sampling.stop or None,
+        )
+        # 一次提交全部提示词，由vLLM调度连续批处理；返回顺序与输入一致
+        request_outputs = self.llm.generate(prompts, params, use_tqdm=True)
+        outputs: List[List[str]] = []
+        prompt_tokens = 0
+        output_tokens = 0
+        for request_output in request_outputs:
+            prompt_tokens += len(request_output.prompt_token_ids or [])
+            outputs.append([o.text for o in request_output.outputs])
+            output_tokens += sum(len(o.token_ids) for o in request_output.outputs)
+        return GenerationResult(outputs, prompt_tokens, output_tokens)
+
+    def close(self) -> None:
+        del self.llm
+        try:
+            import gc
+
+            import torch
+
+            gc.collect()
+            torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+def _common_prefix_length(sequences: List[List[int]]) -> int:
+    """所有序列的最长公共前缀长度"""
+    if not sequences:
+        return 0
+    shortest = min(sequences, key=len)
+    for i, token in enumerate(shortest):
+        if any(seq[i] != token for seq in sequences):
+            return i
+    return len(shortest)
+
+
+def plan_token_batches(
+    lengths: List[int],
+    max_new_tokens: int,
+    n: int = 1,
+    max_batch_tokens: Optional[int] = None,
+    max_batch_size: int = 16,
+) -> List[List[int]]:
+    """
+    按长度降序排序后切分批次，返回每批的原始下标
+
+    每批的 (最长提示词 + max_new_tokens) × 序列数 不超过 max_batch_tokens，
+    长度相近的提示词放在同一批，padding 浪费最小；单条超预算时独占一批
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for idx in order:
+        if current:
+            longest = lengths[current[0]]
+            size = len(current) + 1
+            over_budget = max_batch_tokens is not None and (longest + max_new_tokens) * size * n > max_batch_tokens
+            if size > max_batch_size or over_budget:
+                batches.append(current)
+                current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+@register_backend("hf")
+class HFBackend(GenerationBackend):
+    """
+    HuggingFace transformers 后端
+
+    - 提示词按 token 长度排序，在 token 预算内组成批次，减少 padding
+    - 所有提示词共享的前缀（如 chat 模板的 system 部分）只计算一次 KV cache，各批次复用
+    - 输出按原始顺序还原
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        dtype: str = "bfloat16",
+        batch_size: int = 16,
+        device: Optional[str] = None,
+        max_batch_tokens: Optional[int] = 32768,
+        sort_by_length: bool = True,
+        prefix_cache: bool = True,
+        min_prefix_tokens: int = 16,
+        **kwargs: Any,
+    ):
+        super().__init__(model_path, **kwargs)
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.sort_by_length = sort_by_length
+        self.prefix_cache = prefix_cache
+        self.min_prefix_tokens = min_prefix_tokens
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self._tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+        self._tokenizer.padding_side = "left"
+        if self._tokenizer.pad_token is None:
+            self._tokenizer.pad_token = self._tokenizer.eos_token
+        torch_dtype = getattr(torch, dtype) if isinstance(dtype, str) else dtype
+        self.model = AutoModelForCausalLM.from_pretrained(
+            model_path, torch_dtype=torch_dtype, trust_remote_code=True
+        ).to(self.device)
+        self.model.eval()
+        self.last_stats: Dict[str, int] = {}
+
+    @property
+    def tokenizer(self) -> Optional[Any]:
+        return self._tokenizer
+
+    def _plan(self, lengths: List[int], sampling: SamplingConfig) -> List[List[int]]:
+        if self.sort_by_length:
+            return plan_token_batches(
+                lengths, sampling.max_new_tokens, sampling.n, self.max_batch_tokens, self.batch_size
+            )
+        # 旧行为：按原始顺序固定大小分批
+        return [list(range(i, min(i + self.batch_size, len(lengths)))) for i in range(0, len(lengths), self.batch_size)]
+
+    def _prefix_kv(self, prefix: List[int]) -> Any:
+        """计算共享前缀的 KV cache（batch=1）"""
+        input_ids = self.torch.tensor([prefix], device=self.device)
+        with self.torch.no_grad():
+            past_key_values = self.model(input_ids=input_ids, use_cache=True).past_key_values
+        if isinstance(past_key_values, tuple):
+            # 部分模型仍返回旧式的 (key, value) 元组，转为可复制和按 batch 扩展的 DynamicCache
+            from transformers import DynamicCache
+
+            past_key_values = DynamicCache.from_legacy_cache(past_key_values)
+        return past_key_values
+
+    def generate(self, prompts: List[str], sampling: SamplingConfig) -> GenerationResult:
+        token_ids: List[List[int]] = self._tokenizer(prompts)["input_ids"]
+        lengths = [len(ids) for ids in token_ids]
+        batches = self._plan(lengths, sampling)
+
+        # 共享前缀至少保留每条提示词的最后一个 token 给 generate 计算首个 logits
+        prefix_len = 0
+        if self.prefix_cache and len(prompts) > 1:
+            prefix_len = min(_common_prefix_length(token_ids), min(lengths) - 1)
+            if prefix_len < self.min_prefix_tokens:
+                prefix_len = 0
+        prefix_kv = self._prefix_kv(token_ids[0][:prefix_len]) if prefix_len else None
+
+        pad_id = self._tokenizer.pad_token_id
+        outputs: List[List[str]] = [[] for _ in prompts]
+        output_tokens = 0
+        padded_tokens = 0
+        for batch in batches:
+            # 左侧 padding 放在共享前缀之后，位置编码由 attention_mask 累加得到，与不加 padding 时一致
+            longest = max(lengths[i] for i in batch)
+            ids_rows: List[List[int]] = []
+            mask_rows: List[List[int]] = []
+            for i in batch:
+                pad = longest - lengths[i]
+                ids = token_ids[i]
+                ids_rows.append(ids[:prefix_len] + [pad_id] * pad + ids[prefix_len:])
+                mask_rows.append([1] * prefix_len + [0] * pad + [1] * (lengths[i] - prefix_len))
+                padded_tokens += pad
+            input_ids = self.torch.tensor(ids_rows, device=self.device)
+            attention_mask = self.torch.tensor(mask_rows, device=self.device)
+
+            gen_kwargs: Dict[str, Any] = {
+                "max_new_tokens": sampling.max_new_tokens,
+                "num_return_sequences": sampling.n,
+                "pad_token_id": pad_id,
+                "do_sample": not sampling.greedy,
+            }
+            if not sampling.greedy:
+                gen_kwargs.update(temperature=sampling.temperature, top_p=sampling.top_p)
+            if prefix_kv is not None:
+                # generate 会修改传入的 cache，每批复制一份并扩展到 batch × n
+                cache = copy.deepcopy(prefix_kv)
+                cache.batch_repeat_interleave(len(batch) * sampling.n)
+                gen_kwargs["past_key_values"] = cache
+            with self.torch.no_grad():
+                generated = self.model.generate(input_ids=input_ids, attention_mask=attention_mask, **gen_kwargs)
+            new_tokens = generated[:, input_ids.shape[1]:]
+            texts = self._tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+            output_tokens += int((new_tokens != pad_id).sum())
+            for j, text in enumerate(texts):
+                outputs[batch[j // sampling.n]].append(truncate_at_stop(text, sampling.stop))
+
+        self.last_stats = {
+            "batches": len(batches),
+            "padded_tokens": padded_tokens,
+            "prefix_tokens": prefix_len,
+        }
+        return GenerationResult(outputs, sum(lengths), output_tokens)
+
+    def close(self) -> None:
+        del self.model
+        if self.torch.cuda.is_available():
+            self.torch.cuda.empty_cache()
+
+
+@register_backend("fake")
+class FakeBackend(GenerationBackend):
+    """
+    确定性的假后端，用于CPU上的流水线测试
+
+    model_path 可以指向一个 JSONL 文件，每行 {"prompt": ..., "completion": ...}，
+    命中的提示词返回对应补全，其余返回 default_completion
+    """
+
+    load_count = 0
+
+    def __init__(
+        self,
+        model_path: str,
+        responses: Optional[Dict[str, str]] = None,
+        default_completion: str = "    pass\n",
+        latency: float = 0.0,
+        **kwargs: Any,
+    ):
+        super().__init__(model_path, **kwargs)
+        FakeBackend.load_count += 1
+        self.responses: Dict[str, str] = dict(responses or {})
+        self.default_completion = default_completion
+        self.latency = latency
+        path = Path(model_path)
+        if path.is_file() and path.suffix == ".jsonl":
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.responses[record["prompt"]] = record["completion"]
+
+    def _completion(self, prompt: str, index: int) -> str:
+        if prompt in self.responses:
+            return self.responses[prompt]
+        if index == 0:
+            return self.default_completion
+        # 多次采样时用提示词哈希生成不同但确定的补全
+        digest = hashlib.sha1(f"{prompt}\x00{index}".encode("utf-8")).hexdigest()[:8]
+        return f"{self.default_completion}    # sample {digest}\n"
+
+    def generate(self, prompts: List[str], sampling: SamplingConfig) -> GenerationResult:
+        if self.latency:
+            time.sleep(self.latency * len(prompts))
+        outputs = [
+            [truncate_at_stop(self._completion(p, i), sampling.stop) for i in range(sampling.n)]
+            for p in prompts
+        ]
+        output_tokens = sum(len(t.split()) for texts in outputs for t in texts)
+        prompt_tokens = sum(len(p.split()) for p in prompts)
+        return GenerationResult(outputs, prompt_tokens, output_tokens)
@@ -0,0 +1,85 @@
+"""
+进程内代码生成
+一次性批量生成全部 HumanEval+ 提示词，输出 EvalPlus 兼容的样本文件
+"""
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .backends import GenerationBackend, SamplingConfig
+from .humaneval import build_prompt, samples_filename, stop_sequences
+
+
+@dataclass
+class CodegenStats:
+    samples_file: Path
+    n_tasks: int
+    n_samples: int
+    prompt_tokens: int
+    output_tokens: int
+    output_chars: int
+
+
+def run_codegen(
+    problems: Dict[str, Dict[str, Any]],
+    backend: GenerationBackend,
+    root: Union[str, Path],
+    dataset: str = "humaneval",
+    eval_mode: str = "base",
+    force_base_prompt: bool = True,
+    n_samples: int = 1,
+    temperature: float = 0.0,
+    max_new_tokens: int = 768,
+    top_p: float = 0.95,
+    samples_file: Optional[Union[str, Path]] = None,
+) -> CodegenStats:
+    """
+    生成样本并写入 {root}/{dataset}/{model}_{backend}_temp_{t}.jsonl
+
+    直接补全模式下 solution = prompt + completion，chat模式下 solution 为模型输出，
+    交由后续的清洗/执行阶段处理
+    """
+    task_ids = list(problems)
+    prompts = [
+        build_prompt(problems[tid], eval_mode, force_base_prompt, backend.tokenizer)
+        for tid in task_ids
+    ]
+    direct_completion = force_base_prompt or eval_mode == "base"
+    sampling = SamplingConfig(
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        n=n_samples,
+        stop=stop_sequences(eval_mode, force_base_prompt),
+    )
+    result = backend.generate(prompts, sampling)
+
+    if samples_file is None:
+        samples_file = Path(root) / dataset / samples_filename(
+            backend.model_path, backend.name, temperature
+        )
+    samples_file = Path(samples_file)
+    samples_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = samples_file.with_name(samples_file.name + f".tmp{os.getpid()}")
+
+    output_chars = 0
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        for tid, completions in zip(task_ids, result.outputs):
+            prompt = problems[tid]["prompt"]
+            for completion in completions:
+                output_chars += len(completion)
+                solution = prompt + completion if direct_completion else completion
+                f.write(json.dumps({"task_id": tid, "solution": solution}, ensure_ascii=False) + "\n")
+    os.replace(tmp_file, samples_file)
+
+    return CodegenStats(
+        samples_file=samples_file,
+        n_tasks=len(task_ids),
+        n_samples=sum(len(c) for c in result.outputs),
+        prompt_tokens=result.prompt_tokens,
+        output_tokens=result.output_tokens,
+        output_chars=output_chars,
+    )
@@ -0,0 +1,521 @@
+"""
+HumanEval+ 测试执行
+- 用参考答案（canonical solution）的实测耗时为每个输入校准时间预算
+- 只需要 pass/fail 时，在第一个失败的输入处提前退出
+- 每个样本在独立的子进程中执行，记录每题执行耗时
+判定规则与 EvalPlus v0.3.1 保持一致，pass@1 结果相同
+执行前先经过 sanitize 清洗与语法预检
+"""
+
+import builtins
+import copy
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ..utils.cache import SqliteLRUCache
+from .result_cache import cache_key, cacheable, normalized_hash, suite_version
+from .sanitize import sanitize_batch
+
+PASS = "pass"
+FAIL = "fail"
+TIMEOUT = "timeout"
+
+# 与 EvalPlus 默认值一致
+DEFAULT_MIN_TIME_LIMIT = 1.0
+DEFAULT_GT_TIME_LIMIT_FACTOR = 4.0
+DEFAULT_TASK_TIMEOUT = 20.0
+DEFAULT_MAX_MEMORY_BYTES = 4 * 1024 ** 3
+
+SUITES = ("base", "plus")
+
+
+class _TimeoutException(Exception):
+    pass
+
+
+@dataclass
+class TaskHarness:
+    """单题的测试输入、参考输出与参考耗时"""
+
+    task_id: str
+    entry_point: str
+    atol: float
+    inputs: Dict[str, List[Any]]
+    expected: Dict[str, List[Any]]
+    ref_times: Dict[str, List[float]]
+
+    def time_limits(
+        self,
+        suite: str,
+        min_time_limit: float = DEFAULT_MIN_TIME_LIMIT,
+        gt_time_limit_factor: float = DEFAULT_GT_TIME_LIMIT_FACTOR,
+    ) -> List[float]:
+        """每个输入的时间上限 = max(最小时限, 参考耗时 × 系数)"""
+        return [max(min_time_limit, gt_time_limit_factor * t) for t in self.ref_times[suite]]
+
+    def suite_budget(
+        self,
+        suite: str,
+        min_time_limit: float = DEFAULT_MIN_TIME_LIMIT,
+        gt_time_limit_factor: float = DEFAULT_GT_TIME_LIMIT_FACTOR,
+        task_timeout: float = DEFAULT_TASK_TIMEOUT,
+    ) -> float:
+        """
+        单个测试集的时间预算 = min(task_timeout, 该测试集各输入时限之和) + 1s。
+        EvalPlus 为 base / plus 分别设置预算（各自独立的子进程），这里同样每个测试集单独计时
+        """
+        return min(task_timeout, sum(self.time_limits(suite, min_time_limit, gt_time_limit_factor))) + 1.0
+
+
+def _is_floats(x: Any) -> bool:
+    if isinstance(x, float):
+        return True
+    if isinstance(x, (list, tuple)) and x:
+        return all(isinstance(i, float) for i in x)
+    return False
+
+
+def _flatten(x: Any) -> List[Any]:
+    if isinstance(x, (list, tuple)):
+        flat: List[Any] = []
+        for item in x:
+            flat.extend(_flatten(item))
+        return flat
+    return [x]
+
+
+def _allclose(out: Any, exp: Any, atol: float, rtol: float = 1e-07) -> bool:
+    """numpy.testing.assert_allclose 的纯Python等价判断（含nan相等）"""
+    if isinstance(out, (list, tuple)) != isinstance(exp, (list, tuple)):
+        return False
+    out_flat = _flatten(out)
+    exp_flat = _flatten(exp)
+    if len(out_flat) != len(exp_flat):
+        return False
+    for a, b in zip(out_flat, exp_flat):
+        if isinstance(a, bool) or isinstance(b, bool) or not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+            if a != b:
+                return False
+            continue
+        if math.isnan(a) or math.isnan(b):
+            if not (math.isnan(a) and math.isnan(b)):
+                return False
+            continue
+        if math.isinf(a) or math.isinf(b):
+            if a != b:
+                return False
+            continue
+        if abs(a - b) > atol + rtol * abs(b):
+            return False
+    return True
+
+
+def _poly(xs: List[float], x: float) -> float:
+    return sum(coeff * math.pow(x, i) for i, coeff in enumerate(xs))
+
+
+def outputs_match(out: Any, exp: Any, atol: float, entry_point: str = "", inp: Any = None) -> bool:
+    """判断输出是否正确（find_zero 按多项式取值判断）"""
+    if entry_point == "find_zero":
+        try:
+            return abs(_poly(*inp, out)) <= atol
+        except Exception:
+            return False
+    if out == exp:
+        return True
+    if atol == 0 and _is_floats(exp):
+        atol = 1e-6
+    if atol != 0:
+        return _allclose(out, exp, atol)
+    return False
+
+
+def _load_function(code: str, entry_point: str) -> Any:
+    namespace: Dict[str, Any] = {"__name__": "__lightsft_exec__"}
+    exec(compile(code, f"<{entry_point}>", "exec"), namespace)
+    return namespace[entry_point]
+
+
+def build_harness(problem: Dict[str, Any]) -> TaskHarness:
+    """运行参考答案，得到期望输出和每个输入的参考耗时（参考答案可信，直接在当前进程执行）"""
+    fn = _load_function(problem["prompt"] + problem["canonical_solution"], problem["entry_point"])
+    inputs: Dict[str, List[Any]] = {}
+    expected: Dict[str, List[Any]] = {}
+    ref_times: Dict[str, List[float]] = {}
+    for suite in SUITES:
+        suite_inputs = problem.get(f"{suite}_input") or []
+        outs: List[Any] = []
+        times: List[float] = []
+        for inp in suite_inputs:
+            args = copy.deepcopy(inp)
+            start = time.perf_counter()
+            outs.append(fn(*args))
+            times.append(time.perf_counter() - start)
+        inputs[suite] = suite_inputs
+        expected[suite] = outs
+        ref_times[suite] = times
+    return TaskHarness(
+        task_id=problem["task_id"],
+        entry_point=problem["entry_point"],
+        atol=float(problem.get("atol") or 0),
+        inputs=inputs,
+        expected=expected,
+        ref_times=ref_times,
+    )
+
+
+def build_harnesses(problems: Dict[str, Dict[str, Any]], n_workers: Optional[int] = None) -> Dict[str, TaskHarness]:
+    """并行为所有题目计算参考输出"""
+    n_workers = n_workers or min(len(problems), os.cpu_count() or 1) or 1
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context()) as pool:
+        harnesses = list(pool.map(build_harness, problems.values()))
+    return {h.task_id: h for h in harnesses}
+
+
+def mp_context() -> Any:
+    # fork 启动最快，子进程直接继承父进程中已加载的测试数据
+    if sys.platform.startswith("linux"):
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+def _current_vm_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def reliability_guard(max_memory_bytes: int) -> None:
+    """限制内存并禁用破坏性函数（不是完整的安全沙箱）"""
+    if max_memory_bytes:
+        # fork出的子进程继承了父进程的地址空间（父进程可能已加载模型），在此基础上再放宽 max_memory_bytes
+        limit = _current_vm_bytes() + max_memory_bytes
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    os.environ["OMP_NUM_THREADS"] = "1"
+    builtins.exit = None  # type: ignore[assignment]
+    builtins.quit = None  # type: ignore[assignment]
+    for name in ("kill", "system", "putenv", "remove", "removedirs", "rmdir", "fchdir",
+                 "setuid", "fork", "forkpty", "killpg", "rename", "renames", "truncate",
+                 "replace", "unlink", "fchmod", "fchown", "chmod", "chown", "chroot", "lchown"):
+        if hasattr(os, name):
+            setattr(os, name, None)
+    shutil.rmtree = None  # type: ignore[assignment]
+    shutil.move = None  # type: ignore[assignment]
+    shutil.chown = None  # type: ignore[assignment]
+    import subprocess
+
+    subprocess.Popen = None  # type: ignore[misc,assignment]
+
+
+def _timeout_handler(signum: int, frame: Any) -> None:
+    raise _TimeoutException()
+
+
+def _untrusted_worker(
+    code: str,
+    harness: TaskHarness,
+    suites: List[str],
+    limits: Dict[str, List[float]],
+    fast_check: bool,
+    max_memory_bytes: int,
+    workdir: str,
+    conn: Any,
+) -> None:
+    """子进程：依次执行各测试集，每完成一个测试集就回传结果"""
+    os.chdir(workdir)
+    devnull = open(os.devnull, "w")
+    sys.stdout = devnull
+    sys.stderr = devnull
+    signal.signal(signal.SIGALRM, _timeout_handler)
+    reliability_guard(max_memory_bytes)
+
+    try:
+        signal.setitimer(signal.ITIMER_REAL, DEFAULT_MIN_TIME_LIMIT)
+        fn = _load_function(code, harness.entry_point)
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    except BaseException as e:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        status = TIMEOUT if isinstance(e, _TimeoutException) else FAIL
+        for suite in suites:
+            conn.send((suite, status, [0] if harness.inputs[suite] else [], 0.0))
+        return
+
+    for suite in suites:
+        start = time.perf_counter()
+        status = PASS
+        failed: List[int] = []
+        for i, inp in enumerate(harness.inputs[suite]):
+            args = copy.deepcopy(inp)
+            try:
+                signal.setitimer(signal.ITIMER_REAL, limits[suite][i])
+                out = fn(*args)
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                ok = outputs_match(out, harness.expected[suite][i], harness.atol, harness.entry_point, inp)
+            except _TimeoutException:
+                ok = False
+                status = TIMEOUT
+            except BaseException:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+                ok = False
+            if not ok:
+                failed.append(i)
+                if status == PASS:
+                    status = FAIL
+                if fast_check:
+                    break
+        conn.send((suite, status, failed, time.perf_counter() - start))
+
+
+def check_solution(
+    solution: str,
+    harness: TaskHarness,
+    fast_check: bool = True,
+    min_time_limit: float = DEFAULT_MIN_TIME_LIMIT,
+    gt_time_limit_factor: float = DEFAULT_GT_TIME_LIMIT_FACTOR,
+    task_timeout: float = DEFAULT_TASK_TIMEOUT,
+    max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+) -> Dict[str, Any]:
+    """在子进程中执行一个样本，返回 EvalPlus 格式的单题结果（附带执行耗时）"""
+    limits = {s: harness.time_limits(s, min_time_limit, gt_time_limit_factor) for s in SUITES}
+    budgets = {s: harness.suite_budget(s, min_time_limit, gt_time_limit_factor, task_timeout) for s in SUITES}
+    ctx = mp_context()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    workdir = tempfile.mkdtemp(prefix="lightsft_exec_")
+
+    start = time.perf_counter()
+    process = ctx.Process(
+        target=_untrusted_worker,
+        args=(solution, harness, list(SUITES), limits, fast_check, max_memory_bytes, workdir, child_conn),
+        daemon=True,
+    )
+    process.start()
+    child_conn.close()
+
+    suite_results: Dict[str, Tuple[str, List[int], float]] = {}
+    # 测试集按顺序执行：第一个测试集的预算从进程启动算起（与 EvalPlus 一样包含启动和导入），
+    # 之后每收到一个测试集的结果，下一个测试集重新计时
+    suite_start = start
+    timed_out = False
+    try:
+        while len(suite_results) < len(SUITES):
+            remaining = budgets[SUITES[len(suite_results)]] - (time.perf_counter() - suite_start)
+            if remaining <= 0 or not parent_conn.poll(remaining):
+                timed_out = True
+                break
+            suite, status, failed, elapsed = parent_conn.recv()
+            suite_results[suite] = (status, failed, elapsed)
+            suite_start = time.perf_counter()
+    except EOFError:
+        # 子进程异常退出（如内存超限），未回传的测试集按失败处理
+        pass
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    exec_time = time.perf_counter() - start
+    result: Dict[str, Any] = {"task_id": harness.task_id, "solution": solution, "exec_time": round(exec_time, 4)}
+    for suite in SUITES:
+        if suite in suite_results:
+            status, failed, elapsed = suite_results[suite]
+        else:
+            status = TIMEOUT if timed_out else FAIL
+            failed, elapsed = ([0] if harness.inputs[suite] else []), 0.0
+        result[f"{suite}_status"] = status
+        result[f"{suite}_fail_tests"] = [harness.inputs[suite][i] for i in failed]
+        result[f"{suite}_time"] = round(elapsed, 4)
+    return result
+
+
+def failed_result(solution: str, harness: TaskHarness, reason: str) -> Dict[str, Any]:
+    """未执行即判定失败的结果（如清洗阶段发现语法错误）"""
+    result: Dict[str, Any] = {"task_id": harness.task_id, "solution": solution, "exec_time": 0.0}
+    for suite in SUITES:
+        result[f"{suite}_status"] = FAIL
+        result[f"{suite}_fail_tests"] = harness.inputs[suite][:1]
+        result[f"{suite}_time"] = 0.0
+    result["fail_reason"] = reason
+    return result
+
+
+def dataset_hash(dataset_path: Union[str, Path]) -> str:
+    digest = hashlib.md5()
+    with open(dataset_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def eval_results_path(samples_file: Union[str, Path]) -> Path:
+    """与 EvalPlus 相同的结果文件命名"""
+    samples_file = Path(samples_file)
+    stem = samples_file.name[:-len(".jsonl")] if samples_file.name.endswith(".jsonl") else samples_file.name
+    return samples_file.with_name(stem + "_eval_results.json")
+
+
+@dataclass
+class LocalExecutor:
+    """
+    进程内测试执行器，可作为 EvalService 的 executor 使用
+
+    参考输出在第一次使用时计算，并在执行器生命周期内复用；
+    设置 harness_cache_dir 后直接读取按数据集哈希命名的预编译测试集；
+    设置 cache_path 后执行结果按 (task_id, 归一化AST哈希, 测试集版本) 持久化缓存，
+    扫描多个相邻checkpoint时只执行新出现的程序
+    """
+
+    dataset_path: Union[str, Path]
+    n_workers: int = field(default_factory=lambda: max(1, (os.cpu_count() or 2) // 2))
+    fast_check: bool = True
+    min_time_limit: float = DEFAULT_MIN_TIME_LIMIT
+    gt_time_limit_factor: float = DEFAULT_GT_TIME_LIMIT_FACTOR
+    task_timeout: float = DEFAULT_TASK_TIMEOUT
+    cache_path: Optional[Union[str, Path]] = None
+    cache_max_bytes: int = 2 << 30
+    harness_cache_dir: Optional[Union[str, Path]] = None
+    last_timings: Dict[str, float] = field(default_factory=dict, init=False)
+    _harnesses: Optional[Dict[str, TaskHarness]] = field(default=None, init=False, repr=False)
+    _dataset_digest: Optional[str] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.cache = SqliteLRUCache(self.cache_path, self.cache_max_bytes) if self.cache_path else None
+
+    @property
+    def dataset_digest(self) -> str:
+        if self._dataset_digest is None:
+            self._dataset_digest = dataset_hash(self.dataset_path)
+        return self._dataset_digest
+
+    @property
+    def test_suite_version(self) -> str:
+        return suite_version(
+            self.dataset_digest,
+            fast_check=self.fast_check,
+            min_time_limit=self.min_time_limit,
+            gt_time_limit_factor=self.gt_time_limit_factor,
+            task_timeout=self.task_timeout,
+        )
+
+    @property
+    def harnesses(self) -> Dict[str, TaskHarness]:
+        if self._harnesses is None:
+            if self.harness_cache_dir is not None:
+                from .harness_cache import load_harnesses
+
+                self._harnesses = load_harnesses(
+                    self.dataset_path, self.harness_cache_dir, self.n_workers, self.dataset_digest
+                )
+            else:
+                from .humaneval import load_problems
+
+                self._harnesses = build_harnesses(load_problems(self.dataset_path), self.n_workers)
+        return self._harnesses
+
+    def evaluate(self, samples: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """清洗并执行样本列表，返回 {task_id: [result, ...]}，顺序与输入一致"""
+        harnesses = self.harnesses
+        samples = [s for s in samples if s["task_id"] in harnesses]
+
+        start = time.perf_counter()
+        sanitized = sanitize_batch(
+            [s["solution"] for s in samples],
+            [harnesses[s["task_id"]].entry_point for s in samples],
+        )
+        self.last_timings["sanitize"] = time.perf_counter() - start
+        self.last_timings["precheck_failed"] = sum(1 for r in sanitized if not r.ok)
+
+        # 查询执行结果缓存，同一批次内相同的解也只执行一次
+        keys: List[Optional[str]] = [None] * len(samples)
+        cached: Dict[str, Dict[str, Any]] = {}
+        if self.cache is not None:
+            version = self.test_suite_version
+            for i, (sample, clean) in enumerate(zip(samples, sanitized)):
+                code_hash = normalized_hash(clean.code) if clean.ok else None
+                if code_hash is not None:
+                    keys[i] = cache_key(sample["task_id"], code_hash, version)
+            cached = self.cache.get_many(k for k in keys if k is not None)
+        self.last_timings["cache_hits"] = sum(1 for k in keys if k is not None and k in cached)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.n_workers) as pool:
+            futures: Dict[Any, Future] = {}
+            executed = 0
+            for i, (sample, clean) in enumerate(zip(samples, sanitized)):
+                harness = harnesses[sample["task_id"]]
+                if not clean.ok:
+                    # 语法错误/缺少入口函数：无需启动子进程即可判定失败
+                    futures[i] = pool.submit(failed_result, clean.code, harness, clean.status)
+                    continue
+                key = keys[i]
+                if key is not None and (key in cached or key in futures):
+                    continue
+                executed += 1
+                futures[key if key is not None else i] = pool.submit(
+                    check_solution,
+                    clean.code,
+                    harness,
+                    self.fast_check,
+                    self.min_time_limit,
+                    self.gt_time_limit_factor,
+                    self.task_timeout,
+                )
+
+            fresh: Dict[str, Dict[str, Any]] = {}
+            results: Dict[str, List[Dict[str, Any]]] = {}
+            for i, (sample, clean) in enumerate(zip(samples, sanitized)):
+                key = keys[i]
+                if key is not None and key in cached:
+                    result = {**cached[key], "cached": True}
+                else:
+                    result = dict(futures[key if key is not None else i].result())
+                    if key is not None and cacheable(result):
+                        fresh[key] = {k: v for k, v in result.items() if k != "solution"}
+                result["solution"] = clean.code
+                result["sanitize_status"] = clean.status
+                results.setdefault(result["task_id"], []).append(result)
+        self.last_timings["execute"] = time.perf_counter() - start
+        # 只统计真正启动子进程执行的样本，预检失败的样本不计入
+        self.last_timings["executed"] = executed
+        if self.cache is not None:
+            self.cache.put_many(fresh)
+        return results
+
+    def __call__(self, samples_file: Path, dataset: str = "humaneval") -> Path:
+        samples: List[Dict[str, Any]] = []
+        with open(samples_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    samples.append(json.loads(line))
+        start = time.perf_counter()
+        eval_results = self.evaluate(samples)
+        elapsed = time.perf_counter() - start
+        output = {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+            "hash": self.dataset_digest,
+            "exec_time": round(elapsed, 3),
+            "timings": {k: round(v, 4) for k, v in self.last_timings.items()},
+            "eval": eval_results,
+        }
+        results_file = eval_results_path(samples_file)
+        with open(results_file, "w", encoding="utf-8") as f:
+            json.dump(output, f)
+        print(f"✓ 测试执行完成: {len(samples)} 个样本，耗时 {elapsed:.1f}s -> {results_file}")
+        return results_file
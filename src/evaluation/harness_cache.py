@@ -0,0 +1,89 @@
+"""
+预编译的 HumanEval+ 测试集缓存
+一次性把数据集解析为 TaskHarness（测试输入、参考输出、参考耗时），以 pickle 持久化；
+缓存文件名包含数据集文件哈希与格式版本，数据集变化后自动重建。
+加载后的测试集常驻父进程，执行样本的子进程通过 fork 直接继承，不再逐题重新解析
+"""
+
+import mmap
+import os
+import pickle
+import platform
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+from .execution import TaskHarness, build_harnesses, dataset_hash
+
+# TaskHarness 字段或序列化方式变化时递增
+HARNESS_FORMAT_VERSION = 1
+
+
+def harness_cache_path(cache_dir: Union[str, Path], digest: str) -> Path:
+    return Path(cache_dir) / f"humaneval_harness_v{HARNESS_FORMAT_VERSION}_{digest}.pkl"
+
+
+def compile_harnesses(
+    dataset_path: Union[str, Path],
+    cache_dir: Union[str, Path],
+    n_workers: Optional[int] = None,
+    digest: Optional[str] = None,
+) -> Path:
+    """解析数据集并运行参考答案，写入缓存文件（先写临时文件再原子替换）"""
+    from .humaneval import load_problems
+
+    digest = digest or dataset_hash(dataset_path)
+    start = time.perf_counter()
+    harnesses = build_harnesses(load_problems(dataset_path), n_workers)
+    payload = {
+        "format_version": HARNESS_FORMAT_VERSION,
+        "dataset_hash": digest,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        # 参考耗时与机器相关，记录编译机器便于排查时限差异
+        "host": platform.node(),
+        "harnesses": [asdict(h) for h in harnesses.values()],
+    }
+    path = harness_cache_path(cache_dir, digest)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    print(f"✓ 测试集已编译: {len(harnesses)} 题，耗时 {time.perf_counter() - start:.1f}s -> {path}")
+    return path
+
+
+def read_harness_cache(path: Union[str, Path], digest: Optional[str] = None) -> Optional[Dict[str, TaskHarness]]:
+    """通过 mmap 读取缓存文件；文件不存在、损坏或指纹不一致时返回 None"""
+    path = Path(path)
+    if not path.exists() or path.stat().st_size == 0:
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            payload: Dict[str, Any] = pickle.loads(mm)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+    if payload.get("format_version") != HARNESS_FORMAT_VERSION:
+        return None
+    if digest is not None and payload.get("dataset_hash") != digest:
+        return None
+    return {h["task_id"]: TaskHarness(**h) for h in payload["harnesses"]}
+
+
+def load_harnesses(
+    dataset_path: Union[str, Path],
+    cache_dir: Union[str, Path],
+    n_workers: Optional[int] = None,
+    digest: Optional[str] = None,
+) -> Dict[str, TaskHarness]:
+    """优先读取缓存，缺失或过期时重新编译"""
+    digest = digest or dataset_hash(dataset_path)
+    path = harness_cache_path(cache_dir, digest)
+    harnesses = read_harness_cache(path, digest)
+    if harnesses is None:
+        compile_harnesses(dataset_path, cache_dir, n_workers, digest)
+        harnesses = read_harness_cache(path, digest)
+        if harnesses is None:
+            raise RuntimeError(f"测试集缓存写入后无法读取: {path}")
+    return harnesses
@@ -0,0 +1,125 @@
+"""
+HumanEval+ 数据集读取与提示词构造
+与 EvalPlus v0.3.1 的提示词格式保持一致，保证进程内生成与CLI生成结果可比
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# EvalPlus 通用停止符
+EOS = [
+    "<|endoftext|>",
+    "<|endofmask|>",
+    "</s>",
+    "\nif __name__",
+    "\ndef main(",
+    "\nprint(",
+]
+
+# 直接补全（base prompt）模式额外的停止符，防止模型继续生成下一个函数
+DIRECT_COMPLETION_EOS = ["\ndef ", "\nclass ", "\nimport ", "\nfrom ", "\nassert "]
+# chat 模式的提示以 ```python 开启代码块，生成到闭合栅栏即可停止（与 EvalPlus 一致）
+CHAT_EOS = ["\n```\n"]
+
+INSTRUCTION_PREFIX = (
+    "Please provide a self-contained Python script that solves the following problem "
+    "in a markdown code block:"
+)
+RESPONSE_PREFIX = (
+    "Below is a Python script with a self-contained function that solves the problem "
+    "and passes corresponding tests:"
+)
+
+
+def load_problems(dataset_path: Union[str, Path]) -> Dict[str, Dict[str, Any]]:
+    """读取 HumanEvalPlus.jsonl，返回按文件顺序排列的 {task_id: problem}"""
+    problems: Dict[str, Dict[str, Any]] = {}
+    with open(dataset_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            problem = json.loads(line)
+            problems[problem["task_id"]] = problem
+    return problems
+
+
+def make_chat_prompt(task_prompt: str, tokenizer: Optional[Any] = None) -> str:
+    """构造与 EvalPlus 一致的chat提示词，返回在 ```python 之后截断的前缀"""
+    user_content = f"{INSTRUCTION_PREFIX}\n```\n{task_prompt.strip()}\n```"
+    response = f"{RESPONSE_PREFIX}\n```python\n[PLACEHOLDER]\n```"
+    if tokenizer is not None and getattr(tokenizer, "chat_template", None):
+        rendered = tokenizer.apply_chat_template(
+            [
+                {"role": "user", "content": user_content},
+                {"role": "assistant", "content": response},
+            ],
+            tokenize=False,
+        )
+    else:
+        # 无chat模板时退化为Qwen的ChatML格式
+        rendered = (
+            f"<|im_start|>user\n{user_content}<|im_end|>\n"
+            f"<|im_start|>assistant\n{response}<|im_end|>\n"
+        )
+    return rendered.split("[PLACEHOLDER]")[0]
+
+
+def build_prompt(
+    problem: Dict[str, Any],
+    eval_mode: str = "base",
+    force_base_prompt: bool = True,
+    tokenizer: Optional[Any] = None,
+) -> str:
+    """根据评测模式构造提示词；force_base_prompt 时所有模型均使用直接补全"""
+    if force_base_prompt or eval_mode == "base":
+        return str(problem["prompt"])
+    return make_chat_prompt(problem["prompt"], tokenizer)
+
+
+def stop_sequences(eval_mode: str = "base", force_base_prompt: bool = True) -> List[str]:
+    stops = list(EOS)
+    if force_base_prompt or eval_mode == "base":
+        stops.extend(DIRECT_COMPLETION_EOS)
+    else:
+        stops.extend(CHAT_EOS)
+    return stops
+
+
+def truncate_at_stop(text: str, stops: List[str]) -> str:
+    """在最早出现的停止符处截断（vLLM已原生处理，HF后端需要手动截断）"""
+    cut = len(text)
+    for stop in stops:
+        idx = text.find(stop)
+        if idx != -1:
+            cut = min(cut, idx)
+    return text[:cut]
+
+
+def samples_filename(model_path: str, backend: str, temperature: float) -> str:
+    """与 EvalPlus codegen 相同的样本文件命名规则"""
+    identifier = model_path.strip("./").replace("/", "--")
+    return f"{identifier}_{backend}_temp_{temperature}.jsonl"
+
+
+def summarize_eval_results(results: Dict[str, Any]) -> Dict[str, Any]:
+    """统计 EvalPlus 结果文件中的 pass@1（每题取第一个样本）"""
+    eval_results = results.get("eval", results)
+    total = len(eval_results)
+    base_pass = 0
+    plus_pass = 0
+    for task_results in eval_results.values():
+        if not task_results:
+            continue
+        first = task_results[0]
+        if first.get("base_status") == "pass":
+            base_pass += 1
+        if first.get("base_status") == "pass" and first.get("plus_status") == "pass":
+            plus_pass += 1
+    return {
+        "total": total,
+        "base_pass": base_pass,
+        "plus_pass": plus_pass,
+        "pass@1_base": base_pass / total if total else 0.0,
+        "pass@1_plus": plus_pass / total if total else 0.0,
+    }
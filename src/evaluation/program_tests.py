@@ -0,0 +1,384 @@
+"""
+竞赛编程解的执行验证
+APPS（input_output）与 code_contests（public/private/generated_tests）自带测试用例：
+在沙箱子进程中逐个运行候选 Python 解，保留第一个通过全部测试的解。
+判定结果按 (测试集哈希, 归一化AST哈希, 执行参数) 缓存，重复运行时直接复用
+"""
+
+import builtins
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ..utils.cache import SqliteLRUCache
+from .execution import DEFAULT_MAX_MEMORY_BYTES, FAIL, PASS, TIMEOUT, mp_context, reliability_guard
+from .result_cache import cache_key, normalized_hash, suite_version
+
+# code_contests 的 solutions.language 编码：1=Python2, 2=C++, 3=Python3, 4=Java
+CODE_CONTESTS_PYTHON3 = 3
+
+DEFAULT_TEST_TIME_LIMIT = 4.0
+DEFAULT_SOLUTION_TIMEOUT = 60.0
+DEFAULT_MAX_TESTS = 50
+
+
+class _TestTimeout(Exception):
+    pass
+
+
+def _timeout_handler(signum: int, frame: Any) -> None:
+    raise _TestTimeout()
+
+
+@dataclass
+class ProgramTests:
+    """
+    一道题的测试用例
+
+    fn_name 为空时为标准输入输出题（inputs/outputs 为字符串）；
+    否则为函数调用题（inputs 为参数列表），LeetCode 风格的题目通过 Solution 类调用
+    """
+
+    inputs: List[Any]
+    outputs: List[Any]
+    fn_name: Optional[str] = None
+    class_based: bool = False
+
+    def __len__(self) -> int:
+        return len(self.inputs)
+
+    def digest(self) -> str:
+        payload = json.dumps([self.inputs, self.outputs, self.fn_name, self.class_based], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def limited(self, max_tests: Optional[int]) -> "ProgramTests":
+        if not max_tests or len(self) <= max_tests:
+            return self
+        return ProgramTests(self.inputs[:max_tests], self.outputs[:max_tests], self.fn_name, self.class_based)
+
+
+def apps_problem(row: Dict[str, Any]) -> Tuple[List[str], Optional[ProgramTests]]:
+    """从 APPS 记录中取出候选解与测试用例（input_output 为 JSON 字符串）"""
+    solutions = row.get("solutions") or []
+    if isinstance(solutions, str):
+        solutions = json.loads(solutions) if solutions.strip() else []
+    raw = row.get("input_output") or ""
+    try:
+        spec = json.loads(raw) if isinstance(raw, str) else raw
+    except ValueError:
+        spec = None
+    if not spec or not spec.get("inputs"):
+        return list(solutions), None
+    fn_name = spec.get("fn_name")
+    starter = row.get("starter_code") or ""
+    tests = ProgramTests(
+        inputs=list(spec["inputs"]),
+        outputs=list(spec.get("outputs") or []),
+        fn_name=fn_name,
+        class_based=bool(fn_name) and "class Solution" in starter,
+    )
+    return list(solutions), tests
+
+
+def code_contests_problem(row: Dict[str, Any], include_generated: bool = False) -> Tuple[List[str], Optional[ProgramTests]]:
+    """从 code_contests 记录中取出 Python3 候选解与测试用例（public + private，可选 generated）"""
+    solutions = row.get("solutions") or {}
+    candidates: List[str] = []
+    if isinstance(solutions, dict):
+        languages = list(solutions.get("language") or [])
+        codes = list(solutions.get("solution") or [])
+        candidates = [code for lang, code in zip(languages, codes) if lang == CODE_CONTESTS_PYTHON3 and code]
+    inputs: List[str] = []
+    outputs: List[str] = []
+    suites = ["public_tests", "private_tests"] + (["generated_tests"] if include_generated else [])
+    for suite in suites:
+        tests = row.get(suite) or {}
+        inputs.extend(list(tests.get("input") or []))
+        outputs.extend(list(tests.get("output") or []))
+    if not inputs:
+        return candidates, None
+    return candidates, ProgramTests(inputs, outputs)
+
+
+def apps_keep_solution(row: Dict[str, Any], code: str) -> Dict[str, Any]:
+    return {**row, "solutions": [code]}
+
+
+def code_contests_keep_solution(row: Dict[str, Any], code: str) -> Dict[str, Any]:
+    return {**row, "solutions": {"language": [CODE_CONTESTS_PYTHON3], "solution": [code]}}
+
+
+# 数据集名 -> (提取候选解与测试, 用已验证解改写记录)
+VERIFIABLE_DATASETS = {
+    "apps": (apps_problem, apps_keep_solution),
+    "code_contests": (code_contests_problem, code_contests_keep_solution),
+}
+
+
+def _tokens_match(out: str, expected: str) -> bool:
+    """按空白切分后逐词比较，数值允许 1e-6 误差（与常见评测机的宽松判定一致）"""
+    out_tokens = out.split()
+    exp_tokens = expected.split()
+    if out_tokens == exp_tokens:
+        return True
+    if len(out_tokens) != len(exp_tokens):
+        return False
+    for a, b in zip(out_tokens, exp_tokens):
+        if a == b:
+            continue
+        try:
+            fa, fb = float(a), float(b)
+        except ValueError:
+            return False
+        if not math.isclose(fa, fb, rel_tol=1e-6, abs_tol=1e-6):
+            return False
+    return True
+
+
+def stdio_match(out: str, expected: Any) -> bool:
+    if isinstance(expected, list):
+        expected = "\n".join(str(e) for e in expected)
+    return _tokens_match(out, str(expected))
+
+
+def call_match(out: Any, expected: Any) -> bool:
+    """APPS 函数调用题的期望输出通常包在一层列表里，元组按列表比较"""
+    if isinstance(out, tuple):
+        out = list(out)
+    if out == expected:
+        return True
+    return isinstance(expected, list) and len(expected) == 1 and out == expected[0]
+
+
+def _run_stdio(code_obj: Any, inp: Any) -> str:
+    if isinstance(inp, list):
+        inp = "\n".join(str(i) for i in inp)
+    stdin = io.TextIOWrapper(io.BytesIO(str(inp).encode("utf-8")), encoding="utf-8")
+    out_buf = io.BytesIO()
+    stdout = io.TextIOWrapper(out_buf, encoding="utf-8", write_through=True)
+    sys.stdin, sys.stdout = stdin, stdout
+    try:
+        exec(code_obj, {"__name__": "__main__", "__builtins__": builtins})
+    except SystemExit:
+        pass
+    finally:
+        stdout.flush()
+        sys.stdout = sys.__stdout__
+    return out_buf.getvalue().decode("utf-8", errors="replace")
+
+
+def _run_call(code_obj: Any, tests: ProgramTests, inp: Any) -> Any:
+    namespace: Dict[str, Any] = {"__name__": "__lightsft_exec__", "__builtins__": builtins}
+    exec(code_obj, namespace)
+    if tests.class_based:
+        fn = getattr(namespace["Solution"](), tests.fn_name)
+    else:
+        fn = namespace[tests.fn_name]
+    args = inp if isinstance(inp, list) else [inp]
+    return fn(*args)
+
+
+def _program_worker(
+    code: str,
+    tests: ProgramTests,
+    time_limit: float,
+    max_memory_bytes: int,
+    workdir: str,
+    conn: Any,
+) -> None:
+    """子进程：依次运行全部测试，遇到第一个失败即停止，回传 (状态, 通过数)"""
+    os.chdir(workdir)
+    devnull = open(os.devnull, "w")
+    sys.stderr = devnull
+    signal.signal(signal.SIGALRM, _timeout_handler)
+    reliability_guard(max_memory_bytes)
+    # 竞赛代码常用 exit()/quit() 提前结束，按正常结束处理
+    builtins.exit = builtins.quit = sys.exit  # type: ignore[assignment]
+    sys.setrecursionlimit(10 ** 5)
+
+    try:
+        code_obj = compile(code, "<solution>", "exec")
+    except BaseException:
+        conn.send((FAIL, 0))
+        return
+
+    passed = 0
+    for inp, expected in zip(tests.inputs, tests.outputs):
+        try:
+            signal.setitimer(signal.ITIMER_REAL, time_limit)
+            if tests.fn_name:
+                ok = call_match(_run_call(code_obj, tests, inp), expected)
+            else:
+                ok = stdio_match(_run_stdio(code_obj, inp), expected)
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        except _TestTimeout:
+            sys.stdout = devnull
+            conn.send((TIMEOUT, passed))
+            return
+        except BaseException:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            sys.stdout = devnull
+            ok = False
+        if not ok:
+            conn.send((FAIL, passed))
+            return
+        passed += 1
+    conn.send((PASS, passed))
+
+
+def run_program_tests(
+    code: str,
+    tests: ProgramTests,
+    time_limit: float = DEFAULT_TEST_TIME_LIMIT,
+    solution_timeout: float = DEFAULT_SOLUTION_TIMEOUT,
+    max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+) -> Dict[str, Any]:
+    """在子进程中对一个解运行全部测试，返回 {"status", "passed", "total", "exec_time"}"""
+    ctx = mp_context()
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    workdir = tempfile.mkdtemp(prefix="lightsft_prog_")
+    budget = min(solution_timeout, time_limit * max(len(tests), 1)) + 1.0
+
+    start = time.perf_counter()
+    process = ctx.Process(
+        target=_program_worker,
+        args=(code, tests, time_limit, max_memory_bytes, workdir, child_conn),
+        daemon=True,
+    )
+    process.start()
+    child_conn.close()
+    status, passed = TIMEOUT, 0
+    try:
+        if parent_conn.poll(budget):
+            status, passed = parent_conn.recv()
+    except EOFError:
+        # 子进程异常退出（如内存超限）
+        status = FAIL
+    finally:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        parent_conn.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"status": status, "passed": passed, "total": len(tests), "exec_time": round(time.perf_counter() - start, 4)}
+
+
+@dataclass
+class SolutionVerifier:
+    """
+    候选解验证器：每道题按顺序验证候选解，返回第一个通过的解
+
+    n_workers 个线程各自驱动一个沙箱子进程，64 核机器上可设为 60 左右；
+    设置 cache_path 后判定结果持久化，超时结果受负载影响不缓存
+    """
+
+    n_workers: int = field(default_factory=lambda: max(1, (os.cpu_count() or 2) - 2))
+    time_limit: float = DEFAULT_TEST_TIME_LIMIT
+    solution_timeout: float = DEFAULT_SOLUTION_TIMEOUT
+    max_tests: Optional[int] = DEFAULT_MAX_TESTS
+    max_candidates: int = 8
+    max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES
+    cache_path: Optional[Union[str, Path]] = None
+    cache_max_bytes: int = 1 << 30
+    stats: Dict[str, int] = field(default_factory=dict, init=False)
+
+    def __post_init__(self) -> None:
+        self.cache = SqliteLRUCache(self.cache_path, self.cache_max_bytes) if self.cache_path else None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+        self.version = suite_version(
+            "program_tests",
+            time_limit=self.time_limit,
+            solution_timeout=self.solution_timeout,
+            max_tests=self.max_tests,
+        )
+
+    def reset_stats(self) -> None:
+        self.stats = {"problems": 0, "verified": 0, "no_tests": 0, "no_candidates": 0,
+                      "executed": 0, "cache_hits": 0, "syntax_errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def verdict(self, code: str, tests: ProgramTests, tests_digest: str) -> Dict[str, Any]:
+        code_hash = normalized_hash(code)
+        if code_hash is None:
+            # Python2 或无法解析的代码无需执行
+            self._count("syntax_errors")
+            return {"status": FAIL, "passed": 0, "total": len(tests), "reason": "syntax_error"}
+        key = cache_key(tests_digest, code_hash, self.version)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        result = run_program_tests(code, tests, self.time_limit, self.solution_timeout, self.max_memory_bytes)
+        self._count("executed")
+        if self.cache is not None and result["status"] != TIMEOUT:
+            self.cache.put(key, result)
+        return result
+
+    def verify(self, candidates: List[str], tests: Optional[ProgramTests]) -> Optional[Tuple[int, str]]:
+        """按顺序验证候选解，返回第一个通过的 (下标, 代码)；没有测试或全部失败时返回 None"""
+        self._count("problems")
+        if tests is None or not tests.outputs:
+            self._count("no_tests")
+            return None
+        if not candidates:
+            self._count("no_candidates")
+            return None
+        tests = tests.limited(self.max_tests)
+        digest = tests.digest()
+        for i, code in enumerate(candidates[:self.max_candidates]):
+            if self.verdict(code, tests, digest)["status"] == PASS:
+                self._count("verified")
+                return i, code
+        return None
+
+    def filter_rows(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        extract: Any,
+        rewrite: Any,
+        chunk_size: int = 512,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        流式过滤记录：extract(row) -> (候选解, 测试)，rewrite(row, code) -> 只保留已验证解的新记录；
+        每 chunk_size 条并行验证一次，按原顺序产出通过验证的记录
+        """
+        with ThreadPoolExecutor(max_workers=self.n_workers) as pool:
+            chunk: List[Dict[str, Any]] = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield from self._filter_chunk(pool, chunk, extract, rewrite)
+                    chunk = []
+            if chunk:
+                yield from self._filter_chunk(pool, chunk, extract, rewrite)
+
+    def _filter_chunk(self, pool: ThreadPoolExecutor, chunk: List[Dict[str, Any]], extract: Any,
+                      rewrite: Any) -> Iterator[Dict[str, Any]]:
+        futures: List[Future] = []
+        for row in chunk:
+            try:
+                candidates, tests = extract(row)
+            except Exception:
+                candidates, tests = [], None
+            futures.append(pool.submit(self.verify, candidates, tests))
+        for row, future in zip(chunk, futures):
+            verified = future.result()
+            if verified is not None:
+                yield rewrite(row, verified[1])
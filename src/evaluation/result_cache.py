@@ -0,0 +1,34 @@
+"""
+执行结果缓存的键
+(task_id, 归一化AST哈希, 测试集版本)：空白、注释不同但语法树相同的解共用同一条执行结果
+"""
+
+import ast
+import hashlib
+import json
+from typing import Any, Dict, Optional
+
+
+def normalized_hash(code: str) -> Optional[str]:
+    """对代码的语法树（不含行列号）求哈希，忽略空白和注释差异；无法解析时返回None"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    dumped = ast.dump(tree, annotate_fields=False, include_attributes=False)
+    return hashlib.sha256(dumped.encode("utf-8")).hexdigest()
+
+
+def suite_version(dataset_digest: str, **exec_params: Any) -> str:
+    """测试集版本 = 数据集文件哈希 + 影响结果的执行参数（时限、fast_check 等）"""
+    payload = json.dumps({"dataset": dataset_digest, **exec_params}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(task_id: str, code_hash: str, version: str) -> str:
+    return f"{task_id}|{code_hash}|{version}"
+
+
+def cacheable(result: Dict[str, Any]) -> bool:
+    """超时结果受机器负载影响，不写入缓存"""
+    return all(result.get(f"{suite}_status") != "timeout" for suite in ("base", "plus"))
@@ -0,0 +1,167 @@
+"""
+模型输出清洗与语法预检
+- 去掉 Qwen3 的 <think> 思考段
+- 从多个 markdown 代码块中选出定义了入口函数的那一个
+- 只保留顶层的 import / 函数 / 类 / 赋值，丢弃示例调用、print 和测试代码
+- AST 解析失败或缺少入口函数的输出直接判定失败，不再启动沙箱进程
+"""
+
+import ast
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+OK = "ok"
+NO_CODE = "no_code"
+SYNTAX_ERROR = "syntax_error"
+MISSING_ENTRY_POINT = "missing_entry_point"
+
+# 样本数超过该值时才启用进程池，避免进程启动开销大于清洗本身
+PARALLEL_THRESHOLD = 256
+
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+_FENCE = re.compile(r"```[ \t]*([\w+-]*)[ \t]*\n(.*?)(?:```|\Z)", re.DOTALL)
+_OPENING_FENCE = re.compile(r"[ \t]*[\w+-]+[ \t]*\n")
+_KEEP_NODES = (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef,
+               ast.Assign, ast.AnnAssign)
+
+
+@dataclass
+class SanitizeResult:
+    code: str
+    status: str
+
+    @property
+    def ok(self) -> bool:
+        return self.status == OK
+
+
+def strip_thinking(text: str) -> str:
+    """删除 <think>...</think>；只有 </think> 时删除其之前的内容，未闭合的 <think> 删除其之后的内容"""
+    text = _THINK_BLOCK.sub("", text)
+    if "</think>" in text:
+        text = text.split("</think>")[-1]
+    if "<think>" in text:
+        text = text.split("<think>")[0]
+    return text
+
+
+def extract_code_blocks(text: str) -> List[str]:
+    """提取 markdown 代码块（python/py/无语言标注），末尾未闭合的代码块也会被提取"""
+    blocks = []
+    for lang, body in _FENCE.findall(text):
+        if lang.lower() in ("", "python", "py", "python3"):
+            blocks.append(body)
+    return blocks
+
+
+def unopened_block(text: str) -> Optional[str]:
+    """
+    chat 模式的提示以 ```python\n 结尾，补全形如 "code\n```\n说明"：第一个 ``` 是闭合栅栏，
+    其之前的内容是一个未显式打开的代码块。第一个栅栏带语言标注（是开启栅栏）或之前为空时返回 None
+    """
+    prefix, fence, rest = text.partition("```")
+    if not fence or not prefix.strip() or _OPENING_FENCE.match(rest):
+        return None
+    return prefix
+
+
+def _defines(tree: ast.Module, entry_point: str) -> bool:
+    return any(
+        isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name == entry_point
+        for node in tree.body
+    )
+
+
+def _parse(code: str) -> Optional[ast.Module]:
+    try:
+        return ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+
+
+def _parse_with_truncation(code: str) -> Tuple[str, Optional[ast.Module]]:
+    """解析失败时从末尾逐行截断（处理被 max_new_tokens 截断的输出）"""
+    tree = _parse(code)
+    if tree is not None:
+        return code, tree
+    lines = code.splitlines()
+    for end in range(len(lines) - 1, 0, -1):
+        candidate = "\n".join(lines[:end])
+        tree = _parse(candidate)
+        if tree is not None:
+            return candidate, tree
+    return code, None
+
+
+def _keep_definitions(code: str, tree: ast.Module) -> str:
+    """只保留顶层定义，去掉示例调用和测试代码"""
+    if all(isinstance(node, _KEEP_NODES) for node in tree.body):
+        return code
+    lines = code.splitlines()
+    kept: List[str] = []
+    for node in tree.body:
+        if not isinstance(node, _KEEP_NODES):
+            continue
+        start = node.lineno - 1
+        if getattr(node, "decorator_list", None):
+            start = min(d.lineno for d in node.decorator_list) - 1  # type: ignore[attr-defined]
+        kept.append("\n".join(lines[start:node.end_lineno]))
+    return "\n".join(kept)
+
+
+def sanitize(text: str, entry_point: str) -> SanitizeResult:
+    """清洗一个样本，返回清洗后的代码和分类结果"""
+    text = strip_thinking(text)
+    blocks: List[str] = []
+    if "```" in text:
+        prefix = unopened_block(text)
+        blocks = ([prefix] if prefix is not None else []) + extract_code_blocks(text)
+    candidates = blocks if blocks else [text]
+
+    fallback: Optional[str] = None
+    saw_code = False
+    for candidate in candidates:
+        if not candidate.strip():
+            continue
+        saw_code = True
+        code, tree = _parse_with_truncation(candidate)
+        if tree is None:
+            continue
+        if _defines(tree, entry_point):
+            return SanitizeResult(_keep_definitions(code, tree), OK)
+        if fallback is None:
+            fallback = code
+
+    if not saw_code:
+        return SanitizeResult("", NO_CODE)
+    if fallback is not None:
+        # 多个代码块时入口函数可能被拆开定义，尝试拼接全部可解析的代码块
+        if len(candidates) > 1:
+            merged = "\n\n".join(_parse_with_truncation(c)[0] for c in candidates if c.strip())
+            tree = _parse(merged)
+            if tree is not None and _defines(tree, entry_point):
+                return SanitizeResult(_keep_definitions(merged, tree), OK)
+        return SanitizeResult(fallback, MISSING_ENTRY_POINT)
+    return SanitizeResult(candidates[0], SYNTAX_ERROR)
+
+
+def _sanitize_pair(pair: Tuple[str, str]) -> SanitizeResult:
+    return sanitize(*pair)
+
+
+def sanitize_batch(
+    texts: Sequence[str],
+    entry_points: Sequence[str],
+    n_workers: Optional[int] = None,
+) -> List[SanitizeResult]:
+    """批量清洗，样本较多时使用进程池并按大块分发"""
+    pairs: Iterable[Tuple[str, str]] = zip(texts, entry_points)
+    if len(texts) < PARALLEL_THRESHOLD:
+        return [_sanitize_pair(p) for p in pairs]
+    n_workers = n_workers or os.cpu_count() or 1
+    chunksize = max(1, len(texts) // (n_workers * 4))
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        return list(pool.map(_sanitize_pair, pairs, chunksize=chunksize))
@@ -0,0 +1,417 @@
+"""
+常驻评测服务
+通过本地 HTTP 或 Unix socket 接收评测任务，排队执行、合并重复任务、复用已加载的引擎，
+并以 NDJSON 流的形式推送进度
+
+API:
+    POST /jobs                 提交任务 {"model_path", "eval_mode", "backend", "temperature", ...}
+    GET  /jobs                 列出所有任务
+    GET  /jobs/<id>            查询任务状态
+    GET  /jobs/<id>/events     流式返回任务事件，任务结束后关闭连接
+    GET  /health               健康检查
+"""
+
+import hashlib
+import json
+import os
+import queue
+import socketserver
+import subprocess
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .backends import get_backend
+from .codegen import run_codegen
+from .execution import LocalExecutor, eval_results_path
+from .humaneval import load_problems, summarize_eval_results
+from .replicas import backend_spec
+
+# 参与去重的任务参数及其默认值
+JOB_DEFAULTS: Dict[str, Any] = {
+    "eval_mode": "base",
+    "backend": "vllm",
+    "tp": 1,
+    "data_parallel": 1,
+    "dtype": "bfloat16",
+    "temperature": 0.0,
+    "top_p": 0.95,
+    "n_samples": 1,
+    "max_new_tokens": 768,
+    "force_base_prompt": True,
+    "execute": True,
+}
+
+TERMINAL_STATUSES = ("done", "failed")
+
+_TRUE_STRINGS = {"true", "1", "yes", "on"}
+_FALSE_STRINGS = {"false", "0", "no", "off"}
+
+Executor = Callable[[Path, str], Path]
+
+
+def coerce_param(name: str, value: Any, default: Any) -> Any:
+    """
+    按默认值的类型（bool / int / float / str）转换请求参数，使 0 与 0.0、"1" 与 1 得到相同的任务键；
+    无法转换时抛出 ValueError
+    """
+    try:
+        if isinstance(default, bool):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, int) and value in (0, 1):
+                return bool(value)
+            if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS | _FALSE_STRINGS:
+                return value.strip().lower() in _TRUE_STRINGS
+        elif isinstance(default, int):
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+            if isinstance(value, str):
+                return int(value.strip())
+        elif isinstance(default, float):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return float(value)
+            if isinstance(value, str):
+                return float(value.strip())
+        elif isinstance(default, str):
+            if isinstance(value, str):
+                return value
+        else:
+            return value
+    except ValueError:
+        pass
+    raise ValueError(f"参数 {name} 的值 {value!r} 无法转换为 {type(default).__name__}")
+
+
+def evalplus_execute(samples_file: Path, dataset: str) -> Path:
+    """默认执行器：调用 evalplus.evaluate 对样本运行 base + plus 测试"""
+    subprocess.run(
+        ["evalplus.evaluate", "--dataset", dataset, "--samples", str(samples_file)],
+        check=True,
+    )
+    return eval_results_path(samples_file)
+
+
+def _model_fingerprint(model_path: str) -> str:
+    """模型目录的修改时间，用于区分同一路径下被覆盖的checkpoint"""
+    path = Path(model_path)
+    if not path.exists():
+        return ""
+    mtimes = [path.stat().st_mtime_ns]
+    if path.is_dir():
+        mtimes.extend(p.stat().st_mtime_ns for p in path.iterdir() if p.is_file())
+    return str(max(mtimes))
+
+
+@dataclass
+class EvalJob:
+    """一个评测任务"""
+
+    job_id: str
+    key: str
+    params: Dict[str, Any]
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    submissions: int = 1
+    cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    def emit(self, event: str, **data: Any) -> None:
+        with self.cond:
+            self.events.append({"time": time.time(), "event": event, **data})
+            self.cond.notify_all()
+
+    def finish(self, status: str) -> None:
+        """原子地设置终止状态并推送最后一个事件，保证 follow 不会漏掉它"""
+        with self.cond:
+            self.status = status
+            self.finished_at = time.time()
+            self.events.append({"time": self.finished_at, "event": status, "result": self.result, "error": self.error})
+            self.cond.notify_all()
+
+    def follow(self, poll: float = 1.0) -> Iterator[Dict[str, Any]]:
+        """依次产出事件，任务结束后停止"""
+        index = 0
+        while True:
+            with self.cond:
+                while index >= len(self.events) and self.status not in TERMINAL_STATUSES:
+                    self.cond.wait(poll)
+                pending = self.events[index:]
+                index += len(pending)
+                finished = self.status in TERMINAL_STATUSES
+            yield from pending
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "key": self.key,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "submissions": self.submissions,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class EvalService:
+    """
+    评测任务队列
+
+    单个工作线程串行执行任务（GPU资源独占），相同参数的任务在排队、运行或已完成时
+    直接复用已有任务；引擎通过 get_backend 缓存在进程内常驻
+    """
+
+    def __init__(
+        self,
+        dataset_path: Union[str, Path],
+        results_root: Union[str, Path] = "evalplus_results_server",
+        dataset: str = "humaneval",
+        defaults: Optional[Dict[str, Any]] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.dataset_path = Path(dataset_path)
+        self.results_root = Path(results_root)
+        self.dataset = dataset
+        self.defaults = {**JOB_DEFAULTS, **(defaults or {})}
+        # 默认使用内置执行器，参考输出在服务生命周期内只计算一次
+        self.executor = executor or LocalExecutor(self.dataset_path)
+        self.jobs: Dict[str, EvalJob] = {}
+        self.by_key: Dict[str, str] = {}
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._problems: Optional[Dict[str, Dict[str, Any]]] = None
+        self._worker = threading.Thread(target=self._work, name="eval-worker", daemon=True)
+        self._worker.start()
+
+    @property
+    def problems(self) -> Dict[str, Dict[str, Any]]:
+        if self._problems is None:
+            self._problems = load_problems(self.dataset_path)
+        return self._problems
+
+    def normalize(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        if not request.get("model_path"):
+            raise ValueError("缺少 model_path")
+        unknown = set(request) - set(self.defaults) - {"model_path"}
+        if unknown:
+            raise ValueError(f"未知参数: {', '.join(sorted(unknown))}")
+        if not isinstance(request["model_path"], str):
+            raise ValueError("model_path 必须是字符串")
+        params = {**self.defaults, "model_path": request["model_path"]}
+        for name, value in request.items():
+            if name != "model_path":
+                params[name] = coerce_param(name, value, self.defaults[name])
+        if params["temperature"] == 0.0 and params["n_samples"] != 1:
+            raise ValueError("贪心解码时 n_samples 必须为 1")
+        return params
+
+    def job_key(self, params: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {**params, "model_fingerprint": _model_fingerprint(params["model_path"])},
+            sort_keys=True,
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    def submit(self, request: Dict[str, Any]) -> Tuple[EvalJob, bool]:
+        """提交任务，返回 (任务, 是否与已有任务合并)；失败的任务允许重新提交"""
+        params = self.normalize(request)
+        key = self.job_key(params)
+        with self._lock:
+            existing_id = self.by_key.get(key)
+            if existing_id is not None:
+                existing = self.jobs[existing_id]
+                if existing.status != "failed":
+                    existing.submissions += 1
+                    return existing, True
+            job = EvalJob(job_id=uuid.uuid4().hex[:12], key=key, params=params)
+            self.jobs[job.job_id] = job
+            self.by_key[key] = job.job_id
+        job.emit("queued", position=self._queue.qsize())
+        self._queue.put(job.job_id)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[EvalJob]:
+        return self.jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> EvalJob:
+        job = self.jobs[job_id]
+        deadline = None if timeout is None else time.time() + timeout
+        with job.cond:
+            while job.status not in TERMINAL_STATUSES:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"任务 {job_id} 未在 {timeout}s 内完成")
+                job.cond.wait(remaining)
+        return job
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            job = self.jobs[job_id]
+            job.status = "running"
+            job.started_at = time.time()
+            job.emit("started")
+            try:
+                job.result = self._run(job)
+                job.finish("done")
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+                job.finish("failed")
+
+    def _run(self, job: EvalJob) -> Dict[str, Any]:
+        params = job.params
+        backend_name, backend_kwargs = backend_spec(
+            params["backend"], params["tp"], params["dtype"], params["data_parallel"]
+        )
+
+        start = time.perf_counter()
+        job.emit("stage", stage="model_load")
+        backend = get_backend(backend_name, params["model_path"], **backend_kwargs)
+        timings = {"model_load": time.perf_counter() - start}
+
+        start = time.perf_counter()
+        job.emit("stage", stage="generation", n_tasks=len(self.problems))
+        root = self.results_root / params["eval_mode"] / job.key
+        stats = run_codegen(
+            self.problems,
+            backend,
+            root=root,
+            dataset=self.dataset,
+            eval_mode=params["eval_mode"],
+            force_base_prompt=params["force_base_prompt"],
+            n_samples=params["n_samples"],
+            temperature=params["temperature"],
+            max_new_tokens=params["max_new_tokens"],
+            top_p=params["top_p"],
+        )
+        timings["generation"] = time.perf_counter() - start
+        result: Dict[str, Any] = {
+            "samples_file": str(stats.samples_file),
+            "n_samples": stats.n_samples,
+            "output_tokens": stats.output_tokens,
+            "tokens_per_sec": stats.output_tokens / timings["generation"] if timings["generation"] else 0.0,
+        }
+        job.emit("stage_done", stage="generation", seconds=timings["generation"], n_samples=stats.n_samples)
+
+        if params["execute"]:
+            start = time.perf_counter()
+            job.emit("stage", stage="execution")
+            results_file = self.executor(stats.samples_file, self.dataset)
+            timings["execution"] = time.perf_counter() - start
+            with open(results_file, "r", encoding="utf-8") as f:
+                result.update(summarize_eval_results(json.load(f)))
+            result["results_file"] = str(results_file)
+            job.emit("stage_done", stage="execution", seconds=timings["execution"])
+
+        result["timings"] = timings
+        return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "LightSFTEval/0.1"
+    service: EvalService
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Unix socket 下 client_address 为空字符串，统一使用简短日志
+        print("[eval-server] " + (format % args))
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        service = self.service
+        if parts == ["health"]:
+            self._send_json(200, {"status": "ok", "queued": service._queue.qsize()})
+        elif parts == ["jobs"]:
+            self._send_json(200, [job.to_dict() for job in service.jobs.values()])
+        elif len(parts) >= 2 and parts[0] == "jobs":
+            job = service.get(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"任务不存在: {parts[1]}"})
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            elif parts[2:] == ["events"]:
+                self._stream_events(job)
+            else:
+                self._send_json(404, {"error": "not found"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _stream_events(self, job: EvalJob) -> None:
+        # HTTP/1.0 无 Content-Length，客户端读到连接关闭即结束
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for event in job.follow():
+                self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job, deduplicated = self.service.submit(request)
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(200 if deduplicated else 201, {**job.to_dict(), "deduplicated": deduplicated})
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self) -> None:
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        super().server_bind()
+        # BaseHTTPRequestHandler 需要以下属性
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+def make_server(
+    service: EvalService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: Optional[str] = None,
+) -> socketserver.BaseServer:
+    """创建绑定到本地地址（或Unix socket）的HTTP服务"""
+    handler = type("EvalHandler", (_Handler,), {"service": service})
+    if unix_socket:
+        return UnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
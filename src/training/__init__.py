@@ -0,0 +1,22 @@
+"""训练模块"""
+
+from .checkpoints import CheckpointManager, RetentionPolicy, register_metric
+from .monitor import LogTail, TrainingMonitor
+from .planner import ModelSpec, estimate_memory_gb, format_plan_markdown, plan_training
+from .tokenized_cache import FileHashMemo, find_tokenized_cache, finalize_tokenized_cache, tokenized_cache_key
+
+__all__ = [
+    "CheckpointManager",
+    "FileHashMemo",
+    "LogTail",
+    "ModelSpec",
+    "RetentionPolicy",
+    "TrainingMonitor",
+    "estimate_memory_gb",
+    "finalize_tokenized_cache",
+    "find_tokenized_cache",
+    "format_plan_markdown",
+    "plan_training",
+    "register_metric",
+    "tokenized_cache_key",
+]
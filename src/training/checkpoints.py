@@ -0,0 +1,352 @@
+"""
+Checkpoint 保留与整理
+后台监视训练输出目录：
+- 把 ZeRO-3 分片转换为合并的 bf16 safetensors（在独立的工作进程中进行，不阻塞监视循环）
+- 只有最新的 K 个 checkpoint 保留优化器状态（可续训），其余只保留合并后的权重
+- 按登记的指标（如 HumanEval+ pass@1）保留最好的 N 个，开启 prune 时删除其余仅含权重的 checkpoint
+- 各 checkpoint 中内容相同的 tokenizer/config 等小文件用硬链接去重
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Union
+
+CHECKPOINT_PATTERN = re.compile(r"^checkpoint-(\d+)$")
+METRICS_FILE = "checkpoint_metrics.json"
+CONSOLIDATED_MARKER = ".consolidated"
+# 只含 ZeRO 分片/优化器状态、删除后不影响推理的文件
+OPTIMIZER_FILES = ("optimizer.pt", "scheduler.pt", "latest", "zero_to_fp32.py")
+OPTIMIZER_GLOBS = ("global_step*", "rng_state*.pth")
+# 参与硬链接去重的文件
+DEDUP_GLOBS = (
+    "tokenizer*.json",
+    "vocab.json",
+    "merges.txt",
+    "special_tokens_map.json",
+    "added_tokens.json",
+    "chat_template.jinja",
+    "config.json",
+    "generation_config.json",
+    "training_args.bin",
+)
+DEDUP_MAX_BYTES = 64 * 1024 ** 2
+SHARD_BYTES = 5 * 1024 ** 3
+
+
+def list_checkpoints(output_dir: Union[str, Path]) -> List[Path]:
+    """按 step 升序返回 checkpoint 目录"""
+    found = []
+    for path in Path(output_dir).iterdir():
+        match = CHECKPOINT_PATTERN.match(path.name)
+        if match and path.is_dir():
+            found.append((int(match.group(1)), path))
+    return [path for _, path in sorted(found)]
+
+
+def checkpoint_step(path: Path) -> int:
+    match = CHECKPOINT_PATTERN.match(path.name)
+    return int(match.group(1)) if match else -1
+
+
+def is_settled(path: Path, settle_seconds: float) -> bool:
+    """trainer_state.json 已写出且目录内最近 settle_seconds 秒没有文件变化，才认为保存完成"""
+    if not (path / "trainer_state.json").exists():
+        return False
+    newest = max((p.stat().st_mtime for p in path.rglob("*") if p.is_file()), default=0.0)
+    return time.time() - newest >= settle_seconds
+
+
+def has_model_weights(path: Path) -> bool:
+    return any(path.glob("*.safetensors")) or any(path.glob("pytorch_model*.bin"))
+
+
+def has_optimizer_state(path: Path) -> bool:
+    return any((path / name).exists() for name in OPTIMIZER_FILES) or any(
+        next(path.glob(pattern), None) is not None for pattern in OPTIMIZER_GLOBS
+    )
+
+
+def consolidate_zero_checkpoint(checkpoint_dir: Union[str, Path], dtype: str = "bfloat16") -> str:
+    """
+    在工作进程中运行：把 ZeRO 分片合并为 safetensors（默认转为 bf16，体积为 fp32 的一半）
+
+    已经包含完整权重（stage3_gather_16bit_weights_on_model_save）时只写标记
+    """
+    checkpoint_dir = Path(checkpoint_dir)
+    if not has_model_weights(checkpoint_dir):
+        import torch
+        from deepspeed.utils.zero_to_fp32 import get_fp32_state_dict_from_zero_checkpoint
+        from safetensors.torch import save_file
+
+        state_dict = get_fp32_state_dict_from_zero_checkpoint(str(checkpoint_dir))
+        target = getattr(torch, dtype)
+        state_dict = {k: v.to(target).contiguous() for k, v in state_dict.items()}
+
+        shards: List[Dict[str, Any]] = [{}]
+        shard_sizes = [0]
+        for name, tensor in state_dict.items():
+            size = tensor.numel() * tensor.element_size()
+            if shard_sizes[-1] and shard_sizes[-1] + size > SHARD_BYTES:
+                shards.append({})
+                shard_sizes.append(0)
+            shards[-1][name] = tensor
+            shard_sizes[-1] += size
+
+        tmp_dir = checkpoint_dir / ".consolidating"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        weight_map: Dict[str, str] = {}
+        for i, shard in enumerate(shards, 1):
+            file_name = (
+                "model.safetensors" if len(shards) == 1 else f"model-{i:05d}-of-{len(shards):05d}.safetensors"
+            )
+            save_file(shard, str(tmp_dir / file_name), metadata={"format": "pt"})
+            weight_map.update({name: file_name for name in shard})
+        if len(shards) > 1:
+            with open(tmp_dir / "model.safetensors.index.json", "w", encoding="utf-8") as f:
+                json.dump({"metadata": {"total_size": sum(shard_sizes)}, "weight_map": weight_map}, f, indent=2)
+        for file in tmp_dir.iterdir():
+            os.replace(file, checkpoint_dir / file.name)
+        tmp_dir.rmdir()
+    (checkpoint_dir / CONSOLIDATED_MARKER).write_text(time.strftime("%Y-%m-%d %H:%M:%S"))
+    return str(checkpoint_dir)
+
+
+def strip_optimizer_state(path: Path) -> int:
+    """删除优化器状态与 ZeRO 分片（必须已有合并后的权重），返回释放的字节数"""
+    if not has_model_weights(path):
+        raise RuntimeError(f"{path} 没有合并后的权重，拒绝删除 ZeRO 分片")
+    freed = 0
+    targets = [path / name for name in OPTIMIZER_FILES]
+    for pattern in OPTIMIZER_GLOBS:
+        targets.extend(path.glob(pattern))
+    for target in targets:
+        if target.is_dir():
+            freed += sum(p.stat().st_size for p in target.rglob("*") if p.is_file())
+            shutil.rmtree(target)
+        elif target.exists():
+            freed += target.stat().st_size
+            target.unlink()
+    return freed
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dedup_files(checkpoints: List[Path]) -> int:
+    """内容相同的小文件替换为指向同一 inode 的硬链接，返回节省的字节数；跨文件系统时跳过"""
+    canonical: Dict[str, Path] = {}
+    saved = 0
+    for checkpoint in checkpoints:
+        for pattern in DEDUP_GLOBS:
+            for path in checkpoint.glob(pattern):
+                stat = path.stat()
+                if not path.is_file() or stat.st_size > DEDUP_MAX_BYTES:
+                    continue
+                key = f"{path.name}:{_file_digest(path)}"
+                original = canonical.setdefault(key, path)
+                if original == path or os.path.samefile(original, path):
+                    continue
+                tmp = path.with_name(path.name + ".dedup_tmp")
+                try:
+                    os.link(original, tmp)
+                except OSError:
+                    continue
+                os.replace(tmp, path)
+                saved += stat.st_size
+    return saved
+
+
+def load_metrics(output_dir: Union[str, Path]) -> Dict[str, Dict[str, float]]:
+    path = Path(output_dir) / METRICS_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def register_metric(output_dir: Union[str, Path], checkpoint: str, name: str, value: float) -> None:
+    """登记某个 checkpoint 的指标（如评测脚本得到的 pass@1），用于挑选最好的 N 个"""
+    metrics = load_metrics(output_dir)
+    metrics.setdefault(Path(checkpoint).name, {})[name] = float(value)
+    path = Path(output_dir) / METRICS_FILE
+    tmp = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(metrics, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    keep_latest_full: 保留优化器状态的最新 checkpoint 数
+    keep_best: 按 metric 保留的最好 checkpoint 数（higher_is_better 控制方向）
+    prune: 为 True 时删除既不是最新 K 个、也不是最好 N 个的 checkpoint；默认只删除优化器状态
+    """
+
+    keep_latest_full: int = 1
+    keep_best: int = 3
+    metric: Optional[str] = None
+    higher_is_better: bool = True
+    prune: bool = False
+    settle_seconds: float = 120.0
+
+
+@dataclass
+class CheckpointManager:
+    output_dir: Union[str, Path]
+    policy: RetentionPolicy = field(default_factory=RetentionPolicy)
+    consolidate_fn: Callable[[str], str] = consolidate_zero_checkpoint
+    max_workers: int = 1
+    dry_run: bool = False
+    # 合并失败后的重试间隔（秒），每次失败翻倍，最长 retry_backoff_max
+    retry_backoff: float = 60.0
+    retry_backoff_max: float = 3600.0
+    _pool: Optional[ProcessPoolExecutor] = field(default=None, init=False, repr=False)
+    _pending: Dict[str, Future] = field(default_factory=dict, init=False, repr=False)
+    _failures: Dict[str, int] = field(default_factory=dict, init=False, repr=False)
+    _retry_at: Dict[str, float] = field(default_factory=dict, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.output_dir = Path(self.output_dir)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            import multiprocessing
+
+            # spawn：合并权重的工作进程不继承监视进程的状态
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _reset_pool(self) -> None:
+        """工作进程异常退出（如合并 8B fp32 权重时被 OOM killer 杀掉）后进程池不可再用，丢弃后按需重建"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def _submit_consolidation(self, path: Path) -> bool:
+        """提交合并任务；处于失败重试的等待期内时不提交，返回 False"""
+        key = str(path)
+        if key in self._pending:
+            return True
+        if time.monotonic() < self._retry_at.get(key, 0.0):
+            return False
+        print(f"🔧 合并 ZeRO 分片: {path.name}")
+        try:
+            self._pending[key] = self._get_pool().submit(self.consolidate_fn, key)
+        except BrokenProcessPool:
+            self._reset_pool()
+            self._pending[key] = self._get_pool().submit(self.consolidate_fn, key)
+        return True
+
+    def _collect(self, wait: bool = False) -> None:
+        broken = False
+        for key, future in list(self._pending.items()):
+            if not wait and not future.done():
+                continue
+            try:
+                future.result()
+                print(f"✓ 合并完成: {Path(key).name}")
+                self._failures.pop(key, None)
+                self._retry_at.pop(key, None)
+            except Exception as e:
+                broken = broken or isinstance(e, BrokenProcessPool)
+                failures = self._failures[key] = self._failures.get(key, 0) + 1
+                delay = min(self.retry_backoff * 2 ** (failures - 1), self.retry_backoff_max)
+                self._retry_at[key] = time.monotonic() + delay
+                print(f"✗ 合并失败: {Path(key).name}: {type(e).__name__}: {e}（第 {failures} 次，{delay:.0f}s 后重试）")
+            del self._pending[key]
+        if broken:
+            self._reset_pool()
+
+    def best_checkpoints(self, checkpoints: List[Path]) -> Set[Path]:
+        if not self.policy.metric or self.policy.keep_best <= 0:
+            return set()
+        metrics = load_metrics(self.output_dir)
+        scored = [
+            (metrics[p.name][self.policy.metric], p)
+            for p in checkpoints
+            if self.policy.metric in metrics.get(p.name, {})
+        ]
+        scored.sort(key=lambda item: item[0], reverse=self.policy.higher_is_better)
+        return {p for _, p in scored[:self.policy.keep_best]}
+
+    def step(self, wait: bool = False) -> Dict[str, Any]:
+        """执行一轮整理，返回本轮的动作统计"""
+        self._collect()
+        checkpoints = [p for p in list_checkpoints(self.output_dir) if is_settled(p, self.policy.settle_seconds)]
+        latest_full = set(checkpoints[-self.policy.keep_latest_full:]) if self.policy.keep_latest_full > 0 else set()
+        best = self.best_checkpoints(checkpoints)
+        metrics = load_metrics(self.output_dir)
+        report: Dict[str, Any] = {"checkpoints": len(checkpoints), "consolidating": [], "retry_waiting": [],
+                                  "stripped": [], "pruned": [], "freed_bytes": 0}
+
+        for path in checkpoints:
+            if path in latest_full:
+                continue
+            scored = self.policy.metric in metrics.get(path.name, {})
+            # 只删除已经评测过且不在最好 N 个之内的 checkpoint；未评测的等待指标登记
+            if self.policy.prune and scored and path not in best and str(path) not in self._pending:
+                report["pruned"].append(path.name)
+                if not self.dry_run:
+                    size = sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+                    shutil.rmtree(path)
+                    report["freed_bytes"] += size
+                continue
+            if not (path / CONSOLIDATED_MARKER).exists():
+                if self.dry_run or self._submit_consolidation(path):
+                    report["consolidating"].append(path.name)
+                else:
+                    report["retry_waiting"].append(path.name)
+                continue
+            if has_optimizer_state(path):
+                report["stripped"].append(path.name)
+                if not self.dry_run:
+                    report["freed_bytes"] += strip_optimizer_state(path)
+
+        if wait and self._pending:
+            self._collect(wait=True)
+            # 合并完成后立即删除这些 checkpoint 的优化器状态
+            for name in report["consolidating"]:
+                path = self.output_dir / name
+                if (path / CONSOLIDATED_MARKER).exists() and has_optimizer_state(path):
+                    report["stripped"].append(name)
+                    report["freed_bytes"] += strip_optimizer_state(path)
+
+        if not self.dry_run:
+            # 只处理已保存完成的 checkpoint：trainer 仍在写入的文件若已被硬链接，原地改写会波及共享同一 inode 的其他 checkpoint
+            report["dedup_bytes"] = dedup_files([p for p in checkpoints if p.exists()])
+        return report
+
+    def watch(self, interval: float = 60.0) -> None:
+        """后台循环：每 interval 秒整理一次；单轮出错只记录日志，不终止监视"""
+        while True:
+            try:
+                report = self.step()
+            except Exception:
+                print("[ckpt-manager] 本轮整理失败：")
+                traceback.print_exc()
+            else:
+                if report["consolidating"] or report["stripped"] or report["pruned"]:
+                    print(f"[ckpt-manager] {json.dumps(report, ensure_ascii=False)}")
+            time.sleep(interval)
+
+    def close(self) -> None:
+        self._collect(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,353 @@
+"""
+训练吞吐实时监控
+增量读取 LLaMA-Factory 的 trainer_log.jsonl 和 nohup 标准输出日志（只读新增字节，不重复解析），
+计算滚动吞吐、ETA、step 耗时分位数与 MFU 估计，输出终端面板和 Prometheus 文本格式指标
+"""
+
+import glob
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+# tqdm 进度条: " 12%|█▏  | 120/1000 [05:00<36:40,  2.50s/it]"
+# 只匹配 s/it 或 it/s，排除数据预处理的 "examples/s" 进度条
+_TQDM = re.compile(r"(\d+)/(\d+) \[(\d+(?::\d+)+)<(?:\d+(?::\d+)+|\?), *([\d.]+)(s/it|it/s)\]")
+# HF Trainer 打印的日志字典: "{'loss': 1.23, 'grad_norm': 4.5, 'learning_rate': 1e-05, 'epoch': 0.1}"
+_LOG_DICT = re.compile(r"\{'loss': [^}]*\}")
+_NUMBER = re.compile(r"'(\w+)': ([-+\d.eE]+|nan|inf)")
+
+
+def parse_duration(text: str) -> float:
+    """'1:02:03' / '02:03' -> 秒"""
+    seconds = 0.0
+    for part in text.strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class LogTail:
+    """
+    记录读取偏移量的增量读取器
+
+    只返回上次读取之后新增的完整行；文件被截断或替换（inode 变化）时从头读取；
+    path 可以是 glob 模式，此时跟随最新修改的文件
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.pattern = str(path)
+        self.path: Optional[Path] = None
+        self.offset = 0
+        self.inode: Optional[int] = None
+        self._partial = b""
+
+    def _resolve(self) -> Optional[Path]:
+        if any(ch in self.pattern for ch in "*?["):
+            matches = glob.glob(self.pattern)
+            return Path(max(matches, key=os.path.getmtime)) if matches else None
+        path = Path(self.pattern)
+        return path if path.exists() else None
+
+    def read_lines(self) -> List[str]:
+        path = self._resolve()
+        if path is None:
+            return []
+        stat = path.stat()
+        if path != self.path or stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.path, self.inode, self.offset, self._partial = path, stat.st_ino, 0, b""
+        if stat.st_size == self.offset:
+            return []
+        with open(path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(stat.st_size - self.offset)
+        self.offset += len(data)
+        # tqdm 用 \r 刷新同一行，按 \r 和 \n 都切分
+        chunks = re.split(rb"[\r\n]", self._partial + data)
+        self._partial = chunks.pop()
+        return [c.decode("utf-8", errors="replace") for c in chunks if c.strip()]
+
+
+def parse_trainer_log_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析 trainer_log.jsonl 的一行，返回 {step, total_steps, elapsed, loss, total_tokens, ...}"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if "current_steps" not in record:
+        return None
+    event: Dict[str, Any] = {
+        "source": "trainer_log",
+        "step": int(record["current_steps"]),
+        "total_steps": int(record.get("total_steps") or 0),
+    }
+    if record.get("elapsed_time"):
+        event["elapsed"] = parse_duration(str(record["elapsed_time"]))
+    for key in ("loss", "lr", "epoch", "total_tokens", "throughput"):
+        if record.get(key) is not None:
+            event[key] = float(record[key])
+    return event
+
+
+def parse_stdout_line(line: str) -> Optional[Dict[str, Any]]:
+    """解析标准输出中的 tqdm 进度或 HF Trainer 日志字典"""
+    match = _LOG_DICT.search(line)
+    if match:
+        values = {k: float(v) for k, v in _NUMBER.findall(match.group(0))}
+        event: Dict[str, Any] = {"source": "stdout_log"}
+        if "loss" in values:
+            event["loss"] = values["loss"]
+        if "learning_rate" in values:
+            event["lr"] = values["learning_rate"]
+        if "epoch" in values:
+            event["epoch"] = values["epoch"]
+        return event
+    match = _TQDM.search(line)
+    if match:
+        step, total, elapsed, rate, unit = match.groups()
+        return {
+            "source": "tqdm",
+            "step": int(step),
+            "total_steps": int(total),
+            "elapsed": parse_duration(elapsed),
+            "step_time": float(rate) if unit == "s/it" else 1.0 / max(float(rate), 1e-9),
+        }
+    return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(math.ceil(q * len(ordered))) - 1))
+    return ordered[idx]
+
+
+@dataclass
+class TrainingMonitor:
+    """
+    汇总日志事件并计算监控指标
+
+    tokens_per_step 未知时只能依赖日志中的 total_tokens（需开启 include_num_input_tokens_seen）；
+    model_params 与 n_gpus/gpu_tflops 用于估计 MFU（6N 每 token，梯度检查点为 8N）
+    """
+
+    tokens_per_step: Optional[float] = None
+    model_params: Optional[float] = None
+    n_gpus: int = 8
+    gpu_tflops: float = 312.0
+    gradient_checkpointing: bool = True
+    window: int = 50
+    stall_factor: float = 2.0
+    step: int = 0
+    total_steps: int = 0
+    elapsed: float = 0.0
+    loss: Optional[float] = None
+    lr: Optional[float] = None
+    epoch: Optional[float] = None
+    total_tokens: Optional[float] = None
+    stalls: int = 0
+    _points: Deque[Tuple[int, float]] = field(default_factory=lambda: deque(maxlen=512))
+    _token_points: Deque[Tuple[float, float]] = field(default_factory=lambda: deque(maxlen=512))
+    _has_tqdm: bool = False
+    _step_times: Deque[float] = field(default_factory=lambda: deque(maxlen=512))
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def ingest(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            total = event.get("total_steps")
+            if event["source"] == "tqdm" and self.total_steps and total != self.total_steps:
+                # 评估循环等其它 tqdm 进度条，总数与训练总步数不同，不计入训练进度
+                return
+            for key in ("loss", "lr", "epoch"):
+                if key in event:
+                    setattr(self, key, event[key])
+            # 训练总步数以 trainer_log 为准；没有 trainer_log 时取第一个 tqdm 进度条（训练循环）
+            if total and (event["source"] == "trainer_log" or not self.total_steps):
+                self.total_steps = total
+            step = event.get("step")
+            elapsed = event.get("elapsed")
+            if step is None or elapsed is None:
+                return
+            if "total_tokens" in event:
+                self.total_tokens = event["total_tokens"]
+                self._token_points.append((elapsed, event["total_tokens"]))
+            if event["source"] == "tqdm":
+                self._has_tqdm = True
+            elif self._has_tqdm:
+                # 有逐步的 tqdm 进度时，step 耗时只取自 tqdm，trainer_log 只提供 loss 与 token 数
+                return
+            if self._points and step <= self._points[-1][0]:
+                return
+            if "step_time" in event:
+                # tqdm 的 s/it 是平滑后的速率，比按秒级 elapsed 做差更稳定
+                per_step = event["step_time"]
+            elif self._points:
+                last_step, last_elapsed = self._points[-1]
+                per_step = (elapsed - last_elapsed) / (step - last_step)
+            else:
+                per_step = None
+            if per_step is not None and per_step >= 0:
+                recent = list(self._step_times)[-self.window:]
+                if len(recent) >= 5 and per_step > self.stall_factor * _percentile(recent, 0.5):
+                    self.stalls += 1
+                self._step_times.append(per_step)
+            self._points.append((step, elapsed))
+            self.step, self.elapsed = step, elapsed
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._step_times)[-self.window:]
+            token_points = list(self._token_points)[-self.window:]
+        median = _percentile(recent, 0.5)
+        snap: Dict[str, Any] = {
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "elapsed_seconds": self.elapsed,
+            "loss": self.loss,
+            "learning_rate": self.lr,
+            "epoch": self.epoch,
+            "step_time_p50": median,
+            "step_time_p90": _percentile(recent, 0.9),
+            "step_time_p99": _percentile(recent, 0.99),
+            "step_time_max": max(recent) if recent else float("nan"),
+            "stalls": self.stalls,
+            "tokens_per_sec": float("nan"),
+            "mfu": float("nan"),
+            "eta_seconds": float("nan"),
+        }
+        # 滚动吞吐：优先用日志中的累计 token 数，否则用 tokens_per_step / step 耗时
+        if len(token_points) >= 2 and token_points[-1][0] > token_points[0][0]:
+            first, last = token_points[0], token_points[-1]
+            snap["tokens_per_sec"] = (last[1] - first[1]) / (last[0] - first[0])
+        elif self.tokens_per_step and recent:
+            snap["tokens_per_sec"] = self.tokens_per_step * len(recent) / sum(recent)
+        if self.model_params and not math.isnan(snap["tokens_per_sec"]):
+            flops_per_token = (8 if self.gradient_checkpointing else 6) * self.model_params
+            snap["mfu"] = snap["tokens_per_sec"] * flops_per_token / (self.n_gpus * self.gpu_tflops * 1e12)
+        if self.total_steps and recent:
+            snap["eta_seconds"] = max(0, self.total_steps - self.step) * median
+        return snap
+
+
+def _fmt_seconds(seconds: float) -> str:
+    if seconds is None or math.isnan(seconds):
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _fmt(value: Optional[float], spec: str = ".3f") -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    return format(value, spec)
+
+
+def format_dashboard(snap: Dict[str, Any]) -> str:
+    progress = snap["step"] / snap["total_steps"] if snap["total_steps"] else 0.0
+    bar = "█" * int(progress * 30) + "░" * (30 - int(progress * 30))
+    lines = [
+        "📈 训练监控",
+        f"  进度   {bar} {snap['step']}/{snap['total_steps'] or '?'} ({progress:.1%})",
+        f"  loss   {_fmt(snap['loss'], '.4f')}    lr {_fmt(snap['learning_rate'], '.2e')}    epoch {_fmt(snap['epoch'], '.2f')}",
+        f"  耗时   已用 {_fmt_seconds(snap['elapsed_seconds'])}    ETA {_fmt_seconds(snap['eta_seconds'])}",
+        f"  step耗时(s) p50={_fmt(snap['step_time_p50'])} p90={_fmt(snap['step_time_p90'])} "
+        f"p99={_fmt(snap['step_time_p99'])} max={_fmt(snap['step_time_max'])}",
+        f"  吞吐   {_fmt(snap['tokens_per_sec'], ',.0f')} tokens/s    MFU {_fmt(snap['mfu'], '.1%')}",
+        f"  卡顿   {snap['stalls']} 次（step 耗时超过滚动中位数的2倍，通常是数据加载或保存checkpoint）",
+    ]
+    return "\n".join(lines)
+
+
+PROMETHEUS_METRICS = {
+    "step": ("gauge", "Current optimizer step"),
+    "total_steps": ("gauge", "Total optimizer steps"),
+    "elapsed_seconds": ("gauge", "Training wall time so far"),
+    "loss": ("gauge", "Latest logged training loss"),
+    "learning_rate": ("gauge", "Latest logged learning rate"),
+    "epoch": ("gauge", "Latest logged epoch"),
+    "step_time_p50": ("gauge", "Rolling median seconds per step"),
+    "step_time_p90": ("gauge", "Rolling p90 seconds per step"),
+    "step_time_p99": ("gauge", "Rolling p99 seconds per step"),
+    "step_time_max": ("gauge", "Rolling max seconds per step"),
+    "stalls": ("counter", "Steps slower than the stall threshold"),
+    "tokens_per_sec": ("gauge", "Rolling training tokens per second"),
+    "mfu": ("gauge", "Estimated model FLOPs utilization"),
+    "eta_seconds": ("gauge", "Estimated seconds until the last step"),
+}
+
+
+def prometheus_text(snap: Dict[str, Any], prefix: str = "lightsft_train_") -> str:
+    lines = []
+    for key, (kind, help_text) in PROMETHEUS_METRICS.items():
+        value = snap.get(key)
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            continue
+        lines.append(f"# HELP {prefix}{key} {help_text}")
+        lines.append(f"# TYPE {prefix}{key} {kind}")
+        lines.append(f"{prefix}{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(monitor: TrainingMonitor, host: str = "127.0.0.1", port: int = 9465) -> ThreadingHTTPServer:
+    """在后台线程提供 /metrics（Prometheus 文本格式）和 /snapshot（JSON）"""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            snap = monitor.snapshot()
+            if self.path == "/metrics":
+                body = prometheus_text(snap).encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/snapshot":
+                body = json.dumps(snap, default=str).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def poll(monitor: TrainingMonitor, trainer_log: Optional[LogTail], stdout_log: Optional[LogTail]) -> int:
+    """读取两个日志的新增内容并送入监控器，返回解析出的事件数"""
+    n_events = 0
+    sources = ((trainer_log, parse_trainer_log_line), (stdout_log, parse_stdout_line))
+    for tail, parser in sources:
+        if tail is None:
+            continue
+        for line in tail.read_lines():
+            event = parser(line)
+            if event is not None:
+                monitor.ingest(event)
+                n_events += 1
+    return n_events
+
+
+def follow(
+    monitor: TrainingMonitor,
+    trainer_log: Optional[LogTail],
+    stdout_log: Optional[LogTail],
+    interval: float = 5.0,
+    dashboard: bool = True,
+) -> None:
+    while True:
+        poll(monitor, trainer_log, stdout_log)
+        if dashboard:
+            print("\033[2J\033[H" + format_dashboard(monitor.snapshot()), flush=True)
+        time.sleep(interval)
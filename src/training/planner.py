@@ -0,0 +1,477 @@
+"""
+训练吞吐与显存规划（纯CPU）
+读取 LLaMA-Factory 训练配置和数据集的 token 长度分布，估算每步 token 数、padding 浪费、
+ZeRO-3 下每卡的参数/梯度/优化器/激活显存、总步数与预计耗时，并给出 batch / 梯度累积建议，
+避免靠反复 OOM 试出 per_device_train_batch_size
+"""
+
+import json
+import math
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from .tokenized_cache import split_dataset_names
+
+GB = 1024 ** 3
+
+# chat 模板每轮额外引入的 token 数（角色标记、换行等）的粗略估计
+TEMPLATE_TOKENS_PER_TURN = 5
+# 无法加载 tokenizer 时按字符数估计 token 数
+DEFAULT_CHARS_PER_TOKEN = 3.5
+# CUDA 上下文、NCCL 缓冲、显存碎片等固定开销
+FIXED_OVERHEAD_GB = 3.0
+# ZeRO-3 在前向/反向时临时聚合的参数量上限（stage3_max_live_parameters 默认 1e9）
+ZERO3_LIVE_PARAMS = 1e9
+# 每个 micro step 的 token 数达到该值时 MFU 为饱和值的一半（小 batch 下 kernel 利用率低）
+MFU_HALF_TOKENS = 1024
+
+
+@dataclass
+class ModelSpec:
+    """估算所需的模型结构参数"""
+
+    n_params: float
+    hidden_size: int
+    num_layers: int
+    vocab_size: int
+    intermediate_size: int
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ModelSpec":
+        h = int(config["hidden_size"])
+        layers = int(config["num_hidden_layers"])
+        heads = int(config["num_attention_heads"])
+        kv_heads = int(config.get("num_key_value_heads") or heads)
+        head_dim = int(config.get("head_dim") or h // heads)
+        inter = int(config["intermediate_size"])
+        vocab = int(config["vocab_size"])
+        attn = h * heads * head_dim * 2 + h * kv_heads * head_dim * 2
+        mlp = 3 * h * inter
+        embeddings = vocab * h * (1 if config.get("tie_word_embeddings") else 2)
+        n_params = embeddings + layers * (attn + mlp + 2 * h) + h
+        return cls(float(n_params), h, layers, vocab, inter)
+
+    @classmethod
+    def from_path(cls, model_path: Union[str, Path]) -> "ModelSpec":
+        with open(Path(model_path) / "config.json", "r", encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    @classmethod
+    def from_size(cls, billions: float) -> "ModelSpec":
+        """只知道参数量时，按 Qwen3 系列的宽深比推算结构"""
+        n_params = billions * 1e9
+        hidden = int(round(math.sqrt(n_params / 36 / 12) / 128)) * 128 or 1024
+        layers = max(1, int(round(n_params / (12 * hidden * hidden))))
+        return cls(n_params, hidden, layers, 151936, 3 * hidden)
+
+
+def load_model_spec(config: Dict[str, Any], model_params_b: Optional[float] = None) -> ModelSpec:
+    if model_params_b:
+        return ModelSpec.from_size(model_params_b)
+    model_path = Path(str(config.get("model_name_or_path", ""))).expanduser()
+    if (model_path / "config.json").exists():
+        return ModelSpec.from_path(model_path)
+    raise FileNotFoundError(f"无法读取模型结构: {model_path}/config.json，请通过 --model-params-b 指定参数量")
+
+
+def _load_dataset_info(config: Dict[str, Any], base_dir: Union[str, Path]) -> Tuple[Path, Dict[str, Any]]:
+    dataset_dir = Path(config.get("dataset_dir", "data"))
+    if not dataset_dir.is_absolute():
+        dataset_dir = Path(base_dir) / dataset_dir
+    with open(dataset_dir / "dataset_info.json", "r", encoding="utf-8") as f:
+        return dataset_dir, json.load(f)
+
+
+def _reservoir_lines(path: Path, k: int, rng: random.Random) -> List[str]:
+    sample: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            if not line.strip():
+                continue
+            if len(sample) < k:
+                sample.append(line)
+            else:
+                j = rng.randint(0, i)
+                if j < k:
+                    sample[j] = line
+    return sample
+
+
+def _read_records(path: Path, k: int, rng: random.Random) -> List[Dict[str, Any]]:
+    """随机抽取最多 k 条记录；jsonl 使用蓄水池抽样，不把整个文件载入内存"""
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    records: List[Dict[str, Any]] = []
+    per_file = max(1, k // max(1, len(files)))
+    for file in files:
+        if file.suffix == ".jsonl":
+            records.extend(json.loads(line) for line in _reservoir_lines(file, per_file, rng))
+        elif file.suffix == ".json":
+            with open(file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            records.extend(rng.sample(data, min(per_file, len(data))))
+        elif file.suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            rows = pq.read_table(file).to_pylist()
+            records.extend(rng.sample(rows, min(per_file, len(rows))))
+    return records
+
+
+def _record_texts(record: Dict[str, Any], entry: Dict[str, Any]) -> List[str]:
+    """按 dataset_info 的列映射取出一条记录中参与分词的文本，每个元素对应一轮"""
+    columns = entry.get("columns", {})
+    if entry.get("formatting") == "sharegpt":
+        tags = entry.get("tags", {})
+        content_tag = tags.get("content_tag", "value")
+        messages = record.get(columns.get("messages", "conversations")) or []
+        texts = [str(m.get(content_tag, "")) for m in messages if isinstance(m, dict)]
+        system = record.get(columns.get("system", "system"))
+        return ([str(system)] if system else []) + texts
+    texts = []
+    for key, default in (("system", "system"), ("prompt", "instruction"), ("query", "input"), ("response", "output")):
+        value = record.get(columns.get(key, default))
+        if value:
+            texts.append(str(value))
+    for turn in record.get(columns.get("history", "history")) or []:
+        texts.extend(str(t) for t in turn)
+    return texts
+
+
+def sample_lengths(
+    config: Dict[str, Any],
+    base_dir: Union[str, Path] = ".",
+    max_records: int = 2000,
+    seed: int = 42,
+    tokenizer: Optional[Any] = None,
+    chars_per_token: float = DEFAULT_CHARS_PER_TOKEN,
+) -> List[int]:
+    """从原始数据集抽样并计算（截断前的）token 长度；tokenizer 为 None 时按字符数估计"""
+    dataset_dir, dataset_info = _load_dataset_info(config, base_dir)
+
+    rng = random.Random(seed)
+    names = split_dataset_names(config.get("dataset"))
+    lengths: List[int] = []
+    for name in names:
+        entry = dataset_info[name]
+        if not entry.get("file_name"):
+            raise ValueError(f"数据集 {name} 不是本地文件，无法统计长度")
+        records = _read_records(dataset_dir / entry["file_name"], max(1, max_records // len(names)), rng)
+        for record in records:
+            texts = _record_texts(record, entry)
+            if tokenizer is not None:
+                n_tokens = sum(len(tokenizer.encode(t, add_special_tokens=False)) for t in texts)
+            else:
+                n_tokens = int(sum(len(t) for t in texts) / chars_per_token)
+            lengths.append(n_tokens + TEMPLATE_TOKENS_PER_TURN * len(texts))
+    return lengths
+
+
+def count_records(config: Dict[str, Any], base_dir: Union[str, Path] = ".") -> int:
+    """统计训练样本数（受 max_samples 限制，与 LLaMA-Factory 一致按每个数据集分别截断）"""
+    dataset_dir, dataset_info = _load_dataset_info(config, base_dir)
+    max_samples = config.get("max_samples")
+    total = 0
+    for name in split_dataset_names(config.get("dataset")):
+        path = dataset_dir / dataset_info[name]["file_name"]
+        files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+        count = 0
+        for file in files:
+            if file.suffix == ".jsonl":
+                with open(file, "rb") as f:
+                    count += sum(1 for line in f if line.strip())
+            elif file.suffix == ".json":
+                with open(file, "r", encoding="utf-8") as f:
+                    count += len(json.load(f))
+            elif file.suffix == ".parquet":
+                import pyarrow.parquet as pq
+
+                count += pq.ParquetFile(file).metadata.num_rows
+        total += min(count, int(max_samples)) if max_samples else count
+    return total
+
+
+def zero_stage(config: Dict[str, Any]) -> int:
+    """从 deepspeed 配置文件读取 ZeRO stage；文件不可读时按文件名猜测"""
+    path = config.get("deepspeed")
+    if not path:
+        return 0
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("zero_optimization", {}).get("stage", 0))
+    except (OSError, ValueError):
+        name = Path(str(path)).name
+        return 3 if "z3" in name or "zero3" in name else 2 if "z2" in name or "zero2" in name else 0
+
+
+def tokenized_lengths(tokenized_path: Union[str, Path], max_records: int = 200000) -> List[int]:
+    """直接从预分词缓存读取 input_ids 长度（精确值，已按 cutoff_len 截断）"""
+    from datasets import load_from_disk
+
+    dataset = load_from_disk(str(tokenized_path))
+    if hasattr(dataset, "keys"):
+        dataset = dataset["train"]
+    n = min(len(dataset), max_records)
+    return [len(ids) for ids in dataset.select(range(n))["input_ids"]]
+
+
+def simulate_padding(
+    lengths: Sequence[int],
+    cutoff_len: int,
+    micro_batch: int,
+    trials: int = 2000,
+    seed: int = 0,
+    pad_to_multiple_of: int = 8,
+) -> Dict[str, float]:
+    """
+    随机组成 micro batch，估计每个 micro batch 的有效 token 数和 padding 后的 token 数
+
+    LLaMA-Factory 的 collator 把每个 batch padding 到批内最长（8 的倍数）
+    """
+    rng = random.Random(seed)
+    clipped = [min(length, cutoff_len) for length in lengths]
+    real = 0.0
+    padded = 0.0
+    longest = 0.0
+    for _ in range(trials):
+        batch = [rng.choice(clipped) for _ in range(micro_batch)]
+        width = int(math.ceil(max(batch) / pad_to_multiple_of) * pad_to_multiple_of)
+        real += sum(batch)
+        padded += width * micro_batch
+        longest += width
+    return {
+        "real_tokens": real / trials,
+        "padded_tokens": padded / trials,
+        "seq_len": longest / trials,
+        "padding_waste": 1 - real / padded if padded else 0.0,
+    }
+
+
+def estimate_memory_gb(
+    spec: ModelSpec,
+    world_size: int,
+    micro_batch: int,
+    seq_len: float,
+    gradient_checkpointing: bool = True,
+    zero_stage: int = 3,
+) -> Dict[str, float]:
+    """
+    每卡显存估计（bf16 混合精度 + AdamW）
+
+    - 参数 2P、梯度 2P、fp32 主权重与 Adam 两个动量 12P 字节，ZeRO-3 下全部按卡数切分
+    - 激活：开启梯度检查点时每层只保存输入隐状态，另加一层重算时的完整激活（按 FlashAttention/SDPA 计，不含 s² 项）
+    - logits：Qwen 词表很大，fp32 logits 与其梯度往往是 OOM 的主因
+    """
+    P = spec.n_params
+    shard = world_size if zero_stage >= 3 else 1
+    params = 2 * P / shard
+    grads = 2 * P / (world_size if zero_stage >= 2 else 1)
+    optimizer = 12 * P / (world_size if zero_stage >= 1 else 1)
+    tokens = micro_batch * seq_len
+    h = spec.hidden_size
+    if gradient_checkpointing:
+        activations = tokens * h * 2 * spec.num_layers + tokens * (34 * h + 4 * spec.intermediate_size)
+    else:
+        activations = tokens * (34 * h + 4 * spec.intermediate_size) * spec.num_layers
+    logits = tokens * spec.vocab_size * (2 + 4 + 4)
+    live_params = 2 * min(P, ZERO3_LIVE_PARAMS) if zero_stage >= 3 else 0
+    parts = {
+        "params": params,
+        "grads": grads,
+        "optimizer": optimizer,
+        "zero3_live_params": live_params,
+        "activations": activations,
+        "logits": logits,
+    }
+    result = {k: v / GB for k, v in parts.items()}
+    result["overhead"] = FIXED_OVERHEAD_GB
+    result["total"] = sum(result.values())
+    return result
+
+
+@dataclass
+class PlanRow:
+    micro_batch: int
+    grad_accum: int
+    global_batch: int
+    seq_len: float
+    padding_waste: float
+    tokens_per_step: float
+    memory_gb: float
+    fits: bool
+    total_steps: int
+    mfu: float
+    hours: float
+
+
+def effective_mfu(mfu: float, micro_step_tokens: float) -> float:
+    """按饱和曲线折算 MFU：每个 micro step 的 token 数较少时 kernel 太小、调度开销占比高，达不到饱和值"""
+    return mfu * micro_step_tokens / (micro_step_tokens + MFU_HALF_TOKENS)
+
+
+def _plan_row(
+    spec: ModelSpec,
+    lengths: Sequence[int],
+    n_samples: int,
+    micro: int,
+    accum: int,
+    world_size: int,
+    cutoff_len: int,
+    epochs: float,
+    gpu_memory_gb: float,
+    gpu_tflops: float,
+    mfu: float,
+    gradient_checkpointing: bool,
+    zero_stage: int,
+) -> PlanRow:
+    padding = simulate_padding(lengths, cutoff_len, micro)
+    memory = estimate_memory_gb(spec, world_size, micro, padding["seq_len"], gradient_checkpointing, zero_stage)
+    global_batch = micro * accum * world_size
+    # 与 HF Trainer 一致：每个 epoch 的更新步数 = 每卡 micro batch 数 // 梯度累积
+    steps_per_epoch = max(1, math.ceil(n_samples / (micro * world_size)) // accum)
+    total_steps = int(math.ceil(steps_per_epoch * epochs))
+    # 计算量按 padding 后的 token 计；梯度检查点多一次前向（8PT 而非 6PT）
+    flops_per_token = (8 if gradient_checkpointing else 6) * spec.n_params
+    step_flops = flops_per_token * padding["padded_tokens"] * accum * world_size
+    row_mfu = effective_mfu(mfu, micro * padding["seq_len"])
+    step_seconds = step_flops / (gpu_tflops * 1e12 * row_mfu * world_size)
+    return PlanRow(
+        micro_batch=micro,
+        grad_accum=accum,
+        global_batch=global_batch,
+        seq_len=round(padding["seq_len"], 1),
+        padding_waste=round(padding["padding_waste"], 4),
+        tokens_per_step=round(padding["real_tokens"] * accum * world_size, 1),
+        memory_gb=round(memory["total"], 2),
+        fits=memory["total"] <= gpu_memory_gb * 0.9,
+        total_steps=total_steps,
+        mfu=round(row_mfu, 4),
+        hours=round(total_steps * step_seconds / 3600, 2),
+    )
+
+
+def plan_training(
+    config: Dict[str, Any],
+    lengths: Sequence[int],
+    spec: ModelSpec,
+    world_size: int,
+    n_samples: int,
+    gpu_memory_gb: float = 80.0,
+    gpu_tflops: float = 312.0,
+    mfu: float = 0.35,
+    micro_batches: Sequence[int] = (1, 2, 4, 8, 16, 32),
+) -> Dict[str, Any]:
+    """
+    评估当前配置，并在保持全局 batch 不变的前提下枚举 micro batch；在显存能放下的配置中推荐预计耗时最短者，
+    耗时相同时选显存余量最大的（padding 浪费已体现在耗时估计中）
+
+    mfu 为 micro step 足够大时的饱和 MFU，各候选按每个 micro step 的 token 数折算（见 effective_mfu），
+    因此耗时同时反映 micro batch 增大带来的 padding 浪费和 GPU 利用率提升
+    """
+    if not lengths:
+        raise ValueError("没有可用的长度样本")
+    cutoff_len = int(config.get("cutoff_len", 2048))
+    epochs = float(config.get("num_train_epochs", 3.0))
+    micro = int(config.get("per_device_train_batch_size", 1))
+    accum = int(config.get("gradient_accumulation_steps", 1))
+    gradient_checkpointing = not config.get("disable_gradient_checkpointing", False)
+    stage = zero_stage(config)
+    common = dict(
+        world_size=world_size,
+        cutoff_len=cutoff_len,
+        epochs=epochs,
+        gpu_memory_gb=gpu_memory_gb,
+        gpu_tflops=gpu_tflops,
+        mfu=mfu,
+        gradient_checkpointing=gradient_checkpointing,
+        zero_stage=stage,
+    )
+
+    current = _plan_row(spec, lengths, n_samples, micro, accum, **common)
+    target_global = micro * accum * world_size
+    candidates: List[PlanRow] = []
+    for m in micro_batches:
+        if target_global % (m * world_size):
+            continue
+        candidates.append(_plan_row(spec, lengths, n_samples, m, target_global // (m * world_size), **common))
+    fitting = [row for row in candidates if row.fits]
+    recommended = min(fitting, key=lambda row: (row.hours, row.memory_gb)) if fitting else None
+
+    sorted_lengths = sorted(lengths)
+    truncated = sum(1 for length in lengths if length > cutoff_len) / len(lengths)
+    return {
+        "model_params_b": round(spec.n_params / 1e9, 2),
+        "world_size": world_size,
+        "zero_stage": stage,
+        "gradient_checkpointing": gradient_checkpointing,
+        "n_samples": n_samples,
+        "cutoff_len": cutoff_len,
+        "length_stats": {
+            "sampled": len(lengths),
+            "mean": round(sum(lengths) / len(lengths), 1),
+            "p50": sorted_lengths[len(lengths) // 2],
+            "p90": sorted_lengths[int(len(lengths) * 0.9)],
+            "p99": sorted_lengths[min(len(lengths) - 1, int(len(lengths) * 0.99))],
+            "max": sorted_lengths[-1],
+            "truncated_ratio": round(truncated, 4),
+        },
+        "memory_breakdown_gb": {
+            k: round(v, 2)
+            for k, v in estimate_memory_gb(
+                spec, world_size, micro, current.seq_len, gradient_checkpointing, stage
+            ).items()
+        },
+        "current": asdict(current),
+        "candidates": [asdict(row) for row in candidates],
+        "recommended": asdict(recommended) if recommended else None,
+        "recommend_criterion": "min_hours_then_max_headroom",
+        "gpu_memory_gb": gpu_memory_gb,
+        "gpu_tflops": gpu_tflops,
+        "mfu": mfu,
+    }
+
+
+def format_plan_markdown(plan: Dict[str, Any]) -> str:
+    stats = plan["length_stats"]
+    lines = [
+        "## 训练规划",
+        "",
+        f"- 模型参数量: {plan['model_params_b']}B，GPU数: {plan['world_size']}，ZeRO-{plan['zero_stage']}，"
+        f"梯度检查点: {'开' if plan['gradient_checkpointing'] else '关'}",
+        f"- 样本数: {plan['n_samples']}，cutoff_len: {plan['cutoff_len']}",
+        f"- token长度（抽样 {stats['sampled']} 条）: mean={stats['mean']} p50={stats['p50']} p90={stats['p90']} "
+        f"p99={stats['p99']} max={stats['max']}，超过cutoff被截断: {stats['truncated_ratio']:.1%}",
+        "",
+        "### 当前配置每卡显存估计 (GB)",
+        "",
+        "| " + " | ".join(plan["memory_breakdown_gb"]) + " |",
+        "|" + "---|" * len(plan["memory_breakdown_gb"]),
+        "| " + " | ".join(f"{v:.1f}" for v in plan["memory_breakdown_gb"].values()) + " |",
+        "",
+        f"### 候选配置（全局batch不变，GPU显存 {plan['gpu_memory_gb']}GB，峰值 {plan['gpu_tflops']} TFLOPS，饱和MFU {plan['mfu']:.0%}）",
+        "",
+        "| micro batch | 梯度累积 | 全局batch | 平均序列长度 | padding浪费 | 有效token/步 | 显存(GB) | 可行 | 总步数 | MFU | 预计耗时(h) |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    current = plan["current"]
+    for row in plan["candidates"]:
+        marker = " (当前)" if row["micro_batch"] == current["micro_batch"] else ""
+        lines.append(
+            f"| {row['micro_batch']}{marker} | {row['grad_accum']} | {row['global_batch']} | {row['seq_len']:.0f} | "
+            f"{row['padding_waste']:.1%} | {row['tokens_per_step']:.0f} | {row['memory_gb']:.1f} | "
+            f"{'✓' if row['fits'] else '✗ OOM'} | {row['total_steps']} | {row['mfu']:.0%} | {row['hours']:.2f} |"
+        )
+    lines.append("")
+    recommended = plan["recommended"]
+    if recommended is None:
+        lines.append("⚠️ 所有候选配置都超出显存，建议降低 cutoff_len 或开启 CPU offload")
+    else:
+        lines.append(
+            f"**推荐（可行配置中预计耗时最短，相同时取显存余量最大）:** "
+            f"per_device_train_batch_size={recommended['micro_batch']}, "
+            f"gradient_accumulation_steps={recommended['grad_accum']}"
+        )
+    if not current["fits"]:
+        lines.append(f"\n⚠️ 当前配置 (micro batch={current['micro_batch']}) 预计显存 {current['memory_gb']:.1f}GB，可能 OOM")
+    return "\n".join(lines) + "\n"
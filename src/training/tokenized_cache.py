@@ -0,0 +1,198 @@
+"""
+LLaMA-Factory 预分词缓存
+按 (数据集文件哈希, tokenizer, template, cutoff_len 等预处理参数) 计算缓存键，
+分词结果以 Arrow 格式保存在 {cache_root}/{key}/，通过 LLaMA-Factory 的 tokenized_path 加载；
+任一输入变化时键随之变化，只重建变化后的缓存
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 影响分词结果的训练配置项
+PREPROCESS_KEYS = (
+    "stage",
+    "template",
+    "cutoff_len",
+    "max_samples",
+    "train_on_prompt",
+    "mask_history",
+    "packing",
+    "neat_packing",
+    "tool_format",
+    "enable_thinking",
+    "default_system",
+    "val_size",
+    "eval_dataset",
+    "mix_strategy",
+    "interleave_probs",
+    "seed",
+)
+
+TOKENIZER_FILES = (
+    "tokenizer.json",
+    "tokenizer_config.json",
+    "vocab.json",
+    "merges.txt",
+    "special_tokens_map.json",
+    "added_tokens.json",
+    "tokenizer.model",
+)
+
+COMPLETE_MARKER = "lightsft_cache.json"
+
+
+class FileHashMemo:
+    """按 (大小, mtime) 记住文件内容哈希，大数据文件未变化时无需重新读取"""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.entries: Dict[str, List[Any]] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+        self.dirty = False
+
+    def file_hash(self, file_path: Path) -> str:
+        stat = file_path.stat()
+        key = str(file_path.resolve())
+        cached = self.entries.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.md5()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.entries[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        self.dirty = True
+        return digest.hexdigest()
+
+    def path_hash(self, path: Path) -> str:
+        """文件直接求哈希，目录按相对路径排序后逐个文件求哈希"""
+        if path.is_file():
+            return self.file_hash(path)
+        digest = hashlib.md5()
+        for child in sorted(p for p in path.rglob("*") if p.is_file()):
+            digest.update(str(child.relative_to(path)).encode("utf-8"))
+            digest.update(self.file_hash(child).encode("utf-8"))
+        return digest.hexdigest()
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+
+def split_dataset_names(value: Any) -> List[str]:
+    """dataset 字段支持逗号分隔的字符串或列表"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [name.strip() for name in str(value).split(",") if name.strip()]
+
+
+def dataset_fingerprint(config: Dict[str, Any], memo: FileHashMemo, base_dir: Path) -> Dict[str, Any]:
+    """dataset_info.json 中对应条目 + 本地数据文件内容哈希；Hub数据集只能记录条目本身"""
+    dataset_dir = Path(config.get("dataset_dir", "data"))
+    if not dataset_dir.is_absolute():
+        dataset_dir = base_dir / dataset_dir
+    info_path = dataset_dir / "dataset_info.json"
+    if not info_path.exists():
+        raise FileNotFoundError(f"dataset_info.json 不存在: {info_path}")
+    with open(info_path, "r", encoding="utf-8") as f:
+        dataset_info = json.load(f)
+
+    fingerprint: Dict[str, Any] = {}
+    for name in split_dataset_names(config.get("dataset")) + split_dataset_names(config.get("eval_dataset")):
+        if name not in dataset_info:
+            raise KeyError(f"数据集 {name} 未在 {info_path} 中注册")
+        entry = dataset_info[name]
+        item: Dict[str, Any] = {"entry": entry}
+        file_name = entry.get("file_name")
+        if file_name and not any(k in entry for k in ("hf_hub_url", "ms_hub_url", "om_hub_url", "script_url")):
+            data_path = dataset_dir / file_name
+            if not data_path.exists():
+                raise FileNotFoundError(f"数据集 {name} 的文件不存在: {data_path}")
+            item["content"] = memo.path_hash(data_path)
+        fingerprint[name] = item
+    return fingerprint
+
+
+def tokenizer_fingerprint(config: Dict[str, Any], memo: FileHashMemo) -> Dict[str, Any]:
+    """本地模型目录按 tokenizer 文件内容求哈希，否则只记录模型名"""
+    name = str(config.get("tokenizer_name_or_path") or config.get("model_name_or_path"))
+    path = Path(name).expanduser()
+    files: Dict[str, str] = {}
+    if path.is_dir():
+        for file_name in TOKENIZER_FILES:
+            if (path / file_name).exists():
+                files[file_name] = memo.file_hash(path / file_name)
+    return {"name": name, "files": files}
+
+
+def _llamafactory_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("llamafactory")
+    except Exception:
+        return "unknown"
+
+
+def tokenized_cache_key(
+    config: Dict[str, Any],
+    memo: FileHashMemo,
+    base_dir: Union[str, Path] = ".",
+) -> Dict[str, Any]:
+    """返回 {"key": ..., "inputs": ...}，inputs 写入缓存目录便于排查缓存为何失效"""
+    inputs = {
+        "datasets": dataset_fingerprint(config, memo, Path(base_dir)),
+        "tokenizer": tokenizer_fingerprint(config, memo),
+        "preprocess": {k: config.get(k) for k in PREPROCESS_KEYS if config.get(k) is not None},
+        "llamafactory": _llamafactory_version(),
+    }
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return {"key": hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16], "inputs": inputs}
+
+
+def find_tokenized_cache(cache_root: Union[str, Path], key: str) -> Optional[Path]:
+    """缓存完整（分词完成且写入了标记文件）时返回缓存目录"""
+    path = Path(cache_root) / key
+    if (path / COMPLETE_MARKER).exists():
+        return path
+    return None
+
+
+def finalize_tokenized_cache(
+    tmp_dir: Union[str, Path],
+    cache_root: Union[str, Path],
+    key_info: Dict[str, Any],
+) -> Path:
+    """LLaMA-Factory 写完临时目录后写入标记文件并原子重命名为最终缓存目录"""
+    tmp_dir = Path(tmp_dir)
+    if not tmp_dir.is_dir() or not any(tmp_dir.iterdir()):
+        raise RuntimeError(f"预分词没有产生输出: {tmp_dir}")
+    with open(tmp_dir / COMPLETE_MARKER, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), **key_info}, f, ensure_ascii=False, indent=2, default=str)
+    final = Path(cache_root) / key_info["key"]
+    if (final / COMPLETE_MARKER).exists():
+        # 另一个进程已完成同一缓存，保留先完成的那份
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return final
+    if final.exists():
+        shutil.rmtree(final)
+    os.replace(tmp_dir, final)
+    return final
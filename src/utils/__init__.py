@@ -0,0 +1,6 @@
+"""通用工具模块"""
+
+from .cache import SqliteLRUCache
+from .profiling import StageMetrics, StageTimer
+
+__all__ = ["SqliteLRUCache", "StageMetrics", "StageTimer"]
@@ -0,0 +1,106 @@
+"""
+磁盘键值缓存
+基于 sqlite3 的持久化缓存，按总大小上限做 LRU 淘汰，多进程/多线程安全
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+
+class SqliteLRUCache:
+    """
+    持久化 LRU 缓存，值为可 JSON 序列化的对象
+
+    超过 max_bytes 时按最近访问时间淘汰到上限的 90%
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 1 << 30):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, atime REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_atime ON cache(atime)")
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """批量查询，命中的条目同时刷新访问时间"""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, Any] = {}
+        with self._lock:
+            # sqlite 默认最多 999 个绑定参数
+            for start in range(0, len(keys), 900):
+                chunk = keys[start:start + 900]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE cache SET atime=? WHERE key=?", [(now, k) for k in found])
+                self._conn.commit()
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many({key: value})
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache(key, value, size, atime) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY atime ASC"):
+            doomed.append((key,))
+            freed += size
+            if total - freed <= target:
+                break
+        self._conn.executemany("DELETE FROM cache WHERE key=?", doomed)
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0])
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
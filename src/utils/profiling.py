@@ -0,0 +1,177 @@
+"""
+阶段计时与资源统计工具
+记录每个阶段的墙钟时间、CPU时间、峰值内存以及吞吐量
+"""
+
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+def _maxrss_mb(who: int) -> float:
+    """读取峰值RSS (MB)，Linux上ru_maxrss单位为KB，macOS上为字节"""
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        return maxrss / 1024 / 1024
+    return maxrss / 1024
+
+
+def reset_peak_rss() -> bool:
+    """重置进程的峰值 RSS（Linux 的 VmHWM），之后读到的峰值只反映重置后的阶段；不支持时返回 False"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_since_reset_mb() -> Optional[float]:
+    """读取 VmHWM (MB)，配合 reset_peak_rss 统计单个阶段的峰值内存；非 Linux 返回 None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _cpu_seconds(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+@dataclass
+class StageMetrics:
+    """单个阶段的统计结果"""
+
+    name: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    child_cpu_time: float = 0.0
+    peak_rss_mb: float = 0.0
+    child_peak_rss_mb: float = 0.0
+    counts: Dict[str, float] = field(default_factory=dict)
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def add_count(self, unit: str, value: float) -> None:
+        """累加计数（如 tokens、samples、tasks），用于计算吞吐量"""
+        self.counts[unit] = self.counts.get(unit, 0) + value
+
+    def throughput(self) -> Dict[str, float]:
+        """按墙钟时间计算每秒吞吐量"""
+        if self.wall_time <= 0:
+            return {}
+        return {f"{unit}_per_sec": value / self.wall_time for unit, value in self.counts.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "wall_time": round(self.wall_time, 4),
+            "cpu_time": round(self.cpu_time, 4),
+            "child_cpu_time": round(self.child_cpu_time, 4),
+            "peak_rss_mb": round(self.peak_rss_mb, 2),
+            "child_peak_rss_mb": round(self.child_peak_rss_mb, 2),
+            "counts": self.counts,
+            "throughput": {k: round(v, 3) for k, v in self.throughput().items()},
+            "extra": self.extra,
+        }
+
+
+class StageTimer:
+    """
+    流水线阶段计时器
+
+    用法:
+        timer = StageTimer(backend="vllm", tp=4)
+        with timer.stage("generation") as m:
+            ...
+            m.add_count("tokens", n_tokens)
+        timer.write_json("metrics.json")
+    """
+
+    def __init__(self, **metadata: Any):
+        self.metadata: Dict[str, Any] = dict(metadata)
+        self.stages: List[StageMetrics] = []
+        self.started_at = datetime.now()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """统计一个阶段；阶段内抛出的异常会照常向外传播，统计结果仍被保留"""
+        metrics = StageMetrics(name=name)
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_seconds(resource.RUSAGE_SELF)
+        child_cpu_start = _cpu_seconds(resource.RUSAGE_CHILDREN)
+        try:
+            yield metrics
+        except BaseException as e:
+            metrics.extra["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            metrics.wall_time = time.perf_counter() - wall_start
+            metrics.cpu_time = _cpu_seconds(resource.RUSAGE_SELF) - cpu_start
+            metrics.child_cpu_time = _cpu_seconds(resource.RUSAGE_CHILDREN) - child_cpu_start
+            # 峰值RSS是进程生命周期内的最大值，在阶段结束时采样
+            metrics.peak_rss_mb = _maxrss_mb(resource.RUSAGE_SELF)
+            metrics.child_peak_rss_mb = _maxrss_mb(resource.RUSAGE_CHILDREN)
+            self.stages.append(metrics)
+
+    def get(self, name: str) -> Optional[StageMetrics]:
+        for metrics in self.stages:
+            if metrics.name == name:
+                return metrics
+        return None
+
+    @property
+    def total_wall_time(self) -> float:
+        return sum(m.wall_time for m in self.stages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "metadata": self.metadata,
+            "total_wall_time": round(self.total_wall_time, 4),
+            "stages": [m.to_dict() for m in self.stages],
+        }
+
+    def write_json(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    def to_markdown(self) -> str:
+        """生成Markdown表格，用于写入评测报告"""
+        lines = [
+            "| 阶段 | 墙钟时间(s) | CPU时间(s) | 子进程CPU(s) | 峰值RSS(MB) | 子进程峰值RSS(MB) | 吞吐量 |",
+            "|------|-------------|------------|--------------|-------------|-------------------|--------|",
+        ]
+        total = self.total_wall_time or 1.0
+        for m in self.stages:
+            rates = ", ".join(f"{k}={v:.1f}" for k, v in m.throughput().items()) or "-"
+            lines.append(
+                f"| {m.name} | {m.wall_time:.2f} ({m.wall_time / total:.0%}) | {m.cpu_time:.2f} | "
+                f"{m.child_cpu_time:.2f} | {m.peak_rss_mb:.0f} | {m.child_peak_rss_mb:.0f} | {rates} |"
+            )
+        lines.append(f"\n**总耗时:** {self.total_wall_time:.2f}s")
+        return "\n".join(lines) + "\n"
+
+    def print_summary(self) -> None:
+        print("\n=== 阶段耗时统计 ===")
+        for m in self.stages:
+            rates = " ".join(f"{k}={v:.1f}" for k, v in m.throughput().items())
+            print(f"  {m.name:<14} wall={m.wall_time:8.2f}s cpu={m.cpu_time:8.2f}s "
+                  f"child_cpu={m.child_cpu_time:8.2f}s rss={m.peak_rss_mb:.0f}MB {rates}")
+        print(f"  {'total':<14} wall={self.total_wall_time:8.2f}s")
@@ -0,0 +1,32 @@
+"""
+模型输出清洗的回归测试
+"""
+
+from src.evaluation.sanitize import MISSING_ENTRY_POINT, OK, sanitize
+
+
+def test_chat_completion_closing_fence_keeps_code_before_it():
+    """chat 模式的提示以 ```python\\n 结尾，补全中第一个 ``` 是闭合栅栏，之后的说明文字不是代码"""
+    text = "def add(a, b):\n    return a + b\n```\n\nThis function adds two numbers.\n"
+    result = sanitize(text, "add")
+    assert result.status == OK
+    assert result.code.strip() == "def add(a, b):\n    return a + b"
+
+
+def test_prose_before_bare_opening_fence():
+    text = "Here is the solution:\n```\ndef add(a, b):\n    return a + b\n```\n"
+    result = sanitize(text, "add")
+    assert result.status == OK
+    assert "def add" in result.code
+
+
+def test_fenced_block_drops_example_calls():
+    text = "Sure.\n```python\ndef add(a, b):\n    return a + b\n\nprint(add(1, 2))\n```\n"
+    result = sanitize(text, "add")
+    assert result.status == OK
+    assert "print" not in result.code
+
+
+def test_missing_entry_point():
+    result = sanitize("```python\ndef sub(a, b):\n    return a - b\n```", "add")
+    assert result.status == MISSING_ENTRY_POINT